@@ -0,0 +1,155 @@
+import json
+
+from aws_cdk import aws_apigateway as _apigw
+from aws_cdk import aws_dynamodb as _dynamodb
+from aws_cdk import aws_iam as _iam
+from aws_cdk import aws_lambda as _lambda
+from aws_cdk import aws_logs as _logs
+from aws_cdk import aws_secretsmanager as _secretsmanager
+
+from aws_cdk import core
+
+from api_performance_with_caching.stacks.back_end.lambda_src.cache_invalidation import GlobalArgs as InvalidationArgs
+
+
+class GlobalArgs:
+    """
+    Helper to define global statics
+    """
+
+    OWNER = "MystiqueAutomation"
+    ENVIRONMENT = "production"
+    REPO_NAME = "api-performance-with-caching"
+    SOURCE_INFO = f"https://github.com/miztiik/{REPO_NAME}"
+    VERSION = "2020_08_20"
+    MIZTIIK_SUPPORT_EMAIL = ["mystique@example.com", ]
+
+
+class CacheInvalidatorStack(core.Construct):
+    """
+    Invalidates the cached movies on every change to the table: a DynamoDB Streams consumer
+    records invalidations, polled by the greeter containers, and refreshes the stage cache entry
+    """
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        stack_log_level: str,
+        ddb_table: _dynamodb.Table,
+        greeter_fn: _lambda.Function,
+        rest_api: _apigw.RestApi,
+        stage_name: str,
+        cached_resource_path: str,
+        **kwargs
+    ) -> None:
+        super().__init__(scope, id)
+
+        # Invalidations expire long after every greeter container has polled them
+        self.invalidations_table = _dynamodb.Table(
+            self,
+            "cacheInvalidations",
+            partition_key=_dynamodb.Attribute(
+                name="pk",
+                type=_dynamodb.AttributeType.STRING
+            ),
+            sort_key=_dynamodb.Attribute(
+                name="sk",
+                type=_dynamodb.AttributeType.STRING
+            ),
+            billing_mode=_dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=core.RemovalPolicy.DESTROY
+        )
+        # Read to poll, write to record the versions of the movies it writes
+        self.invalidations_table.grant_read_write_data(greeter_fn)
+        greeter_fn.add_environment(
+            "INVALIDATIONS_TABLE_NAME", self.invalidations_table.table_name)
+
+        # The `Cache-Control` header reaches the greeter from any caller, only the invalidator
+        # knows this token, which has the greeter drop its own cache entries as well
+        cache_refresh_token = _secretsmanager.Secret(
+            self,
+            "cacheRefreshToken",
+            description="Shared by the cache invalidator and the greeter to refresh cached movies",
+            generate_secret_string=_secretsmanager.SecretStringGenerator(
+                exclude_punctuation=True,
+                password_length=32
+            ),
+            removal_policy=core.RemovalPolicy.DESTROY
+        )
+        # Read by the functions during init, the token itself is never in their environment
+        greeter_fn.add_environment(
+            "CACHE_REFRESH_TOKEN_SECRET_ARN", cache_refresh_token.secret_arn)
+        cache_refresh_token.grant_read(greeter_fn)
+
+        invalidator_fn = _lambda.Function(
+            self,
+            "cacheInvalidatorFn",
+            runtime=_lambda.Runtime.PYTHON_3_7,
+            # Shares the invalidation record format with the greeter
+            handler="cache_invalidator.lambda_handler",
+            code=_lambda.Code.from_asset(
+                "api_performance_with_caching/stacks/back_end/lambda_src"),
+            timeout=core.Duration.seconds(60),
+            environment={
+                "LOG_LEVEL": f"{stack_log_level}",
+                "DDB_TABLE_NAME": ddb_table.table_name,
+                "INVALIDATIONS_TABLE_NAME": self.invalidations_table.table_name,
+                "API_CACHE_INVALIDATION_URL": rest_api.url_for_path(cached_resource_path),
+                "CACHE_REFRESH_TOKEN_SECRET_ARN": cache_refresh_token.secret_arn
+            },
+            description="Invalidates the cached movies on every change to the table"
+        )
+
+        # Create Custom Loggroup
+        invalidator_fn_lg = _logs.LogGroup(
+            self,
+            "cacheInvalidatorFnLoggroup",
+            log_group_name=f"/aws/lambda/{invalidator_fn.function_name}",
+            retention=_logs.RetentionDays.ONE_WEEK,
+            removal_policy=core.RemovalPolicy.DESTROY
+        )
+
+        self.invalidations_table.grant_write_data(invalidator_fn)
+        cache_refresh_token.grant_read(invalidator_fn)
+        ddb_table.grant_stream_read(invalidator_fn)
+
+        # Only signed requests from a caller allowed to invalidate may bypass the stage cache
+        role_stmt1 = _iam.PolicyStatement(
+            effect=_iam.Effect.ALLOW,
+            resources=[
+                rest_api.arn_for_execute_api(
+                    method="GET", path=f"{cached_resource_path}/*", stage=stage_name)
+            ],
+            actions=[
+                "execute-api:InvalidateCache"
+            ]
+        )
+        role_stmt1.sid = "AllowLambdaToInvalidateApiCache"
+        invalidator_fn.add_to_role_policy(role_stmt1)
+
+        stream_mapping = _lambda.EventSourceMapping(
+            self,
+            "cacheInvalidatorStreamMapping",
+            target=invalidator_fn,
+            event_source_arn=ddb_table.table_stream_arn,
+            starting_position=_lambda.StartingPosition.LATEST,
+            batch_size=100,
+            max_batching_window=core.Duration.seconds(0),
+            # Retried from the first movie that failed to refresh, not the whole batch
+            report_batch_item_failures=True,
+            bisect_batch_on_error=True,
+            retry_attempts=5
+        )
+        # Only the movies written by the greeter, the data loader's bulk writes never invoke the
+        # invalidator. The filters are not in this CDK version's EventSourceMapping props yet.
+        stream_mapping.node.default_child.add_property_override("FilterCriteria", {
+            "Filters": [{
+                "Pattern": json.dumps({
+                    "dynamodb": {"NewImage": {InvalidationArgs.WRITER_ATTRIBUTE: {"S": [InvalidationArgs.WRITER]}}}
+                })
+            }]
+        })
+
+        self.invalidator_fn = invalidator_fn
@@ -0,0 +1,129 @@
+from aws_cdk import aws_apigateway as _apigw
+from aws_cdk import aws_dynamodb as _dynamodb
+from aws_cdk import aws_events as _events
+from aws_cdk import aws_events_targets as _targets
+from aws_cdk import aws_iam as _iam
+from aws_cdk import aws_lambda as _lambda
+from aws_cdk import aws_logs as _logs
+
+from aws_cdk import core
+
+
+class GlobalArgs:
+    """
+    Helper to define global statics
+    """
+
+    OWNER = "MystiqueAutomation"
+    ENVIRONMENT = "production"
+    REPO_NAME = "api-performance-with-caching"
+    SOURCE_INFO = f"https://github.com/miztiik/{REPO_NAME}"
+    VERSION = "2020_08_20"
+    MIZTIIK_SUPPORT_EMAIL = ["mystique@example.com", ]
+
+
+class CachingProfileSwitcherStack(core.Construct):
+    """
+    Switches the api stage cache, lambda reserved concurrency and table capacity between
+    caching profiles on a schedule, one EventBridge rule per profile
+    """
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        rest_api: _apigw.RestApi,
+        stage_name: str,
+        greeter_fn: _lambda.Function,
+        ddb_table: _dynamodb.Table,
+        profiles: dict,
+        schedule: dict,
+        uncached_methods: list,
+        **kwargs
+    ) -> None:
+        super().__init__(scope, id)
+
+        switcher_fn = _lambda.Function(
+            self,
+            "cachingProfileSwitcherFn",
+            runtime=_lambda.Runtime.PYTHON_3_7,
+            handler="index.lambda_handler",
+            code=_lambda.Code.from_asset(
+                "api_performance_with_caching/stacks/back_end/caching_profile_switcher/lambda_src"),
+            timeout=core.Duration.seconds(30),
+            reserved_concurrent_executions=1,
+            environment={
+                "LOG_LEVEL": "INFO",
+                "APP_ENV": "Production"
+            },
+            description="Switch the cached api between caching profiles"
+        )
+
+        # Create Custom Loggroup
+        switcher_fn_lg = _logs.LogGroup(
+            self,
+            "cachingProfileSwitcherFnLoggroup",
+            log_group_name=f"/aws/lambda/{switcher_fn.function_name}",
+            retention=_logs.RetentionDays.ONE_WEEK,
+            removal_policy=core.RemovalPolicy.DESTROY
+        )
+
+        role_stmt1 = _iam.PolicyStatement(
+            effect=_iam.Effect.ALLOW,
+            resources=[
+                f"arn:{core.Aws.PARTITION}:apigateway:{core.Aws.REGION}::/restapis/{rest_api.rest_api_id}/stages/{stage_name}"
+            ],
+            actions=[
+                "apigateway:PATCH"
+            ]
+        )
+        role_stmt1.sid = "AllowLambdaToUpdateStage"
+        switcher_fn.add_to_role_policy(role_stmt1)
+
+        role_stmt2 = _iam.PolicyStatement(
+            effect=_iam.Effect.ALLOW,
+            resources=[greeter_fn.function_arn],
+            actions=[
+                "lambda:PutFunctionConcurrency"
+            ]
+        )
+        role_stmt2.sid = "AllowLambdaToSetConcurrency"
+        switcher_fn.add_to_role_policy(role_stmt2)
+
+        role_stmt3 = _iam.PolicyStatement(
+            effect=_iam.Effect.ALLOW,
+            resources=[ddb_table.table_arn],
+            actions=[
+                "dynamodb:DescribeTable",
+                "dynamodb:UpdateTable"
+            ]
+        )
+        role_stmt3.sid = "AllowLambdaToUpdateTableCapacity"
+        switcher_fn.add_to_role_policy(role_stmt3)
+
+        for profile_name, schedule_expression in schedule.items():
+            if profile_name not in profiles:
+                raise ValueError(
+                    f"Caching profile schedule refers to unknown profile: {profile_name}")
+            _events.Rule(
+                self,
+                f"switchTo-{profile_name}",
+                description=f"Switch the cached api to the {profile_name} caching profile",
+                schedule=_events.Schedule.expression(schedule_expression),
+                targets=[
+                    _targets.LambdaFunction(
+                        switcher_fn,
+                        event=_events.RuleTargetInput.from_object({
+                            "profile_name": profile_name,
+                            "profile": profiles[profile_name],
+                            "rest_api_id": rest_api.rest_api_id,
+                            "stage_name": stage_name,
+                            "uncached_methods": uncached_methods,
+                            "function_name": greeter_fn.function_name,
+                            "table_name": ddb_table.table_name
+                        })
+                    )
+                ]
+            )
+
+        self.switcher_fn = switcher_fn
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging as log
+import os
+
+import boto3
+from botocore.exceptions import ClientError
+
+log.getLogger().setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+_apigw_client = boto3.client("apigateway")
+_lambda_client = boto3.client("lambda")
+_ddb_client = boto3.client("dynamodb")
+
+
+def _escape(method_path):
+    """ `/cached/movie/{id}/GET` to the stage patch path `/~1cached~1movie~1{id}/GET` """
+    resource, _, http_method = method_path.rpartition("/")
+    return f"/{resource.replace('~', '~0').replace('/', '~1')}/{http_method}"
+
+
+def _stage_patch_ops(profile, uncached_methods):
+    enabled = profile["cache_cluster_enabled"]
+    ops = [
+        {"op": "replace", "path": "/cacheClusterEnabled", "value": str(enabled).lower()},
+    ]
+    if enabled:
+        ops += [
+            {"op": "replace", "path": "/cacheClusterSize", "value": profile["cache_cluster_size"]},
+            {"op": "replace", "path": "/*/*/caching/enabled", "value": "true"},
+            {"op": "replace", "path": "/*/*/caching/ttlInSeconds",
+             "value": str(profile["cache_ttl_secs"])},
+        ]
+        for method_path, ttl in profile.get("method_cache_ttl_secs", {}).items():
+            ops.append({"op": "replace", "path": f"{_escape(method_path)}/caching/ttlInSeconds",
+                        "value": str(ttl)})
+        for method_path in uncached_methods:
+            ops.append({"op": "replace", "path": f"{_escape(method_path)}/caching/enabled",
+                        "value": "false"})
+    else:
+        ops.append({"op": "replace", "path": "/*/*/caching/enabled", "value": "false"})
+    return ops
+
+
+def _update_table_capacity(table_name, read_capacity, write_capacity):
+    current = _ddb_client.describe_table(TableName=table_name)[
+        "Table"]["ProvisionedThroughput"]
+    if (current["ReadCapacityUnits"], current["WriteCapacityUnits"]) == (read_capacity, write_capacity):
+        return "unchanged"
+    _ddb_client.update_table(
+        TableName=table_name,
+        ProvisionedThroughput={
+            "ReadCapacityUnits": read_capacity,
+            "WriteCapacityUnits": write_capacity
+        }
+    )
+    return "updated"
+
+
+def lambda_handler(event, context):
+    log.info(f"event: {json.dumps(event)}")
+    profile = event["profile"]
+    res = {"profile_name": event["profile_name"]}
+
+    # Each part is applied independently, a failure in one does not hold back the others
+    try:
+        _apigw_client.update_stage(
+            restApiId=event["rest_api_id"],
+            stageName=event["stage_name"],
+            patchOperations=_stage_patch_ops(
+                profile, event.get("uncached_methods", []))
+        )
+        res["stage"] = "updated"
+    except ClientError as e:
+        log.error(f"stage_update_failed: {str(e)}")
+        res["stage"] = str(e)
+
+    try:
+        _lambda_client.put_function_concurrency(
+            FunctionName=event["function_name"],
+            ReservedConcurrentExecutions=profile["reserved_concurrency"]
+        )
+        res["reserved_concurrency"] = profile["reserved_concurrency"]
+    except ClientError as e:
+        log.error(f"concurrency_update_failed: {str(e)}")
+        res["reserved_concurrency"] = str(e)
+
+    try:
+        res["table_capacity"] = _update_table_capacity(
+            event["table_name"], profile["ddb_read_capacity"], profile["ddb_write_capacity"])
+    except ClientError as e:
+        log.error(f"table_update_failed: {str(e)}")
+        res["table_capacity"] = str(e)
+
+    log.info(f"profile_switch: {json.dumps(res)}")
+    return res
@@ -0,0 +1,100 @@
+import copy
+import json
+
+
+class GlobalArgs:
+    """
+    Helper to define global statics
+    """
+
+    OWNER = "MystiqueAutomation"
+    PROFILE_CONTEXT_KEY = "caching_profile"
+    PROFILES_CONTEXT_KEY = "caching_profiles"
+    SCHEDULE_CONTEXT_KEY = "caching_profile_schedule"
+    DEFAULT_PROFILE = "default"
+
+
+# `default` is what the cached api has always deployed with. `event` is sized for the
+# traffic of a live event, `idle` turns the paid cache cluster off between events.
+DEFAULT_CACHING_PROFILES = {
+    "default": {
+        "cache_cluster_enabled": True,
+        "cache_cluster_size": "0.5",
+        "cache_ttl_secs": 30,
+        "method_cache_ttl_secs": {
+            "/cached/movie/{id}/GET": 30
+        },
+        "reserved_concurrency": 50,
+        "ddb_read_capacity": 20,
+        "ddb_write_capacity": 20
+    },
+    "event": {
+        "cache_cluster_enabled": True,
+        "cache_cluster_size": "1.6",
+        "cache_ttl_secs": 30,
+        # Writes invalidate the cached movie, so its TTL only bounds memory, not staleness
+        "method_cache_ttl_secs": {
+            "/cached/movie/{id}/GET": 300
+        },
+        "reserved_concurrency": 100,
+        "ddb_read_capacity": 50,
+        "ddb_write_capacity": 20
+    },
+    "idle": {
+        "cache_cluster_enabled": False,
+        "cache_cluster_size": "0.5",
+        "cache_ttl_secs": 300,
+        "method_cache_ttl_secs": {},
+        "reserved_concurrency": 10,
+        "ddb_read_capacity": 5,
+        "ddb_write_capacity": 5
+    }
+}
+
+
+def _context(scope, key):
+    """ Context from cdk.json is already parsed, `-c key=<json>` on the command line is a string """
+    val = scope.node.try_get_context(key)
+    return json.loads(val) if isinstance(val, str) else val
+
+
+def get_caching_profiles(scope):
+    """
+    Returns all the caching profiles, with any `caching_profiles` from the CDK context
+    merged over the defaults, profile by profile
+    """
+    profiles = copy.deepcopy(DEFAULT_CACHING_PROFILES)
+    for name, overrides in (_context(scope, GlobalArgs.PROFILES_CONTEXT_KEY) or {}).items():
+        profiles[name] = dict(profiles.get(name, profiles[GlobalArgs.DEFAULT_PROFILE]), **overrides)
+    return profiles
+
+
+def get_caching_profile(scope):
+    """ Returns `(name, profile)` for the profile selected with `-c caching_profile=<name>` """
+    name = scope.node.try_get_context(
+        GlobalArgs.PROFILE_CONTEXT_KEY) or GlobalArgs.DEFAULT_PROFILE
+    profiles = get_caching_profiles(scope)
+    if name not in profiles:
+        raise ValueError(
+            f"Unknown caching profile: {name}, choose one of {sorted(profiles)}")
+    return name, profiles[name]
+
+
+def get_caching_profile_schedule(scope):
+    """ `{profile_name: schedule_expression}`, e.g. `{"event": "cron(0 18 ? * SAT *)"}` """
+    return _context(scope, GlobalArgs.SCHEDULE_CONTEXT_KEY) or {}
+
+
+def get_min_reserved_concurrency(scope):
+    """
+    `(profile_name, reserved_concurrency)` of the profile with the least reserved concurrency, of
+    the one deployed and those the profile switcher applies on a schedule
+    """
+    name, profile = get_caching_profile(scope)
+    profiles = get_caching_profiles(scope)
+    reserved = {name: profile["reserved_concurrency"]}
+    for n in get_caching_profile_schedule(scope):
+        # Unknown profiles are rejected by the switcher
+        if n in profiles:
+            reserved[n] = profiles[n]["reserved_concurrency"]
+    return min(reserved.items(), key=lambda kv: kv[1])
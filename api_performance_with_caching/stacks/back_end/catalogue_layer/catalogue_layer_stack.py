@@ -0,0 +1,139 @@
+import codecs
+import copy
+import csv
+import json
+import os
+
+from aws_cdk import aws_lambda as _lambda
+from aws_cdk import core
+
+from api_performance_with_caching.stacks.back_end.lambda_src.mmap_catalogue import write_catalogue
+from api_performance_with_caching.stacks.back_end.lambda_src.response_body import BodyEncoder
+from api_performance_with_caching.stacks.back_end.lambda_src.response_body import decode_item
+from api_performance_with_caching.stacks.back_end.lambda_src.response_body import encode_item
+from data_loader_stacks.custom_resources.ddb_data_loader.lambda_src.sample_movies import MOVIE_LIST
+
+
+class GlobalArgs:
+    """
+    Helper to define global statics
+    """
+
+    OWNER = "MystiqueAutomation"
+    CONTEXT_KEY = "greeter_catalogue"
+    # Rebuilt on every synth, next to the cloud assembly
+    BUILD_DIR = os.path.join(".build", "catalogue")
+    LAYER_FILE = "catalogue/movies.cat"
+    # Layers are extracted to /opt
+    LAYER_MOUNT = "/opt"
+
+
+def get_catalogue_conf(scope):
+    """
+    Settings of the catalogue layer, `None` when it is off, e.g. `-c greeter_catalogue=true` for
+    the movies the data loader loads, its `ddb_data_source` or the sample movies, or
+    `-c greeter_catalogue='{"source": "movies.jsonl"}'` for a dump of the table
+    """
+    val = scope.node.try_get_context(GlobalArgs.CONTEXT_KEY)
+    if isinstance(val, str):
+        val = json.loads(val) if val.strip().startswith("{") else val.lower() == "true"
+    if not val:
+        return None
+    return dict(
+        {"source": scope.node.try_get_context("ddb_data_source")},
+        **(val if isinstance(val, dict) else {})
+    )
+
+
+def _source_lines(source):
+    """ Lines of a local file, or of an `s3://bucket/key` object as the data loader reads it """
+    if not source.startswith("s3://"):
+        with open(source, encoding="utf-8") as f:
+            yield from f
+        return
+    # Only needed to synth from an object in s3
+    import boto3
+    bucket, _, key = source.replace("s3://", "", 1).partition("/")
+    body = boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"]
+    yield from codecs.iterdecode(body.iter_lines(), "utf-8")
+
+
+def read_source(source=None):
+    """
+    Yields the movies as plain JSON, from a JSONL or CSV file, local or in s3, the same formats
+    the data loader reads. Lines of a DynamoDB JSON export, `{"Item": {...}}`, are decoded.
+    Without a source, the sample movies the data loader falls back to.
+    """
+    if not source:
+        yield from copy.deepcopy(MOVIE_LIST)
+        return
+    lines = _source_lines(source)
+    if source.lower().endswith(".csv"):
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        if line.strip():
+            item = json.loads(line)
+            yield decode_item(item["Item"]) if set(item) == {"Item"} else item
+
+
+def catalogue_entries(items, plain_items, compact):
+    """ `(id, encoded JSON, ETag)` of each movie, ids and versions set as the data loader sets them """
+    encoder = BodyEncoder(plain_items=plain_items, compact=compact)
+    for idx, item in enumerate(items):
+        item["id"] = str(item.get("id", idx))
+        item.setdefault("version", 1)
+        encoded, etag = encoder.encode(item["id"], encode_item(item))
+        yield item["id"], encoded, etag
+
+
+def build_catalogue(path, source=None, plain_items=False, compact=False):
+    """ Returns the number of movies written to `path` """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return write_catalogue(
+        path,
+        catalogue_entries(read_source(source), plain_items, compact),
+        plain_items=plain_items,
+        compact=compact
+    )
+
+
+class CatalogueLayerStack(core.Construct):
+    """
+    The movies, pre-encoded into a memory-mapped catalogue, shipped with the greeter as a
+    lambda layer. Built at synth, so lookups never depend on DynamoDB. The bodies must be
+    encoded with the same `plain_items` & `compact` options as the greeter's.
+    """
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        conf: dict,
+        plain_items: bool,
+        compact: bool,
+        **kwargs
+    ) -> None:
+        super().__init__(scope, id)
+
+        build_dir = os.path.join(GlobalArgs.BUILD_DIR, core.Stack.of(self).stack_name)
+        self.count = build_catalogue(
+            os.path.join(build_dir, GlobalArgs.LAYER_FILE),
+            source=conf["source"],
+            plain_items=plain_items,
+            compact=compact
+        )
+        self.path = f"{GlobalArgs.LAYER_MOUNT}/{GlobalArgs.LAYER_FILE}"
+
+        self.layer = _lambda.LayerVersion(
+            self,
+            "catalogueLayer",
+            code=_lambda.Code.from_asset(build_dir),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_7],
+            description=f"{self.count} movies, pre-encoded for the greeter"
+        )
+
+    def add_to(self, fn: _lambda.Function):
+        """ Ships the catalogue with `fn` and points it at it """
+        fn.add_layers(self.layer)
+        fn.add_environment("CATALOGUE_PATH", self.path)
@@ -0,0 +1,90 @@
+import os
+
+from aws_cdk import aws_apigateway as _apigw
+from aws_cdk import aws_dynamodb as _dynamodb
+from aws_cdk import aws_iam as _iam
+from aws_cdk import core
+
+
+class GlobalArgs:
+    """
+    Helper to define global statics
+    """
+
+    OWNER = "MystiqueAutomation"
+    CONTEXT_KEY = "movie_by_id_integration"
+    MODES = ("lambda", "dynamodb")
+    TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "vtl_templates")
+
+
+def get_movie_by_id_integration(scope):
+    """
+    Integration behind `GET /movie/{id}`, the greeter `lambda` or `dynamodb` GetItem straight
+    from API Gateway, e.g. `-c movie_by_id_integration=dynamodb`
+    """
+    mode = scope.node.try_get_context(GlobalArgs.CONTEXT_KEY) or GlobalArgs.MODES[0]
+    if mode not in GlobalArgs.MODES:
+        raise ValueError(
+            f"Unknown {GlobalArgs.CONTEXT_KEY} '{mode}', expected one of {', '.join(GlobalArgs.MODES)}")
+    return mode
+
+
+def _read_template(name):
+    with open(os.path.join(GlobalArgs.TEMPLATES_DIR, name)) as f:
+        return f.read()
+
+
+def direct_ddb_integration(
+    scope: core.Construct,
+    ddb_table: _dynamodb.Table,
+    response_parameters: dict
+) -> _apigw.AwsIntegration:
+    """
+    GetItem on `ddb_table`, mapped to the same body as the greeter lambda by the VTL templates in
+    `vtl_templates`. The ETag is set by the response template, from the id and version of the movie
+    and the `?fields=` projected
+    """
+    integration_role = _iam.Role(
+        scope,
+        "movieByIdDdbIntegrationRole",
+        assumed_by=_iam.ServicePrincipal("apigateway.amazonaws.com")
+    )
+    ddb_table.grant(integration_role, "dynamodb:GetItem")
+
+    return _apigw.AwsIntegration(
+        service="dynamodb",
+        action="GetItem",
+        options=_apigw.IntegrationOptions(
+            credentials_role=integration_role,
+            request_parameters={
+                "integration.request.path.id": "method.request.path.id",
+                "integration.request.querystring.fields": "method.request.querystring.fields"
+            },
+            cache_key_parameters=[
+                "method.request.path.id",
+                "method.request.querystring.fields"
+            ],
+            request_templates={
+                "application/json": _read_template("get_item_request.vtl").replace(
+                    "__TABLE_NAME__", ddb_table.table_name)
+            },
+            passthrough_behavior=_apigw.PassthroughBehavior.NEVER,
+            integration_responses=[
+                _apigw.IntegrationResponse(
+                    status_code="200",
+                    response_parameters=response_parameters,
+                    response_templates={
+                        "application/json": _read_template("ts.vtl") + _read_template("get_item_response.vtl")
+                    }
+                ),
+                # Throttles and DynamoDB errors, the greeter would have failed too
+                _apigw.IntegrationResponse(
+                    status_code="502",
+                    selection_pattern=r"(4|5)\d{2}",
+                    response_templates={
+                        "application/json": _read_template("ts.vtl") + '{"message": "BackEnd-DynamoDB Error","ts": "$ts"}'
+                    }
+                )
+            ]
+        )
+    )
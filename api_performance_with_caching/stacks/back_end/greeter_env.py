@@ -0,0 +1,102 @@
+import copy
+
+
+class GlobalArgs:
+    """
+    Helper to define global statics
+    """
+
+    OWNER = "MystiqueAutomation"
+
+
+# Smaller responses are not worth the CPU to compress, a movie is ~150 bytes
+COMPRESSION_MIN_BYTES = 1024
+# Passed through by API Gateway as binary, the greeter answers these with MessagePack
+BINARY_MEDIA_TYPES = ["application/msgpack", "application/x-msgpack"]
+
+# The greeter settings of each api that do not depend on deployed resources. The stacks add
+# the table, the bloom filter & co, the local api emulator runs the greeter with these.
+GREETER_ENV = {
+    "cached": {
+        "Environment": "Production",
+        "RANDOM_SLEEP_SECS": "2",
+        "ANDON_CORD_PULLED": "False",
+        # In-container read-through cache, in front of DynamoDB
+        "L1_CACHE_TTL_SECS": "10",
+        "L1_CACHE_MAX_ITEMS": "1024",
+        "L1_CACHE_NEGATIVE_TTL_SECS": "5",
+        "L1_CACHE_STALE_SECS": "20",
+        "BATCH_MAX_IDS": "100",
+        # Return movies as plain JSON, not DynamoDB typed attributes
+        "PLAIN_JSON_ITEMS": "True",
+        "COMPACT_JSON": "False",
+        # Per invocation metrics, as CloudWatch Embedded Metric Format log records
+        "EMF_METRICS_ENABLED": "True",
+        "METRICS_NAMESPACE": "MiztiikAutomation/Greeter",
+        # Parse the DynamoDB model in the init phase, build the client on first use
+        "DDB_CLIENT_INIT": "preload",
+        # Fail fast on slow DynamoDB calls, well within the 10s function timeout
+        "DDB_CONNECT_TIMEOUT_SECS": "1",
+        "DDB_READ_TIMEOUT_SECS": "2",
+        "DDB_RETRY_MODE": "adaptive",
+        "DDB_MAX_ATTEMPTS": "3",
+        # Fire a second GetItem when the first is slower than the p95 seen by the container
+        "HEDGED_READS_ENABLED": "True",
+        "HEDGE_PERCENTILE": "95",
+        "HEDGE_MIN_DELAY_MS": "5",
+        # Clients keep the movie and revalidate it with If-None-Match, a 304 has no body
+        "CACHE_CONTROL": "no-cache",
+        # X-Served-By & X-Generated-At, to measure hit ratio and staleness from the client
+        "SERVED_BY_HEADERS": "True",
+        # Capacity units of every DynamoDB call, in the metrics, to size the table by
+        "RETURN_CONSUMED_CAPACITY": "True",
+        "BLOOM_FILTER_REFRESH_SECS": "60",
+        # Used when the snapshot is turned on, `-c greeter_snapshot=true`
+        "SNAPSHOT_SCAN_SEGMENTS": "4",
+        "SNAPSHOT_REFRESH_SECS": "300",
+        "SNAPSHOT_MAX_ITEMS": "10000",
+        # Proxy routes answer Accept & Accept-Encoding, binary only for the API's binary media types
+        "CONTENT_NEGOTIATION_ENABLED": "True",
+        "COMPRESSION_MIN_BYTES": str(COMPRESSION_MIN_BYTES),
+        "COMPRESSION_LEVEL": "6",
+        "BINARY_MEDIA_TYPES": ",".join(BINARY_MEDIA_TYPES)
+    },
+    "uncached": {
+        "Environment": "Production",
+        "RANDOM_SLEEP_SECS": "2",
+        "ANDON_CORD_PULLED": "False",
+        # In-container read-through cache is OFF, every request reaches DynamoDB
+        "L1_CACHE_TTL_SECS": "0",
+        "L1_CACHE_MAX_ITEMS": "1024",
+        "L1_CACHE_NEGATIVE_TTL_SECS": "0",
+        "L1_CACHE_STALE_SECS": "0",
+        "BATCH_MAX_IDS": "100",
+        # Return movies as plain JSON, not DynamoDB typed attributes
+        "PLAIN_JSON_ITEMS": "True",
+        "COMPACT_JSON": "False",
+        # Per invocation metrics, as CloudWatch Embedded Metric Format log records
+        "EMF_METRICS_ENABLED": "True",
+        "METRICS_NAMESPACE": "MiztiikAutomation/Greeter",
+        # Parse the DynamoDB model in the init phase, build the client on first use
+        "DDB_CLIENT_INIT": "preload",
+        # Fail fast on slow DynamoDB calls, well within the 10s function timeout
+        "DDB_CONNECT_TIMEOUT_SECS": "1",
+        "DDB_READ_TIMEOUT_SECS": "2",
+        "DDB_RETRY_MODE": "adaptive",
+        "DDB_MAX_ATTEMPTS": "3",
+        # Hedged reads are OFF, duplicate GetItems would skew the RCU the cached api is compared with
+        "HEDGED_READS_ENABLED": "False",
+        # Clients keep the movie and revalidate it with If-None-Match, a 304 has no body
+        "CACHE_CONTROL": "no-cache",
+        # X-Served-By & X-Generated-At, to measure hit ratio and staleness from the client
+        "SERVED_BY_HEADERS": "True",
+        # Capacity units of every DynamoDB call, in the metrics, to size the table by
+        "RETURN_CONSUMED_CAPACITY": "True",
+        "BLOOM_FILTER_REFRESH_SECS": "60"
+    },
+}
+
+
+def get_greeter_env(api):
+    """ A copy, for the stacks to add their resources to """
+    return copy.deepcopy(GREETER_ENV[api])
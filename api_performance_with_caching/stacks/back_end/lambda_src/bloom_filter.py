@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import math
+import struct
+import threading
+import time
+
+
+class BloomFilter:
+    """
+    Compact set of keys, answering "definitely absent" or "maybe present"
+
+    `k` bit positions per key come from two 64-bit halves of a blake2b digest
+    (Kirsch-Mitzenmacher), so the filter is the same in every process and python version.
+    Serialized as a small header and the bit array. The data loader keeps a copy of this class.
+    """
+
+    MAGIC = b"BLM1"
+    HEADER = struct.Struct(">4sQIQ")
+
+    def __init__(self, num_bits, num_hashes, bits=None, count=0):
+        self.num_bits = max(int(num_bits), 8)
+        self.num_hashes = max(int(num_hashes), 1)
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+        self.bits_set = bin(int.from_bytes(self.bits, "big")).count("1")
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate=0.01):
+        """ Sized for `capacity` keys at `fp_rate`, more keys raise the false positive rate """
+        capacity = max(int(capacity), 1)
+        num_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        return cls(num_bits, round(num_bits / capacity * math.log(2)))
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack(">QQ", digest)
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key):
+        """ A key whose bits are all set already is not counted again, it may be a false positive """
+        new = False
+        for pos in self._positions(key):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                self.bits_set += 1
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def estimated_fp_rate(self):
+        """ From the share of bits set, it stays right after keys are added to a loaded filter """
+        return (self.bits_set / float(self.num_bits)) ** self.num_hashes
+
+    def to_bytes(self):
+        return self.HEADER.pack(self.MAGIC, self.num_bits, self.num_hashes, self.count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, num_bits, num_hashes, count = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError("Not a bloom filter")
+        bits = bytearray(data[cls.HEADER.size:])
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError("Truncated bloom filter")
+        return cls(num_bits, num_hashes, bits, count)
+
+
+class KeyIndex:
+    """
+    Helper to keep the bloom filter of the table keys fresh in a container
+
+    `fetch(etag)` returns `(data, etag)`, or `(None, etag)` when the object is unchanged. It is
+    called on every `refresh`, which is `due` at most every `refresh_secs`, as is `fetch_added()`,
+    which returns the keys added by other containers since the filter was built. Those, and the keys written since the container
+    started, are added on top of every filter loaded, so they are never answered as absent.
+    Until a filter has been loaded, every key may be present.
+    """
+
+    def __init__(self, fetch=None, fetch_added=None, refresh_secs=60, max_added_keys=10000, clock=time.monotonic):
+        self.fetch = fetch
+        self.fetch_added = fetch_added
+        self.refresh_secs = refresh_secs
+        self.max_added_keys = max_added_keys
+        self.filter = None
+        self.etag = None
+        self.refreshes = 0
+        self._added = set()
+        # Listed keys already added to the filter loaded
+        self._listed = set()
+        self._next_refresh = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.fetch is not None
+
+    @property
+    def loaded(self):
+        return self.filter is not None
+
+    def might_contain(self, key):
+        f = self.filter
+        return True if f is None else key in f
+
+    def add(self, key):
+        with self._lock:
+            if len(self._added) < self.max_added_keys:
+                self._added.add(key)
+            if self.filter is not None:
+                self.filter.add(key)
+
+    def due(self):
+        """ `True` at most once every `refresh_secs`, for the one caller that is to refresh """
+        with self._lock:
+            now = self._clock()
+            if not self.enabled or now < self._next_refresh:
+                return False
+            self._next_refresh = now + self.refresh_secs
+            return True
+
+    def refresh(self):
+        """ Returns `True` when a new filter was loaded, errors are left to the caller """
+        if not self.enabled:
+            return False
+        data, etag = self.fetch(self.etag)
+        added = list(self.fetch_added()) if self.fetch_added else []
+        with self._lock:
+            if data is not None:
+                f = BloomFilter.from_bytes(data)
+                for key in self._added:
+                    f.add(key)
+                self.filter = f
+                self.etag = etag
+                self.refreshes += 1
+                self._listed = set()
+            if self.filter is not None:
+                for key in added:
+                    if key not in self._listed:
+                        self.filter.add(key)
+                        self._listed.add(key)
+        return data is not None
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class GlobalArgs:
+    """ Global statics """
+    # All the invalidations share one partition, sorted by the time they were recorded
+    PARTITION_KEY = "pk"
+    SORT_KEY = "sk"
+    PARTITION = "invalidations"
+    EXPIRES_AFTER_SECS = 900
+    # The latest version written of each movie, one partition per table, never expire
+    VERSIONS_PARTITION = "versions#{table_name}"
+    VERSION_ATTRIBUTE = "version"
+    # Set on the movies written by the greeter, the bulk writes of the data loader are not invalidated
+    WRITER_ATTRIBUTE = "written_by"
+    WRITER = "greeter"
+
+
+def invalidation_record(table_name, item_id, now=None, expires_after_secs=GlobalArgs.EXPIRES_AFTER_SECS):
+    """ Item of the invalidations table, for a changed item of `table_name` """
+    now = time.time() if now is None else now
+    return {
+        GlobalArgs.PARTITION_KEY: {"S": GlobalArgs.PARTITION},
+        # `<epoch secs>#<table>#<id>`, the epoch stays 10 digits wide until the year 2286
+        GlobalArgs.SORT_KEY: {"S": f"{now:.6f}#{table_name}#{item_id}"},
+        "table_name": {"S": table_name},
+        "item_id": {"S": item_id},
+        "expires_at": {"N": str(int(now + expires_after_secs))}
+    }
+
+
+def version_stamp(invalidations_table, table_name, item_id, version):
+    """ UpdateItem kwargs recording `version` of an item of `table_name`, a lower one never replaces it """
+    return dict(
+        TableName=invalidations_table,
+        Key={
+            GlobalArgs.PARTITION_KEY: {"S": GlobalArgs.VERSIONS_PARTITION.format(table_name=table_name)},
+            GlobalArgs.SORT_KEY: {"S": item_id}
+        },
+        UpdateExpression="SET #v = :v",
+        ConditionExpression="attribute_not_exists(#v) OR #v < :v",
+        ExpressionAttributeNames={"#v": GlobalArgs.VERSION_ATTRIBUTE},
+        ExpressionAttributeValues={":v": {"N": str(version)}}
+    )
+
+
+def read_version_stamps(client, invalidations_table, table_name):
+    """ `{item_id: version}` of every item of `table_name` with a recorded version """
+    kwargs = dict(
+        TableName=invalidations_table,
+        KeyConditionExpression="#pk = :pk",
+        ExpressionAttributeNames={"#pk": GlobalArgs.PARTITION_KEY},
+        ExpressionAttributeValues={
+            ":pk": {"S": GlobalArgs.VERSIONS_PARTITION.format(table_name=table_name)}}
+    )
+    stamps = {}
+    while True:
+        res = client.query(**kwargs)
+        for r in res.get("Items", []):
+            stamps[r[GlobalArgs.SORT_KEY]["S"]] = int(r[GlobalArgs.VERSION_ATTRIBUTE]["N"])
+        if not res.get("LastEvaluatedKey"):
+            return stamps
+        kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+
+class InvalidationPoller:
+    """
+    Helper to drop in-container cache entries changed elsewhere
+
+    When `due`, at most every `poll_secs`, the invalidations recorded since the last poll are read
+    in one Query. The window reaches back `lookback_secs` further, so records written late by a slow
+    stream consumer are not missed, and records already applied are skipped. Every container queries
+    the same partition, poll about as often as the in-container entries expire.
+    """
+
+    def __init__(self, table_name, poll_secs=10, lookback_secs=5, clock=time.time):
+        self.table_name = table_name
+        self.poll_secs = poll_secs
+        self.lookback_secs = lookback_secs
+        self.clock = clock
+        self.applied = 0
+        # Entries cached by this container all postdate its start
+        self._since = clock()
+        self._next_poll = 0
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.table_name) and self.poll_secs >= 0
+
+    def due(self):
+        """ `True` at most once every `poll_secs`, for the one caller that is to poll """
+        with self._lock:
+            now = self.clock()
+            if not self.enabled or now < self._next_poll:
+                return False
+            self._next_poll = now + self.poll_secs
+            return True
+
+    def poll(self, client, on_invalidate):
+        """ Calls `on_invalidate(table_name, item_id)` for every new invalidation, returns how many """
+        if not self.enabled:
+            return 0
+        with self._poll_lock:
+            now = self.clock()
+            since = f"{self._since - self.lookback_secs:.6f}"
+            records = []
+            kwargs = dict(
+                TableName=self.table_name,
+                KeyConditionExpression="#pk = :pk AND #sk > :since",
+                ExpressionAttributeNames={
+                    "#pk": GlobalArgs.PARTITION_KEY, "#sk": GlobalArgs.SORT_KEY},
+                ExpressionAttributeValues={
+                    ":pk": {"S": GlobalArgs.PARTITION}, ":since": {"S": since}}
+            )
+            while True:
+                res = client.query(**kwargs)
+                records.extend(res.get("Items", []))
+                if not res.get("LastEvaluatedKey"):
+                    break
+                kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+            self._since = now
+            fresh = []
+            for r in records:
+                sk = r[GlobalArgs.SORT_KEY]["S"]
+                if sk not in self._seen:
+                    self._seen[sk] = True
+                    fresh.append((r["table_name"]["S"], r["item_id"]["S"]))
+            # Records older than the next window can not be returned again
+            next_since = f"{now - self.lookback_secs:.6f}"
+            for sk in [sk for sk in self._seen if sk < next_since]:
+                del self._seen[sk]
+        for table_name, item_id in fresh:
+            on_invalidate(table_name, item_id)
+        self.applied += len(fresh)
+        return len(fresh)
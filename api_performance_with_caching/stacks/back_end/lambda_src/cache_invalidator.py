@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+DynamoDB Streams consumer of the movies table
+
+For every movie changed by the greeter, it records an invalidation for the greeter containers
+to drop their in-container cache entries, then refreshes the API Gateway cache entry of the movie
+with a signed `Cache-Control: max-age=0` request. The bulk writes of the data loader are skipped,
+their movies are new to every cache or expire from it.
+"""
+
+import json
+import logging
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import botocore.session
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+
+from cache_invalidation import GlobalArgs as InvalidationArgs
+from cache_invalidation import invalidation_record
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    ENVIRONMENT = "production"
+    MODULE_NAME = "cache_invalidator_lambda"
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    DDB_TABLE_NAME = os.getenv("DDB_TABLE_NAME", "")
+    INVALIDATIONS_TABLE_NAME = os.getenv("INVALIDATIONS_TABLE_NAME", "")
+    # https://{api}.execute-api.{region}.amazonaws.com/{stage}/cached/movie
+    API_CACHE_INVALIDATION_URL = os.getenv("API_CACHE_INVALIDATION_URL", "").rstrip("/")
+    API_REQUEST_TIMEOUT_SECS = float(os.getenv("API_REQUEST_TIMEOUT_SECS", 5))
+    # The greeter drops its own cache entries for `max-age=0` only with this token
+    CACHE_REFRESH_TOKEN_SECRET_ARN = os.getenv("CACHE_REFRESH_TOKEN_SECRET_ARN", "")
+    # Every `?fields=` is a stage cache entry of its own, those of the projections clients
+    # are known to ask for are refreshed too, e.g. `title,rating;title`. The rest expire.
+    API_CACHE_REFRESH_FIELDS = [f for f in os.getenv("API_CACHE_REFRESH_FIELDS", "").split(";") if f]
+    # Every refresh is a request through API Gateway & the greeter, those of the movies past
+    # the first `API_CACHE_REFRESH_MAX_IDS` of a batch are left to the TTL
+    API_CACHE_REFRESH_MAX_IDS = int(os.getenv("API_CACHE_REFRESH_MAX_IDS", 25))
+    API_CACHE_REFRESH_CONCURRENCY = int(os.getenv("API_CACHE_REFRESH_CONCURRENCY", 4))
+    BATCH_WRITE_MAX_ATTEMPTS = 5
+    BATCH_WRITE_BASE_BACKOFF_SECS = 0.05
+
+
+def set_logging(lv=GlobalArgs.LOG_LEVEL):
+    """ Helper to enable logging """
+    logging.basicConfig(level=lv)
+    logger = logging.getLogger()
+    logger.setLevel(lv)
+    return logger
+
+
+logger = set_logging()
+_botocore_session = botocore.session.get_session()
+_ddb_client = _botocore_session.create_client("dynamodb")
+# Read once per container, kept out of the function environment
+_cache_refresh_token = ""
+if GlobalArgs.CACHE_REFRESH_TOKEN_SECRET_ARN:
+    _cache_refresh_token = _botocore_session.create_client("secretsmanager").get_secret_value(
+        SecretId=GlobalArgs.CACHE_REFRESH_TOKEN_SECRET_ARN)["SecretString"]
+
+
+def _written_by_greeter(record):
+    """ Also filtered by the event source mapping, the new image has the writer of the movie """
+    image = record.get("dynamodb", {}).get("NewImage")
+    if image is None:
+        return True
+    return image.get(InvalidationArgs.WRITER_ATTRIBUTE, {}).get("S") == InvalidationArgs.WRITER
+
+
+def _changed_ids(records):
+    """ `{id: sequence number}` of the movies changed by the greeter, in the order they first changed """
+    ids = {}
+    for r in records:
+        m_id = r.get("dynamodb", {}).get("Keys", {}).get("id", {}).get("S")
+        if m_id is not None and m_id not in ids and _written_by_greeter(r):
+            ids[m_id] = r["dynamodb"].get("SequenceNumber")
+    return ids
+
+
+def _record_invalidations(table_name, ids):
+    """ BatchWriteItem in chunks of 25, retrying UnprocessedItems with jittered exponential backoff """
+    for i in range(0, len(ids), 25):
+        req = {
+            GlobalArgs.INVALIDATIONS_TABLE_NAME: [
+                {"PutRequest": {"Item": invalidation_record(table_name, m_id)}} for m_id in ids[i:i + 25]
+            ]
+        }
+        attempt = 0
+        while req:
+            req = _ddb_client.batch_write_item(RequestItems=req).get("UnprocessedItems")
+            if req:
+                attempt += 1
+                if attempt >= GlobalArgs.BATCH_WRITE_MAX_ATTEMPTS:
+                    raise RuntimeError(
+                        f"UnprocessedItems remain after {attempt} attempts")
+                time.sleep(random.uniform(
+                    0, GlobalArgs.BATCH_WRITE_BASE_BACKOFF_SECS * (2 ** attempt)))
+
+
+def _refresh_api_cache(m_id, fields=None):
+    """
+    A request carrying `Cache-Control: max-age=0` skips the stage cache and replaces the entry
+    with a fresh response. API Gateway honours it only when signed by a caller that is allowed
+    `execute-api:InvalidateCache`, the greeter only with the refresh token.
+    """
+    credentials = _botocore_session.get_credentials().get_frozen_credentials()
+    region = _botocore_session.get_config_variable("region")
+    req = AWSRequest(
+        method="GET",
+        url=f"{GlobalArgs.API_CACHE_INVALIDATION_URL}/{m_id}" + (f"?fields={fields}" if fields else ""),
+        headers={"Cache-Control": "max-age=0", "X-Cache-Refresh-Token": _cache_refresh_token}
+    )
+    SigV4Auth(credentials, "execute-api", region).add_auth(req)
+    prepared = req.prepare()
+    with urllib.request.urlopen(
+        urllib.request.Request(prepared.url, headers=dict(prepared.headers), method="GET"),
+        timeout=GlobalArgs.API_REQUEST_TIMEOUT_SECS
+    ) as res:
+        return res.status
+
+
+def _refresh_movie(m_id):
+    """ `True` once every stage cache entry of the movie is refreshed """
+    try:
+        for fields in [None] + GlobalArgs.API_CACHE_REFRESH_FIELDS:
+            _refresh_api_cache(m_id, fields)
+    except (urllib.error.URLError, OSError) as e:
+        logger.error(f"api_cache_refresh_failed:{m_id}, {str(e)}")
+        return False
+    return True
+
+
+def lambda_handler(event, context):
+    records = event.get("Records", [])
+    changed = _changed_ids(records)
+    ids = list(changed)
+    logger.info(f"rcvd_records:{len(records)}, changed_ids:{ids}")
+    if not ids:
+        return {"invalidated": 0, "batchItemFailures": []}
+
+    if GlobalArgs.INVALIDATIONS_TABLE_NAME:
+        _record_invalidations(GlobalArgs.DDB_TABLE_NAME, ids)
+
+    failed = []
+    skipped = []
+    if GlobalArgs.API_CACHE_INVALIDATION_URL:
+        refresh_ids = ids[:GlobalArgs.API_CACHE_REFRESH_MAX_IDS]
+        skipped = ids[GlobalArgs.API_CACHE_REFRESH_MAX_IDS:]
+        if skipped:
+            logger.warning(f"api_cache_refresh_skipped:{len(skipped)} movies, left to the TTL")
+        with ThreadPoolExecutor(max_workers=GlobalArgs.API_CACHE_REFRESH_CONCURRENCY) as pool:
+            refreshed = list(pool.map(_refresh_movie, refresh_ids))
+        failed = [m_id for m_id, ok in zip(refresh_ids, refreshed) if not ok]
+    res = {"invalidated": len(ids) - len(failed), "failed": failed, "skipped": len(skipped)}
+    logger.info(json.dumps(res))
+    # Only the records from the first failed movie on are retried, those before it are checkpointed
+    res["batchItemFailures"] = [{"itemIdentifier": changed[failed[0]]}] if failed else []
+    return res
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import json
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    # Not in the lambda runtime, `br` is offered only when a layer ships it
+    import brotli
+except ImportError:
+    brotli = None
+
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+_MEDIA_TYPES = {
+    JSON: JSON,
+    "application/*": JSON,
+    "*/*": JSON,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+}
+# mtime 0, no flags, unknown OS
+_GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+_ETAG_SUFFIXES = {MSGPACK: "-mp", "gzip": "-gz", "br": "-br"}
+
+
+def parse_accept(header):
+    """ Values of an `Accept` style header, most preferred first, without those of `q=0` """
+    ranked = []
+    for idx, part in enumerate((header or "").split(",")):
+        value, _, params = part.partition(";")
+        value = value.strip().lower()
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.partition("=")
+            if k.strip() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        if value and q > 0:
+            ranked.append((-q, idx, value))
+    return [value for _, _, value in sorted(ranked)]
+
+
+def _pack(val, out):
+    if val is None:
+        out.append(0xc0)
+    elif val is True:
+        out.append(0xc3)
+    elif val is False:
+        out.append(0xc2)
+    elif isinstance(val, int):
+        if 0 <= val < 0x80:
+            out.append(val)
+        elif -0x20 <= val < 0:
+            out += struct.pack(">b", val)
+        elif val >= 0:
+            out += struct.pack(">BQ", 0xcf, val)
+        else:
+            out += struct.pack(">Bq", 0xd3, val)
+    elif isinstance(val, float):
+        out += struct.pack(">Bd", 0xcb, val)
+    elif isinstance(val, str):
+        b = val.encode("utf-8")
+        n = len(b)
+        if n < 0x20:
+            out.append(0xa0 | n)
+        elif n < 0x100:
+            out += struct.pack(">BB", 0xd9, n)
+        elif n < 0x10000:
+            out += struct.pack(">BH", 0xda, n)
+        else:
+            out += struct.pack(">BI", 0xdb, n)
+        out += b
+    elif isinstance(val, (list, tuple)):
+        _pack_header(len(val), 0x90, 0xdc, out)
+        for v in val:
+            _pack(v, out)
+    elif isinstance(val, dict):
+        _pack_header(len(val), 0x80, 0xde, out)
+        for k, v in val.items():
+            _pack(k, out)
+            _pack(v, out)
+    else:
+        raise TypeError(f"Cannot pack {type(val).__name__} as MessagePack")
+
+
+def _pack_header(n, fix, code16, out):
+    """ Array or map header, `code16 + 1` is the 32-bit form """
+    if n < 0x10:
+        out.append(fix | n)
+    elif n < 0x10000:
+        out += struct.pack(">BH", code16, n)
+    else:
+        out += struct.pack(">BI", code16 + 1, n)
+
+
+def packb(val):
+    """ MessagePack of a JSON value, https://github.com/msgpack/msgpack/blob/master/spec.md """
+    out = bytearray()
+    _pack(val, out)
+    return bytes(out)
+
+
+class Representation:
+    """ Media type and content coding chosen for a response """
+
+    def __init__(self, media_type=JSON, coding="identity"):
+        self.media_type = media_type
+        self.coding = coding
+
+    @property
+    def binary(self):
+        return self.media_type != JSON or self.coding != "identity"
+
+    def etag(self, etag):
+        """
+        Every representation of a movie has an ETag of its own. It names what was negotiated, a
+        body too small to compress is sent as is under it, the same for every response of the item.
+        """
+        if not etag:
+            return etag
+        suffix = _ETAG_SUFFIXES.get(self.media_type, "") + _ETAG_SUFFIXES.get(self.coding, "")
+        return etag[:-1] + suffix + '"' if suffix else etag
+
+
+class ContentNegotiator:
+    """
+    Helper to answer `Accept` with JSON or MessagePack and `Accept-Encoding` with gzip or brotli
+
+    A body is the encoded item between a static head and the `ts` of the response. Per item,
+    the MessagePack of it and the deflated head up to the `ts` are kept, keyed by its ETag. A
+    gzip body then only appends the `ts`, stored, with the CRC carried over. brotli
+    streams can not be spliced, those bodies are compressed whole. Bodies under `min_bytes` are
+    not compressed. Binary bodies are only sent for media types the front end passes through
+    as binary, `binary_types`.
+    """
+
+    def __init__(self, encoder, enabled=False, min_bytes=1024, level=6, binary_types=("*/*",), max_items=1024):
+        self.encoder = encoder
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.level = level
+        self.binary_types = {t.strip().lower() for t in binary_types if t.strip()}
+        self.max_items = max(int(max_items), 1)
+        self.codings = ["gzip", "br"] if brotli is not None else ["gzip"]
+        self._packed = OrderedDict()
+        self._packed_heads = {}
+        self._deflated = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _binary_ok(self, media_type):
+        return "*/*" in self.binary_types or media_type in self.binary_types
+
+    def choose(self, accept, accept_encoding):
+        """ JSON without compression unless the client asks for, and the front end can carry, more """
+        if not self.enabled:
+            return Representation()
+        media_type = next(
+            (_MEDIA_TYPES[t] for t in parse_accept(accept) if t in _MEDIA_TYPES), JSON)
+        if not self._binary_ok(media_type):
+            media_type = JSON
+        coding = "identity"
+        if self._binary_ok(media_type):
+            for c in parse_accept(accept_encoding):
+                if c == "*":
+                    c = self.codings[0]
+                if c in self.codings:
+                    coding = c
+                    break
+        return Representation(media_type, coding)
+
+    def _cached(self, cache, key, build):
+        with self._lock:
+            val = cache.get(key)
+            if val is not None:
+                cache.move_to_end(key)
+                return val
+        val = build()
+        with self._lock:
+            cache[key] = val
+            while len(cache) > self.max_items:
+                cache.popitem(last=False)
+        return val
+
+    def _parts(self, rep, field, encoded, etag, ts):
+        """ `(head, tail)` of the body, the head is the same for every response of the item """
+        if rep.media_type == JSON:
+            body = self.encoder.body(field, encoded, ts)
+            cut = len(body) - len(ts) - 2
+            return body[:cut].encode("utf-8"), body[cut:].encode("utf-8")
+        item = self._cached(
+            self._packed, (etag, field), lambda: packb(json.loads(encoded))) if etag else packb(json.loads(encoded))
+        field_head = self._packed_heads.get(field)
+        if field_head is None:
+            field_head = b"\x83" + packb("message") + packb(self.encoder.MESSAGE) + packb(field)
+            self._packed_heads[field] = field_head
+        return field_head + item + b"\xa2ts", packb(ts)
+
+    def _gzip(self, key, head, tail):
+        deflated, crc = self._cached(self._deflated, key, lambda: self._deflate_head(head)) \
+            if key else self._deflate_head(head)
+        size = len(head) + len(tail)
+        return b"".join((
+            _GZIP_HEADER,
+            deflated,
+            # The few bytes of the tail as the final, stored, block: no compressor to set up
+            struct.pack("<BHH", 0x01, len(tail), len(tail) ^ 0xffff),
+            tail,
+            struct.pack("<II", zlib.crc32(tail, crc) & 0xffffffff, size & 0xffffffff),
+        ))
+
+    def _deflate_head(self, head):
+        """ Raw deflate ending on a byte boundary, without a final block, so more can follow """
+        c = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return c.compress(head) + c.flush(zlib.Z_SYNC_FLUSH), zlib.crc32(head)
+
+    def render(self, rep, field, encoded, etag, ts=None):
+        """ `(body, headers, is_base64)`, binary bodies are base64 encoded as the proxy integration expects """
+        if not rep.binary:
+            return self.encoder.body(field, encoded, ts), {}, False
+        ts = ts or self.encoder.timestamp()
+        head, tail = self._parts(rep, field, encoded, etag, ts)
+        headers = {"Content-Type": rep.media_type}
+        coding = rep.coding if len(head) + len(tail) >= self.min_bytes else "identity"
+        if coding == "gzip":
+            data = self._gzip((etag, field, rep.media_type) if etag else None, head, tail)
+        elif coding == "br":
+            data = brotli.compress(head + tail, quality=self.level)
+        else:
+            data = head + tail
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        if rep.media_type == JSON and coding == "identity":
+            return data.decode("utf-8"), headers, False
+        return base64.b64encode(data).decode("ascii"), headers, True
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class InvocationMetrics:
+    """
+    Helper to collect the metrics of one invocation and write them as a CloudWatch
+    Embedded Metric Format (EMF) record, which CloudWatch turns into metrics from the logs
+
+    https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+    """
+
+    def __init__(self, namespace, dimensions=None, enabled=True, stream=None):
+        self.namespace = namespace
+        self.dimensions = dimensions or {}
+        self.enabled = enabled
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, **dimensions):
+        with self._lock:
+            self._dims = dict(self.dimensions, **dimensions)
+            self._metrics = {}
+            self._properties = {}
+
+    def set_dimension(self, name, value):
+        self._dims[name] = value
+
+    def put(self, name, value, unit="None"):
+        """ Repeated values of the same metric are kept, as an array, for percentiles """
+        if not self.enabled:
+            return
+        with self._lock:
+            m = self._metrics.setdefault(name, {"unit": unit, "values": []})
+            m["values"].append(value)
+
+    def set_property(self, name, value):
+        self._properties[name] = value
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.put(name, (time.perf_counter() - start) * 1000.0, "Milliseconds")
+
+    def flush(self):
+        if not self.enabled or not self._metrics:
+            return None
+        with self._lock:
+            record = dict(self._properties)
+            record.update(self._dims)
+            for name, m in self._metrics.items():
+                vals = m["values"]
+                record[name] = vals[0] if len(vals) == 1 else vals
+            record["_aws"] = {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [sorted(self._dims)],
+                    "Metrics": [
+                        {"Name": name, "Unit": m["unit"]} for name, m in self._metrics.items()
+                    ],
+                }],
+            }
+        line = json.dumps(record, separators=(",", ":"))
+        self.stream.write(line + "\n")
+        return line
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class LatencyTracker:
+    """ Helper to track a latency percentile over the most recent calls of this container """
+
+    def __init__(self, percentile=95, window=256, recompute_every=16):
+        self.percentile = percentile
+        self.recompute_every = recompute_every
+        self._samples = deque(maxlen=window)
+        self._since_recompute = 0
+        self._value = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, secs):
+        with self._lock:
+            self._samples.append(secs)
+            self._since_recompute += 1
+            if self._value is None or self._since_recompute >= self.recompute_every:
+                ordered = sorted(self._samples)
+                idx = min(int(len(ordered) * self.percentile / 100.0), len(ordered) - 1)
+                self._value = ordered[idx]
+                self._since_recompute = 0
+
+    @property
+    def value(self):
+        return self._value
+
+
+class HedgedCaller:
+    """
+    Helper to hedge idempotent reads: when a call has not returned after the tracked
+    latency percentile, a second, identical call is fired and whichever returns first wins
+
+    https://research.google/pubs/pub40801/ (The Tail at Scale)
+    """
+
+    def __init__(self, enabled=False, percentile=95, min_delay_secs=0.005, min_samples=20, max_workers=4):
+        self.enabled = enabled
+        self.min_delay_secs = min_delay_secs
+        self.min_samples = min_samples
+        self.tracker = LatencyTracker(percentile)
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers) if enabled else None
+
+    def hedge_delay(self):
+        """ `None` until enough calls have been seen to trust the percentile """
+        if len(self.tracker) < self.min_samples or self.tracker.value is None:
+            return None
+        return max(self.tracker.value, self.min_delay_secs)
+
+    def call(self, fn):
+        if not self.enabled:
+            return fn()
+        delay = self.hedge_delay()
+        start = time.perf_counter()
+        if delay is None:
+            res = fn()
+            self.tracker.record(time.perf_counter() - start)
+            return res
+
+        primary = self._executor.submit(fn)
+        # The primary's full latency is tracked, even when a hedge beats it, to keep the percentile honest
+        primary.add_done_callback(
+            lambda _: self.tracker.record(time.perf_counter() - start))
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self.hedges_fired += 1
+        hedge = self._executor.submit(fn)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is hedge:
+                        self.hedges_won += 1
+                    return f.result()
+                error = f.exception()
+        raise error
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheStats:
+    """ Helper to count cache events, both per invocation and for the life of the container """
+
+    FIELDS = ("hit", "stale_hit", "negative_hit", "miss", "evict", "refresh")
+
+    def __init__(self):
+        self.total = dict.fromkeys(self.FIELDS, 0)
+        self.current = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, field, n=1):
+        self.total[field] += n
+        self.current[field] += n
+
+    def reset_current(self):
+        self.current = dict.fromkeys(self.FIELDS, 0)
+
+
+class ReadThroughCache:
+    """
+    In-container LRU read-through cache with TTL, negative entries and stale-while-revalidate
+
+    Entries live for `ttl_secs`. After that, for another `stale_secs`, the stale value is
+    served while a single background thread reloads it. Misses (loader returns `None`) are
+    cached for `negative_ttl_secs`. A `ttl_secs` of `0` disables the cache entirely.
+    """
+
+    def __init__(self, ttl_secs=0, max_items=1024, negative_ttl_secs=0, stale_secs=0, clock=time.monotonic):
+        self.ttl_secs = ttl_secs
+        self.max_items = max(int(max_items), 1)
+        self.negative_ttl_secs = negative_ttl_secs
+        self.stale_secs = stale_secs
+        self.stats = CacheStats()
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl_secs > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, loader):
+        """ Return the cached value for `key`, calling `loader()` to fill or refresh it """
+        if not self.enabled:
+            return loader()
+        with self._lock:
+            found, val, stale = self._lookup(key, self._clock())
+            if found and stale and key not in self._refreshing:
+                self._refreshing.add(key)
+                threading.Thread(
+                    target=self._refresh, args=(key, loader), daemon=True
+                ).start()
+        if found:
+            return val
+        val = loader()
+        self.put(key, val)
+        return val
+
+    def get_many(self, keys, loader):
+        """
+        Return a dict of values for `keys`, calling `loader(missing_keys)` once for all the
+        keys that are not fresh in the cache. Stale entries are reloaded with the batch.
+        """
+        if not self.enabled:
+            loaded = loader(list(keys))
+            return {key: loaded.get(key) for key in keys}
+        now = self._clock()
+        res = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                found, val, stale = self._lookup(key, now, allow_stale=False)
+                if found:
+                    res[key] = val
+                else:
+                    missing.append(key)
+        if missing:
+            loaded = loader(missing)
+            for key in missing:
+                val = loaded.get(key)
+                self.put(key, val)
+                res[key] = val
+        return res
+
+    def _lookup(self, key, now, allow_stale=True):
+        """ Returns `(found, val, stale)`, callers must hold the lock """
+        entry = self._entries.get(key)
+        if entry is not None:
+            val, expires_at = entry
+            self._entries.move_to_end(key)
+            if now < expires_at:
+                self.stats.incr("negative_hit" if val is None else "hit")
+                return True, val, False
+            if allow_stale and val is not None and now < expires_at + self.stale_secs:
+                self.stats.incr("stale_hit")
+                return True, val, True
+        self.stats.incr("miss")
+        return False, None, False
+
+    def put(self, key, val):
+        ttl = self.negative_ttl_secs if val is None else self.ttl_secs
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (val, self._clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                self.stats.incr("evict")
+
+    def invalidate(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _refresh(self, key, loader):
+        try:
+            val = loader()
+            self.put(key, val)
+            self.stats.incr("refresh")
+        except Exception:
+            # Keep serving the stale entry, the next request past the stale window reloads it
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
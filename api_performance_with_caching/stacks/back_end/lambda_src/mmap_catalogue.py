@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import random
+import struct
+
+
+class Catalogue:
+    """
+    Read-only catalogue of pre-encoded movies, memory-mapped from a file built ahead of deploy
+
+    Layout: a header, then one record per movie, `id | encoded JSON | ETag`, then an index of
+    fixed size entries sorted by id. Ids are found by a binary search over the index, and the
+    encoded JSON is sliced out of the mapping without copying, pages are read in on first use.
+    The encoding options the bodies were built with are kept in the header.
+    """
+
+    MAGIC = b"CAT1"
+    # magic, flags, number of movies, offset of the index
+    HEADER = struct.Struct(">4sIIQ")
+    # record offset, id length, encoded JSON length, ETag length
+    ENTRY = struct.Struct(">QHIH")
+    PLAIN_ITEMS = 0x1
+    COMPACT = 0x2
+
+    def __init__(self, path=""):
+        self.path = path
+        self.flags = 0
+        self.count = 0
+        self._index_off = 0
+        self._mm = None
+        self._view = None
+        self._shadowed = set()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    @property
+    def loaded(self):
+        return self._view is not None
+
+    @property
+    def plain_items(self):
+        return bool(self.flags & self.PLAIN_ITEMS)
+
+    @property
+    def compact(self):
+        return bool(self.flags & self.COMPACT)
+
+    @property
+    def shadowed(self):
+        return len(self._shadowed)
+
+    def __len__(self):
+        return self.count
+
+    def open(self):
+        """ Errors are left to the caller, a bad file is never mapped """
+        with open(self.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(mm) < self.HEADER.size:
+                raise ValueError(f"Truncated catalogue: {self.path}")
+            magic, flags, count, index_off = self.HEADER.unpack_from(mm)
+            if magic != self.MAGIC:
+                raise ValueError(f"Not a catalogue: {self.path}")
+            if index_off + count * self.ENTRY.size != len(mm):
+                raise ValueError(f"Truncated catalogue: {self.path}")
+        except ValueError:
+            mm.close()
+            raise
+        self.flags, self.count, self._index_off = flags, count, index_off
+        self._mm = mm
+        self._view = memoryview(mm)
+        return self
+
+    def close(self):
+        view, mm = self._view, self._mm
+        self._view = self._mm = None
+        if view is not None:
+            view.release()
+            mm.close()
+
+    def _entry(self, idx):
+        return self.ENTRY.unpack_from(self._mm, self._index_off + idx * self.ENTRY.size)
+
+    def _find(self, key):
+        """ Index entry of `key`, `None` when it is not in the catalogue """
+        key = key.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._entry(mid)
+            k = self._mm[entry[0]:entry[0] + entry[1]]
+            if k == key:
+                return entry
+            if k < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def shadow(self, key):
+        """ Changed since the catalogue was built, `serves` leaves it to the table from now on """
+        if self._view is not None:
+            self._shadowed.add(key)
+
+    def serves(self, key):
+        return self._view is not None and key not in self._shadowed
+
+    def get(self, key):
+        """ `(encoded JSON, ETag)` of the movie, `None` when it is not in the catalogue """
+        entry = self._find(key)
+        if entry is None:
+            return None
+        off, klen, vlen, elen = entry
+        off += klen
+        view = self._view
+        return str(view[off:off + vlen], "utf-8"), str(view[off + vlen:off + vlen + elen], "utf-8")
+
+    def random_key(self, rnd=random):
+        if not self.count:
+            return None
+        off, klen, _, _ = self._entry(rnd.randrange(self.count))
+        return str(self._view[off:off + klen], "utf-8")
+
+
+def write_catalogue(path, entries, plain_items=False, compact=False):
+    """
+    Writes `(id, encoded JSON, ETag)` entries as a catalogue, replacing `path` only once it is
+    complete. Returns the number of movies written, the last entry of an id wins.
+    """
+    records = {}
+    for key, encoded, etag in entries:
+        records[key.encode("utf-8")] = (encoded.encode("utf-8"), etag.encode("utf-8"))
+    flags = (Catalogue.PLAIN_ITEMS if plain_items else 0) | (Catalogue.COMPACT if compact else 0)
+    tmp_path = f"{path}.tmp"
+    index = []
+    with open(tmp_path, "wb") as f:
+        f.write(bytes(Catalogue.HEADER.size))
+        for key in sorted(records):
+            encoded, etag = records[key]
+            index.append(Catalogue.ENTRY.pack(f.tell(), len(key), len(encoded), len(etag)))
+            f.write(key + encoded + etag)
+        index_off = f.tell()
+        f.write(b"".join(index))
+        f.seek(0)
+        f.write(Catalogue.HEADER.pack(Catalogue.MAGIC, flags, len(index), index_off))
+    os.replace(tmp_path, path)
+    return len(index)
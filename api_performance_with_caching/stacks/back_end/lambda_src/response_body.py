@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import datetime
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+def _decode_number(n):
+    try:
+        return int(n)
+    except ValueError:
+        return float(n)
+
+
+def decode_attr(attr):
+    """ DynamoDB attribute value, `{"S": "2013"}`, to its plain JSON value, `"2013"` """
+    (t, v), = attr.items()
+    if t == "S":
+        return v
+    if t == "N":
+        return _decode_number(v)
+    if t == "BOOL":
+        return v
+    if t == "NULL":
+        return None
+    if t == "M":
+        return {k: decode_attr(a) for k, a in v.items()}
+    if t == "L":
+        return [decode_attr(a) for a in v]
+    if t == "SS":
+        return sorted(v)
+    if t == "NS":
+        return sorted(_decode_number(n) for n in v)
+    if t == "B":
+        return base64.b64encode(v).decode() if isinstance(v, bytes) else v
+    if t == "BS":
+        return sorted(base64.b64encode(b).decode() if isinstance(b, bytes) else b for b in v)
+    raise ValueError(f"Unknown DynamoDB attribute type: {t}")
+
+
+def decode_item(item):
+    return {k: decode_attr(v) for k, v in item.items()}
+
+
+def encode_attr(val):
+    """ Plain JSON value, `"2013"`, to its DynamoDB attribute value, `{"S": "2013"}` """
+    if isinstance(val, bool):
+        return {"BOOL": val}
+    if isinstance(val, str):
+        return {"S": val}
+    if isinstance(val, (int, float)):
+        return {"N": str(val)}
+    if val is None:
+        return {"NULL": True}
+    if isinstance(val, dict):
+        return {"M": {k: encode_attr(v) for k, v in val.items()}}
+    if isinstance(val, list):
+        return {"L": [encode_attr(v) for v in val]}
+    raise ValueError(f"Cannot store {type(val).__name__} in DynamoDB")
+
+
+def encode_item(item):
+    return {k: encode_attr(v) for k, v in item.items()}
+
+
+class BodyEncoder:
+    """
+    Helper to build the greeter response bodies
+
+    The JSON for each item is encoded once and kept, keyed by table & id, for as long as
+    the item itself does not change. Every response then only splices the encoded item
+    and a fresh timestamp into the static parts of the body.
+
+    The strong ETag of an item is the hash of its encoded JSON, kept alongside it. It
+    identifies the movie, not the `ts` of the response it is sent with.
+    """
+
+    MESSAGE = "Hello Miztiikal World, How is it going?"
+
+    def __init__(self, plain_items=False, compact=False, max_items=1024):
+        self.plain_items = plain_items
+        self.compact = compact
+        self.max_items = max(int(max_items), 1)
+        self._separators = (",", ":") if compact else (", ", ": ")
+        sep = self._separators[1]
+        self._head = "{" + json.dumps("message") + sep + json.dumps(self.MESSAGE) + ","
+        self._ts = "," + json.dumps("ts") + sep + '"'
+        self._tail = '"}'
+        self._field_heads = {}
+        self._encoded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _field_head(self, field):
+        head = self._field_heads.get(field)
+        if head is None:
+            head = self._head + json.dumps(field) + self._separators[1]
+            self._field_heads[field] = head
+        return head
+
+    def _dumps(self, val):
+        return json.dumps(val, separators=self._separators)
+
+    @staticmethod
+    def etag_of(encoded):
+        return '"' + hashlib.blake2b(encoded.encode(), digest_size=12).hexdigest() + '"'
+
+    def encode(self, key, item):
+        """ `(encoded JSON, ETag)` of a DynamoDB item, a plain message string has no ETag """
+        if not isinstance(item, dict):
+            return self._dumps(item), None
+        with self._lock:
+            cached = self._encoded.get(key)
+            if cached is not None and (cached[0] is item or cached[0] == item):
+                self._encoded.move_to_end(key)
+                return cached[1], cached[2]
+        encoded = self._dumps(decode_item(item) if self.plain_items else item)
+        etag = self.etag_of(encoded)
+        with self._lock:
+            self._encoded[key] = (item, encoded, etag)
+            self._encoded.move_to_end(key)
+            while len(self._encoded) > self.max_items:
+                self._encoded.popitem(last=False)
+        return encoded, etag
+
+    def encode_batch(self, keys, items):
+        """ `(encoded JSON list, ETag)`, the ETag is derived from the ETags of the items """
+        if not isinstance(items, list):
+            return self._dumps(items), None
+        return self.join_batch(
+            None if item is None else self.encode(key, item) for key, item in zip(keys, items))
+
+    def join_batch(self, encoded_items):
+        """ `(encoded JSON list, ETag)` of items already encoded, `None` for the missing ones """
+        encoded = []
+        etags = []
+        for e in encoded_items:
+            if e is None:
+                encoded.append("null")
+                etags.append("null")
+                continue
+            encoded.append(e[0])
+            etags.append(e[1] or e[0])
+        return "[" + self._separators[0].join(encoded) + "]", self.etag_of(",".join(etags))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._encoded.pop(key, None)
+
+    @staticmethod
+    def timestamp(now=None):
+        """ `ts` of a body generated at `now`, seconds since the epoch """
+        return str(datetime.datetime.now() if now is None else datetime.datetime.fromtimestamp(now))
+
+    def body(self, field, encoded, ts=None):
+        """ `{"message": ..., "<field>": <encoded>, "ts": ...}` """
+        ts = ts or self.timestamp()
+        return self._field_head(field) + encoded + self._ts + ts + self._tail
@@ -1,19 +1,39 @@
 # -*- coding: utf-8 -*-
 
 
+import base64
 import datetime
+import functools
+import hmac
 import json
 import logging
 import os
 import random
+import re
+import threading
 import time
+import uuid
 
-import boto3
-from boto3.dynamodb.conditions import Key
-from botocore.exceptions import ClientError
+# Everything from here on, botocore included, counts towards the reported init duration
+_init_start = time.perf_counter()
 
+# botocore alone, boto3 adds nothing the low-level client needs but import time
+import botocore.session
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+from bloom_filter import KeyIndex
+from cache_invalidation import GlobalArgs as InvalidationArgs
+from cache_invalidation import InvalidationPoller, read_version_stamps, version_stamp
+from content_negotiation import ContentNegotiator
+from emf_metrics import InvocationMetrics
+from hedged_reads import HedgedCaller
+from l1_cache import ReadThroughCache
+from mmap_catalogue import Catalogue
+from response_body import BodyEncoder, decode_attr, encode_item
+from shared_cache import CircuitBreaker, RespClient, SharedCache
+from table_snapshot import TableSnapshot
 
-_ddb_client = boto3.client("dynamodb")
 
 
 class GlobalArgs:
@@ -24,6 +44,73 @@ class GlobalArgs:
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
     RANDOM_SLEEP_SECS = int(os.getenv("RANDOM_SLEEP_SECS", 2))
     ANDON_CORD_PULLED = os.getenv("ANDON_CORD_PULLED", False)
+    L1_CACHE_TTL_SECS = float(os.getenv("L1_CACHE_TTL_SECS", 0))
+    L1_CACHE_MAX_ITEMS = int(os.getenv("L1_CACHE_MAX_ITEMS", 1024))
+    L1_CACHE_NEGATIVE_TTL_SECS = float(os.getenv("L1_CACHE_NEGATIVE_TTL_SECS", 0))
+    L1_CACHE_STALE_SECS = float(os.getenv("L1_CACHE_STALE_SECS", 0))
+    PLAIN_JSON_ITEMS = os.getenv("PLAIN_JSON_ITEMS", "False").lower() == "true"
+    COMPACT_JSON = os.getenv("COMPACT_JSON", "False").lower() == "true"
+    BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", 100))
+    BATCH_GET_CHUNK_SIZE = 100
+    BATCH_GET_MAX_ATTEMPTS = int(os.getenv("BATCH_GET_MAX_ATTEMPTS", 5))
+    BATCH_GET_BASE_BACKOFF_SECS = 0.025
+    EMF_METRICS_ENABLED = os.getenv("EMF_METRICS_ENABLED", "False").lower() == "true"
+    METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "MiztiikAutomation/Greeter")
+    STACK_NAME = os.getenv("STACK_NAME", "unknown")
+    # lazy: build the client on first use, preload: also parse the service model during init
+    DDB_CLIENT_INIT = os.getenv("DDB_CLIENT_INIT", "lazy").lower()
+    # The botocore defaults are 60s timeouts, longer than the function timeout
+    DDB_CONNECT_TIMEOUT_SECS = float(os.getenv("DDB_CONNECT_TIMEOUT_SECS", 1))
+    DDB_READ_TIMEOUT_SECS = float(os.getenv("DDB_READ_TIMEOUT_SECS", 2))
+    DDB_RETRY_MODE = os.getenv("DDB_RETRY_MODE", "adaptive")
+    DDB_MAX_ATTEMPTS = int(os.getenv("DDB_MAX_ATTEMPTS", 3))
+    DDB_MAX_POOL_CONNECTIONS = int(os.getenv("DDB_MAX_POOL_CONNECTIONS", 10))
+    HEDGED_READS_ENABLED = os.getenv("HEDGED_READS_ENABLED", "False").lower() == "true"
+    HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+    HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", 5))
+    # Written by the DynamoDB Streams consumer, unset turns polling off
+    INVALIDATIONS_TABLE_NAME = os.getenv("INVALIDATIONS_TABLE_NAME", "")
+    # Every container queries the one partition, by default as often as its L1 entries expire
+    INVALIDATION_POLL_SECS = float(os.getenv("INVALIDATION_POLL_SECS", L1_CACHE_TTL_SECS or 10))
+    INVALIDATION_LOOKBACK_SECS = float(os.getenv("INVALIDATION_LOOKBACK_SECS", 5))
+    # Secrets Manager secret shared with the cache invalidator, `Cache-Control: max-age=0` is ignored without it
+    CACHE_REFRESH_TOKEN_SECRET_ARN = os.getenv("CACHE_REFRESH_TOKEN_SECRET_ARN", "")
+    # host:port of a Redis-compatible cache shared by every container, unset turns it off
+    SHARED_CACHE_ENDPOINT = os.getenv("SHARED_CACHE_ENDPOINT", "")
+    SHARED_CACHE_TLS = os.getenv("SHARED_CACHE_TLS", "False").lower() == "true"
+    SHARED_CACHE_TTL_SECS = int(os.getenv("SHARED_CACHE_TTL_SECS", 60))
+    SHARED_CACHE_NEGATIVE_TTL_SECS = int(os.getenv("SHARED_CACHE_NEGATIVE_TTL_SECS", 10))
+    SHARED_CACHE_TIMEOUT_MS = float(os.getenv("SHARED_CACHE_TIMEOUT_MS", 50))
+    SHARED_CACHE_BREAKER_FAILURES = int(os.getenv("SHARED_CACHE_BREAKER_FAILURES", 3))
+    SHARED_CACHE_BREAKER_RESET_SECS = float(os.getenv("SHARED_CACHE_BREAKER_RESET_SECS", 30))
+    # s3 object with the bloom filter of the table keys, built by the data loader, unset turns it off
+    BLOOM_FILTER_BUCKET = os.getenv("BLOOM_FILTER_BUCKET", "")
+    BLOOM_FILTER_KEY = os.getenv("BLOOM_FILTER_KEY", "")
+    BLOOM_FILTER_REFRESH_SECS = float(os.getenv("BLOOM_FILTER_REFRESH_SECS", 60))
+    # Keep the whole table in the container, for small catalogues
+    SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "False").lower() == "true"
+    SNAPSHOT_SCAN_SEGMENTS = int(os.getenv("SNAPSHOT_SCAN_SEGMENTS", 4))
+    SNAPSHOT_REFRESH_SECS = float(os.getenv("SNAPSHOT_REFRESH_SECS", 300))
+    SNAPSHOT_MAX_ITEMS = int(os.getenv("SNAPSHOT_MAX_ITEMS", 10000))
+    # Movies pre-encoded at build time, shipped in a layer, unset turns it off
+    CATALOGUE_PATH = os.getenv("CATALOGUE_PATH", "")
+    # Answer Accept with JSON or MessagePack and Accept-Encoding with gzip, or br with brotli in a layer
+    CONTENT_NEGOTIATION_ENABLED = os.getenv("CONTENT_NEGOTIATION_ENABLED", "False").lower() == "true"
+    COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+    COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", 6))
+    # Media types the front end passes through as binary, the binaryMediaTypes of the REST API
+    BINARY_MEDIA_TYPES = os.getenv("BINARY_MEDIA_TYPES", "*/*").split(",")
+    # no-cache: clients may keep a movie, but revalidate it with If-None-Match on every use
+    CACHE_CONTROL = os.getenv("CACHE_CONTROL", "no-cache")
+    # Tells clients which container built a body, and when, to measure the age of cached ones
+    SERVED_BY_HEADERS = os.getenv("SERVED_BY_HEADERS", "False").lower() == "true"
+    # Capacity units of every DynamoDB call as metrics, what `capacity_planner.py` sizes the table by
+    RETURN_CONSUMED_CAPACITY = os.getenv("RETURN_CONSUMED_CAPACITY", "False").lower() == "true"
+    VERSION_ATTRIBUTE = "version"
+    PUT_MAX_ATTEMPTS = 3
+    # ?fields=title,rating, top level attributes only, `id` & `version` are always returned
+    FIELDS_MAX = int(os.getenv("FIELDS_MAX", 20))
+    FIELD_NAME_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_-]{0,63}")
 
 
 def set_logging(lv=GlobalArgs.LOG_LEVEL):
@@ -37,6 +124,276 @@ def set_logging(lv=GlobalArgs.LOG_LEVEL):
 # Initial some defaults in global context to reduce lambda start time, when re-using container
 logger = set_logging()
 
+# Survives across invocations of a warm container
+_l1_cache = ReadThroughCache(
+    ttl_secs=GlobalArgs.L1_CACHE_TTL_SECS,
+    max_items=GlobalArgs.L1_CACHE_MAX_ITEMS,
+    negative_ttl_secs=GlobalArgs.L1_CACHE_NEGATIVE_TTL_SECS,
+    stale_secs=GlobalArgs.L1_CACHE_STALE_SECS
+)
+_metrics = InvocationMetrics(
+    namespace=GlobalArgs.METRICS_NAMESPACE,
+    dimensions={"Stack": GlobalArgs.STACK_NAME},
+    enabled=GlobalArgs.EMF_METRICS_ENABLED
+)
+_body_encoder = BodyEncoder(
+    plain_items=GlobalArgs.PLAIN_JSON_ITEMS,
+    compact=GlobalArgs.COMPACT_JSON,
+    max_items=GlobalArgs.L1_CACHE_MAX_ITEMS
+)
+_negotiator = ContentNegotiator(
+    _body_encoder,
+    enabled=GlobalArgs.CONTENT_NEGOTIATION_ENABLED,
+    min_bytes=GlobalArgs.COMPRESSION_MIN_BYTES,
+    level=GlobalArgs.COMPRESSION_LEVEL,
+    binary_types=GlobalArgs.BINARY_MEDIA_TYPES,
+    max_items=GlobalArgs.L1_CACHE_MAX_ITEMS
+)
+# Version & container, the container id is the one in the name of its log stream, "...[$LATEST]0f1e2d"
+_served_by = "/".join((
+    os.getenv("AWS_LAMBDA_FUNCTION_VERSION", "$LATEST"),
+    os.getenv("AWS_LAMBDA_LOG_STREAM_NAME", "").rpartition("]")[2] or uuid.uuid4().hex
+))
+_cold_start = True
+_invalidations_counted = 0
+_botocore_session = botocore.session.get_session()
+_ddb_client = None
+_s3_client = None
+_cache_refresh_token = ""
+_hedger = HedgedCaller(
+    enabled=GlobalArgs.HEDGED_READS_ENABLED,
+    percentile=GlobalArgs.HEDGE_PERCENTILE,
+    min_delay_secs=GlobalArgs.HEDGE_MIN_DELAY_MS / 1000.0
+)
+_invalidations = InvalidationPoller(
+    table_name=GlobalArgs.INVALIDATIONS_TABLE_NAME,
+    poll_secs=GlobalArgs.INVALIDATION_POLL_SECS,
+    lookback_secs=GlobalArgs.INVALIDATION_LOOKBACK_SECS
+)
+_shared_cache = SharedCache(
+    client=RespClient.from_endpoint(
+        GlobalArgs.SHARED_CACHE_ENDPOINT,
+        timeout_secs=GlobalArgs.SHARED_CACHE_TIMEOUT_MS / 1000.0,
+        tls=GlobalArgs.SHARED_CACHE_TLS
+    ),
+    ttl_secs=GlobalArgs.SHARED_CACHE_TTL_SECS,
+    negative_ttl_secs=GlobalArgs.SHARED_CACHE_NEGATIVE_TTL_SECS,
+    breaker=CircuitBreaker(
+        failure_threshold=GlobalArgs.SHARED_CACHE_BREAKER_FAILURES,
+        reset_secs=GlobalArgs.SHARED_CACHE_BREAKER_RESET_SECS
+    )
+)
+_snapshot = TableSnapshot(
+    table_name=os.getenv("DDB_TABLE_NAME", "") if GlobalArgs.SNAPSHOT_ENABLED else "",
+    hash_key="id",
+    segments=GlobalArgs.SNAPSHOT_SCAN_SEGMENTS,
+    refresh_secs=GlobalArgs.SNAPSHOT_REFRESH_SECS,
+    max_items=GlobalArgs.SNAPSHOT_MAX_ITEMS
+)
+_catalogue = Catalogue(GlobalArgs.CATALOGUE_PATH)
+
+
+def _preload_ddb_model():
+    """ Helper to load the DynamoDB model files into the botocore loader cache, ahead of the first request """
+    loader = _botocore_session.get_component("data_loader")
+    for load in (
+        lambda: _botocore_session.get_service_model("dynamodb"),
+        lambda: loader.load_service_model("dynamodb", "endpoint-rule-set-1"),
+        lambda: loader.load_data("endpoints"),
+        lambda: loader.load_data("partitions"),
+    ):
+        try:
+            load()
+        except Exception as e:
+            # Not every botocore version ships every model file
+            logger.debug(f"ddb_model_preload_skipped:{str(e)}")
+
+
+def _ddb_client_config():
+    """ Tight timeouts, adaptive retries and kept-alive connections for the DynamoDB client """
+    conf = dict(
+        connect_timeout=GlobalArgs.DDB_CONNECT_TIMEOUT_SECS,
+        read_timeout=GlobalArgs.DDB_READ_TIMEOUT_SECS,
+        retries={
+            "mode": GlobalArgs.DDB_RETRY_MODE,
+            "max_attempts": GlobalArgs.DDB_MAX_ATTEMPTS
+        },
+        max_pool_connections=GlobalArgs.DDB_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True
+    )
+    try:
+        return Config(**conf)
+    except TypeError:
+        # tcp_keepalive needs botocore >= 1.27, older runtimes still reuse pooled connections
+        conf.pop("tcp_keepalive")
+        return Config(**conf)
+
+
+def _get_ddb_client():
+    global _ddb_client
+    if _ddb_client is None:
+        _ddb_client = _botocore_session.create_client(
+            "dynamodb", config=_ddb_client_config())
+    return _ddb_client
+
+
+def _get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = _botocore_session.create_client("s3", config=_ddb_client_config())
+    return _s3_client
+
+
+def _get_cache_refresh_token():
+    """ Read once, during init, a failed read is retried by the next refresh request """
+    global _cache_refresh_token
+    if not _cache_refresh_token and GlobalArgs.CACHE_REFRESH_TOKEN_SECRET_ARN:
+        try:
+            _cache_refresh_token = _botocore_session.create_client(
+                "secretsmanager", config=_ddb_client_config()).get_secret_value(
+                SecretId=GlobalArgs.CACHE_REFRESH_TOKEN_SECRET_ARN)["SecretString"]
+        except (BotoCoreError, ClientError) as e:
+            logger.warning(f"cache_refresh_token_read_failed:{str(e)}")
+    return _cache_refresh_token
+
+
+def _fetch_bloom_filter(etag=None):
+    """ `(data, etag)`, `(None, etag)` when the filter has not changed since `etag` """
+    kwargs = {"IfNoneMatch": etag} if etag else {}
+    try:
+        res = _get_s3_client().get_object(
+            Bucket=GlobalArgs.BLOOM_FILTER_BUCKET, Key=GlobalArgs.BLOOM_FILTER_KEY, **kwargs)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("304", "NotModified"):
+            return None, etag
+        raise
+    return res["Body"].read(), res["ETag"]
+
+
+def _added_keys_prefix():
+    """ One empty object per key added after the filter was built, `<filter key>.added/<id>` """
+    return f"{GlobalArgs.BLOOM_FILTER_KEY}.added/"
+
+
+def _fetch_added_keys():
+    prefix = _added_keys_prefix()
+    kwargs = {"Bucket": GlobalArgs.BLOOM_FILTER_BUCKET, "Prefix": prefix}
+    while True:
+        res = _get_s3_client().list_objects_v2(**kwargs)
+        for obj in res.get("Contents", []):
+            yield obj["Key"][len(prefix):]
+        if not res.get("IsTruncated"):
+            return
+        kwargs["ContinuationToken"] = res["NextContinuationToken"]
+
+
+_key_index = KeyIndex(
+    fetch=_fetch_bloom_filter if GlobalArgs.BLOOM_FILTER_BUCKET else None,
+    fetch_added=_fetch_added_keys,
+    refresh_secs=GlobalArgs.BLOOM_FILTER_REFRESH_SECS
+)
+
+
+def _load_key_index():
+    """ Until a filter is loaded every id is looked up, a failed refresh keeps the filter loaded before """
+    try:
+        if _key_index.refresh():
+            f = _key_index.filter
+            logger.info(
+                f"bloom_filter_loaded:{f.count} keys, {f.num_bits} bits, est_fp_rate:{f.estimated_fp_rate:.5f}")
+    except (BotoCoreError, ClientError, ValueError) as e:
+        logger.warning(f"bloom_filter_refresh_failed:{str(e)}")
+
+
+def _refresh_key_index():
+    """ Refreshes in the background, requests are answered by the filter loaded before meanwhile """
+    if _key_index.due():
+        threading.Thread(target=_load_key_index, daemon=True).start()
+
+
+def _publish_key(_hash_val):
+    """
+    Records a new key for the other containers, which add it to the filter on their next refresh.
+    An object per key, concurrent writers never overwrite each other.
+    """
+    _get_s3_client().put_object(
+        Bucket=GlobalArgs.BLOOM_FILTER_BUCKET, Key=f"{_added_keys_prefix()}{_hash_val}", Body=b"")
+
+
+def _load_snapshot():
+    """ A failed load keeps serving the snapshot loaded before, or the table until one loads """
+    try:
+        if _snapshot.load(_get_ddb_client()):
+            logger.info(f"snapshot_loaded:{len(_snapshot)} items, segments:{_snapshot.segments}")
+        else:
+            logger.warning(f"snapshot_too_large:over {_snapshot.max_items} items, lookups go to the table")
+    except (BotoCoreError, ClientError) as e:
+        logger.warning(f"snapshot_load_failed:{str(e)}")
+
+
+def _refresh_snapshot():
+    """ Reloads in the background, requests are served from the previous snapshot, or the table, meanwhile """
+    if _snapshot.due():
+        threading.Thread(target=_load_snapshot, daemon=True).start()
+
+
+def _open_catalogue():
+    """ A bad file, or bodies encoded with other options than the greeter's, are not served """
+    try:
+        _catalogue.open()
+    except (OSError, ValueError) as e:
+        logger.warning(f"catalogue_open_failed:{str(e)}")
+        return
+    if (_catalogue.plain_items, _catalogue.compact) != (GlobalArgs.PLAIN_JSON_ITEMS, GlobalArgs.COMPACT_JSON):
+        logger.warning(
+            f"catalogue_encoding_mismatch:plain_items:{_catalogue.plain_items}, compact:{_catalogue.compact}")
+        _catalogue.close()
+        return
+    # Movies changed since the build are left to the table, a warm container learns of later
+    # changes from the invalidations it polls, a new one only from the versions written
+    if not _invalidations.enabled:
+        logger.warning("catalogue_not_served:no invalidations table to tell the movies changed since the build")
+        _catalogue.close()
+        return
+    try:
+        stamps = read_version_stamps(
+            _get_ddb_client(), GlobalArgs.INVALIDATIONS_TABLE_NAME, os.getenv("DDB_TABLE_NAME", ""))
+    except (BotoCoreError, ClientError) as e:
+        logger.warning(f"catalogue_not_served:{str(e)}")
+        _catalogue.close()
+        return
+    for _hash_val, version in stamps.items():
+        if version > _catalogue_version(_hash_val):
+            _catalogue.shadow(_hash_val)
+    logger.info(f"catalogue_opened:{len(_catalogue)} movies, changed since the build:{_catalogue.shadowed}")
+
+
+def _catalogue_version(_hash_val):
+    """ Version of the movie in the catalogue, 0 when it is not in it """
+    found = _catalogue.get(_hash_val)
+    if found is None:
+        return 0
+    version = json.loads(found[0]).get(GlobalArgs.VERSION_ATTRIBUTE, 0)
+    return int(decode_attr(version) if isinstance(version, dict) else version)
+
+
+# Only the header is read, pages of the catalogue are loaded as they are used
+if _catalogue.enabled:
+    _open_catalogue()
+if GlobalArgs.DDB_CLIENT_INIT == "preload":
+    _preload_ddb_model()
+# The whole table is read during init, so the first requests are already served from memory
+if _snapshot.due():
+    _load_snapshot()
+# Loaded in the background from init on, the S3 reads do not hold up the first requests
+_refresh_key_index()
+_get_cache_refresh_token()
+# Provisioned containers are initialized ahead of traffic, building the client now costs no request anything
+if os.getenv("AWS_LAMBDA_INITIALIZATION_TYPE") == "provisioned-concurrency":
+    _get_ddb_client()
+# Provisioned containers may idle long before their first request, which is not init
+_init_end = time.perf_counter()
+
 
 def random_sleep(max_seconds=10):
     if bool(random.getrandbits(1)):
@@ -45,44 +402,566 @@ def random_sleep(max_seconds=10):
         logger.info(f"sleep_end_time:{str(datetime.datetime.now())}")
 
 
-def _get_item(table_name, _hash_key, _hash_val):
+def _parse_fields(fields_param):
+    """ `title,rating` into the sorted attribute names to return, `None` for the whole movie """
+    fields = {f.strip() for f in (fields_param or "").split(",") if f.strip()}
+    if not fields:
+        return None
+    bad = sorted(f for f in fields if not GlobalArgs.FIELD_NAME_PATTERN.fullmatch(f))
+    if bad:
+        raise ValueError(f"Invalid field names: {', '.join(bad)}")
+    if len(fields) > GlobalArgs.FIELDS_MAX:
+        raise ValueError(f"Choose at most {GlobalArgs.FIELDS_MAX} fields")
+    return tuple(sorted(fields.union(("id", GlobalArgs.VERSION_ATTRIBUTE))))
+
+
+def _projection(fields):
+    """ GetItem & BatchGetItem arguments to read only `fields`, names may be reserved words """
+    if not fields:
+        return {}
+    names = {f"#f{i}": f for i, f in enumerate(fields)}
+    return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
+
+
+def _consumed_capacity():
+    """ Extra arguments of every DynamoDB call, for the capacity units it consumed """
+    return {"ReturnConsumedCapacity": "TOTAL"} if GlobalArgs.RETURN_CONSUMED_CAPACITY else {}
+
+
+def _record_capacity(res, metric, count_metric, count):
+    """ `ConsumedCapacity` of a call, one or a list, and the items it read or wrote """
+    consumed = res.get("ConsumedCapacity")
+    if consumed is None:
+        return
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    _metrics.put(metric, sum(c.get("CapacityUnits", 0) for c in consumed), "Count")
+    _metrics.put(count_metric, count, "Count")
+
+
+def _project(item, fields):
+    """ Only the `fields` of an item, messages and missing items are left as they are """
+    if fields is None or not isinstance(item, dict):
+        return item
+    return {k: v for k, v in item.items() if k in fields}
+
+
+def _keeps_items():
+    """
+    Whole items are read when any cache keeps them, a cached item serves every projection.
+    DynamoDB bills a read by the size of the whole item either way, a projection only
+    saves the bytes sent back.
+    """
+    return _l1_cache.enabled or _shared_cache.enabled or _snapshot.enabled
+
+
+def _body_key(table_name, _hash_val, fields):
+    """ Encoded bodies of a projection are kept apart from those of the whole movie """
+    return (table_name, _hash_val) if fields is None else (table_name, _hash_val, fields)
+
+
+def _fetch_item(table_name, _hash_key, _hash_val, fields=None, consistent=False):
     # https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/GettingStarted.Python.03.html
+    with _metrics.timer("DdbLatency"):
+        res = _hedger.call(
+            lambda: _get_ddb_client().get_item(
+                TableName=table_name,
+                Key={
+                    _hash_key: {"S": _hash_val}
+                },
+                ConsistentRead=consistent,
+                **_projection(fields),
+                **_consumed_capacity()
+            )
+        )
+    _record_capacity(res, "ConsumedReadCapacity", "DdbItemsRead", 1)
+    return res.get("Item")
+
+
+def _error_message(e):
+    """ The DynamoDB error message, or what botocore says, say a read timeout """
+    return e.response["Error"]["Message"] if isinstance(e, ClientError) else str(e)
+
+
+def _get_item(table_name, _hash_key, _hash_val, fields=None, consistent=False):
+    """ The whole movie, or only its `fields`, `consistent` right after a write, when it is cached for long """
     _r = ""
+    found, item = _snapshot.lookup(_hash_val)
+    if found:
+        _metrics.put("SnapshotHit", 1, "Count")
+        return _project(item, fields)
     try:
-        res = _ddb_client.get_item(
-            TableName=table_name,
-            Key={
-                _hash_key: {"S": _hash_val}
-            }
+        if fields and not _keeps_items():
+            # Read for this request only, DynamoDB sends back just the fields
+            return _fetch_item(table_name, _hash_key, _hash_val, fields, consistent)
+        # in-container, then shared by all containers, then DynamoDB
+        _r = _l1_cache.get(
+            (table_name, _hash_val),
+            lambda: _shared_cache.get(
+                (table_name, _hash_val),
+                lambda: _fetch_item(table_name, _hash_key, _hash_val, consistent=consistent)
+            )
         )
-        _r = res["Item"]
+        # Changed, or new, since the snapshot was loaded
+        _snapshot.put(_hash_val, _r)
+    except (BotoCoreError, ClientError) as e:
+        _r = _error_message(e)
+        logger.error(str(e))
+    return _project(_r, fields)
+
+
+def _catalogue_body(table_name, _hash_val, fields):
+    """ `(encoded JSON, ETag)` of a movie in the catalogue, re-encoded for a projection, or `None` """
+    found = _catalogue.get(_hash_val) if _catalogue.serves(_hash_val) else None
+    if found is None or fields is None:
+        return found
+    return _catalogue_projection(table_name, _hash_val, fields, *found)
+
+
+@functools.lru_cache(maxsize=1024)
+def _catalogue_projection(table_name, _hash_val, fields, encoded, etag):
+    """ Kept per catalogue body, a new catalogue has other bodies """
+    item = json.loads(encoded)
+    return _body_encoder.encode(
+        _body_key(table_name, _hash_val, fields),
+        _project(encode_item(item) if _catalogue.plain_items else item, fields)
+    )
+
+
+def _invalidate(table_name, _hash_val):
+    _l1_cache.invalidate((table_name, _hash_val))
+    _shared_cache.invalidate((table_name, _hash_val))
+    _body_encoder.invalidate((table_name, _hash_val))
+    _snapshot.invalidate(_hash_val)
+    # Changed since the catalogue was built
+    _catalogue.shadow(_hash_val)
+
+
+def _apply_invalidation(table_name, _hash_val):
+    """ A changed movie may be a new one, the filter learns it before the next refresh """
+    _key_index.add(_hash_val)
+    _invalidate(table_name, _hash_val)
+
+
+def _is_cache_refresh(cache_control, token):
+    """ `Cache-Control: max-age=0` from the cache invalidator, anyone can send the header """
+    if "max-age=0" not in str(cache_control or "").replace(" ", "") or not _get_cache_refresh_token():
+        return False
+    return hmac.compare_digest(str(token or "").encode(), _cache_refresh_token.encode())
+
+
+def _poll_invalidations():
+    """ Drop the entries of movies changed since the last poll, a failed poll is retried on the next one """
+    try:
+        n = _invalidations.poll(_get_ddb_client(), _apply_invalidation)
+    except (BotoCoreError, ClientError) as e:
+        logger.warning(f"invalidation_poll_failed:{str(e)}")
+        return
+    logger.debug(f"invalidations_applied:{n}")
+
+
+def _refresh_invalidations():
+    """ Polls in the background, requests are not held up by the Query """
+    if (_l1_cache.enabled or _snapshot.enabled or _catalogue.loaded) and _invalidations.due():
+        threading.Thread(target=_poll_invalidations, daemon=True).start()
+
+
+def _stamp_version(table_name, _hash_val, version):
+    """
+    Recorded ahead of the write, containers started later check their catalogue against it.
+    A write that then fails only leaves the movie to the table.
+    """
+    if not GlobalArgs.INVALIDATIONS_TABLE_NAME:
+        return
+    try:
+        with _metrics.timer("DdbLatency"):
+            _get_ddb_client().update_item(**version_stamp(
+                GlobalArgs.INVALIDATIONS_TABLE_NAME, table_name, _hash_val, version))
     except ClientError as e:
-        _r = e.response["Error"]["Message"]
+        # A concurrent writer already recorded a later version
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+
+def _put_item(table_name, _hash_key, _hash_val, movie):
+    """
+    Writes the movie with its version bumped, conditional on the version read, so concurrent
+    writers never reuse a version. The Streams consumer invalidates the caches of every other container.
+    """
+    v = GlobalArgs.VERSION_ATTRIBUTE
+    for _ in range(GlobalArgs.PUT_MAX_ATTEMPTS):
+        with _metrics.timer("DdbLatency"):
+            res = _get_ddb_client().get_item(
+                TableName=table_name,
+                Key={_hash_key: {"S": _hash_val}},
+                ConsistentRead=True,
+                ProjectionExpression="#v",
+                ExpressionAttributeNames={"#v": v},
+                **_consumed_capacity()
+            )
+        _record_capacity(res, "ConsumedReadCapacity", "DdbItemsRead", 1)
+        current = res.get("Item") or {}
+        version = int(decode_attr(current[v])) if v in current else 0
+        _stamp_version(table_name, _hash_val, version + 1)
+        if not version and _key_index.enabled:
+            # Ahead of the write, the movie is never in the table while other containers rule it out
+            _publish_key(_hash_val)
+        item = encode_item(dict(movie, **{
+            _hash_key: _hash_val, v: version + 1, InvalidationArgs.WRITER_ATTRIBUTE: InvalidationArgs.WRITER}))
+        cond = {"ConditionExpression": "attribute_not_exists(#v)"}
+        if version:
+            cond = {
+                "ConditionExpression": "#v = :v",
+                "ExpressionAttributeValues": {":v": current[v]}
+            }
+        try:
+            with _metrics.timer("DdbLatency"):
+                res = _get_ddb_client().put_item(
+                    TableName=table_name, Item=item, ExpressionAttributeNames={"#v": v},
+                    **cond, **_consumed_capacity())
+            _record_capacity(res, "ConsumedWriteCapacity", "DdbItemsWritten", 1)
+            break
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            logger.warning(f"put_item_version_conflict:{_hash_val}, version:{version}")
+    else:
+        raise RuntimeError(f"Movie id {_hash_val} is being updated concurrently, try again")
+    _invalidate(table_name, _hash_val)
+    _l1_cache.put((table_name, _hash_val), item)
+    _shared_cache.put((table_name, _hash_val), item)
+    _snapshot.put(_hash_val, item)
+    _key_index.add(_hash_val)
+    return item
+
+
+def _handle_put(event, table_name):
+    """ PUT /movie/{id}, the body is the movie as plain JSON """
+    m_id = str((event.get("pathParameters") or {}).get("id", ""))
+    if not m_id.isdigit() or int(m_id) >= 10:
+        return 400, "BackEnd-Lambda Response: Choose Movie id between 0 and 9"
+    try:
+        body = event.get("body") or ""
+        if event.get("isBase64Encoded"):
+            body = base64.b64decode(body)
+        movie = json.loads(body)
+    except ValueError:
+        return 400, "BackEnd-Lambda Response: Movie must be a JSON object"
+    if not isinstance(movie, dict):
+        return 400, "BackEnd-Lambda Response: Movie must be a JSON object"
+    if str(movie.get("id", m_id)) != m_id:
+        return 400, f"BackEnd-Lambda Response: Movie id in the body does not match {m_id}"
+    # The version is owned by the write path
+    movie.pop(GlobalArgs.VERSION_ATTRIBUTE, None)
+    try:
+        return 200, _put_item(table_name, "id", m_id, movie)
+    except ValueError as e:
+        return 400, f"BackEnd-Lambda Response: {str(e)}"
+    except RuntimeError as e:
+        return 409, f"BackEnd-Lambda Response: {str(e)}"
+    except (BotoCoreError, ClientError) as e:
         logger.error(str(e))
-    return _r
+        return 500, _error_message(e)
+
+
+def _fetch_items(table_name, _hash_key, _hash_vals, fields=None):
+    """ BatchGetItem in chunks of 100 keys, retrying UnprocessedKeys with jittered exponential backoff """
+    items = {}
+    for i in range(0, len(_hash_vals), GlobalArgs.BATCH_GET_CHUNK_SIZE):
+        req = {
+            table_name: dict({
+                "Keys": [
+                    {_hash_key: {"S": v}} for v in _hash_vals[i:i + GlobalArgs.BATCH_GET_CHUNK_SIZE]
+                ]
+            }, **_projection(fields))
+        }
+        attempt = 0
+        while req:
+            with _metrics.timer("DdbLatency"):
+                res = _get_ddb_client().batch_get_item(RequestItems=req, **_consumed_capacity())
+            _record_capacity(
+                res, "ConsumedReadCapacity", "DdbItemsRead",
+                sum(len(r["Keys"]) for r in req.values()) - sum(
+                    len(r["Keys"]) for r in (res.get("UnprocessedKeys") or {}).values()))
+            for item in res.get("Responses", {}).get(table_name, []):
+                items[item[_hash_key]["S"]] = item
+            req = res.get("UnprocessedKeys")
+            if req:
+                attempt += 1
+                if attempt >= GlobalArgs.BATCH_GET_MAX_ATTEMPTS:
+                    raise RuntimeError(
+                        f"UnprocessedKeys remain after {attempt} attempts")
+                time.sleep(random.uniform(
+                    0, GlobalArgs.BATCH_GET_BASE_BACKOFF_SECS * (2 ** attempt)))
+                logger.warning(f"batch_get_item_retry:{attempt}")
+    return items
+
+
+def _get_items(table_name, _hash_key, _hash_vals, fields=None):
+    """ Returns items, or their `fields`, in the order of `_hash_vals`, `None` for ids that do not exist """
+    # Ids the bloom filter rules out are never looked up
+    maybe_vals = [v for v in _hash_vals if _key_index.might_contain(v)]
+    if _key_index.loaded:
+        _metrics.put("BloomFilterNegative", len(_hash_vals) - len(maybe_vals), "Count")
+    res = {}
+    for v in maybe_vals:
+        found, item = _snapshot.lookup(v)
+        if found:
+            res[(table_name, v)] = item
+    if _snapshot.loaded:
+        _metrics.put("SnapshotHit", len(res), "Count")
+    try:
+        if fields and not _keeps_items():
+            # Read for this request only, DynamoDB sends back just the fields
+            loaded = {
+                (table_name, k): v for k, v in _fetch_items(
+                    table_name, _hash_key, [v for v in maybe_vals if (table_name, v) not in res], fields).items()
+            }
+        else:
+            loaded = _l1_cache.get_many(
+                [(table_name, v) for v in maybe_vals if (table_name, v) not in res],
+                lambda keys: _shared_cache.get_many(
+                    keys,
+                    lambda missing: {
+                        (table_name, k): v for k, v in _fetch_items(
+                            table_name, _hash_key, [v for _, v in missing]).items()
+                    }
+                )
+            )
+    except (BotoCoreError, ClientError, RuntimeError) as e:
+        logger.error(str(e))
+        return str(e)
+    for (_, v), item in loaded.items():
+        _snapshot.put(v, item)
+    res.update(loaded)
+    if _key_index.loaded:
+        _metrics.put("BloomFilterFalsePositive", sum(res.get((table_name, v)) is None for v in maybe_vals), "Count")
+    return [_project(res.get((table_name, v)), fields) for v in _hash_vals]
+
+
+def _parse_ids(ids_param):
+    """ Split `1,4,7` into unique ids, keeping the order they were requested in """
+    ids = []
+    for m_id in ids_param.split(","):
+        m_id = m_id.strip()
+        if m_id and m_id not in ids:
+            ids.append(m_id)
+    return ids
+
+
+def _emit_metrics(start, hedges_fired, hedges_won):
+    global _cold_start, _invalidations_counted
+    if _cold_start:
+        _metrics.put("InitDuration", (_init_end - _init_start) * 1000.0, "Milliseconds")
+        # on-demand or provisioned-concurrency, a provisioned init is paid ahead of the request
+        _metrics.set_property(
+            "initialization_type", os.getenv("AWS_LAMBDA_INITIALIZATION_TYPE", "on-demand"))
+    _metrics.put("ColdStart", int(_cold_start), "Count")
+    _cold_start = False
+    if _l1_cache.enabled:
+        c = _l1_cache.stats.current
+        _metrics.put("L1CacheHit", c["hit"] + c["stale_hit"] + c["negative_hit"], "Count")
+        _metrics.put("L1CacheMiss", c["miss"], "Count")
+        _metrics.put("L1CacheEvict", c["evict"], "Count")
+        _metrics.set_property("l1_cache_size", len(_l1_cache))
+    if _shared_cache.enabled:
+        c = _shared_cache.stats.current
+        _metrics.put("SharedCacheHit", c["hit"] + c["negative_hit"], "Count")
+        _metrics.put("SharedCacheMiss", c["miss"], "Count")
+        _metrics.put("SharedCacheError", c["error"], "Count")
+        _metrics.put("SharedCacheBypass", c["bypass"], "Count")
+        _metrics.set_property("shared_cache_breaker", _shared_cache.breaker.state)
+    if _key_index.loaded:
+        _metrics.set_property("bloom_filter_est_fp_rate", round(_key_index.filter.estimated_fp_rate, 6))
+    if _invalidations.enabled:
+        # Applied in the background, counted by the next invocation to end
+        _metrics.put("L1CacheInvalidations", _invalidations.applied - _invalidations_counted, "Count")
+        _invalidations_counted = _invalidations.applied
+    if _snapshot.loaded:
+        _metrics.set_property("snapshot_items", len(_snapshot))
+        _metrics.set_property("snapshot_age_secs", round(_snapshot.age_secs(), 1))
+    if _hedger.enabled:
+        _metrics.put("HedgesFired", _hedger.hedges_fired - hedges_fired, "Count")
+        _metrics.put("HedgesWon", _hedger.hedges_won - hedges_won, "Count")
+        _metrics.set_property("hedge_delay_ms", (_hedger.hedge_delay() or 0) * 1000.0)
+    _metrics.put("HandlerDuration", (time.perf_counter() - start) * 1000.0, "Milliseconds")
+    if _metrics.enabled:
+        _metrics.flush()
+    elif _l1_cache.enabled:
+        logger.info(json.dumps({
+            "l1_cache": _l1_cache.stats.current,
+            "l1_cache_total": _l1_cache.stats.total,
+            "l1_cache_size": len(_l1_cache)
+        }))
+    if not _metrics.enabled and _shared_cache.enabled:
+        logger.info(json.dumps({
+            "shared_cache": _shared_cache.stats.current,
+            "shared_cache_breaker": _shared_cache.breaker.state
+        }))
+
+
+def _header(event, name):
+    """ Header of proxy requests, names are case insensitive """
+    name = name.lower()
+    return next((v for k, v in (event.get("headers") or {}).items() if k.lower() == name), "") or ""
+
+
+def _if_none_match(event):
+    """ Mapped by the request template, or a header of proxy requests """
+    val = event.get("if_none_match")
+    if val is None:
+        val = _header(event, "If-None-Match")
+    return val or ""
+
+
+def _not_modified(if_none_match, etag):
+    """ If-None-Match uses the weak comparison, `W/"x"` matches `"x"` """
+    if not (etag and if_none_match):
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (t.strip().replace("W/", "", 1) for t in if_none_match.split(","))
+
+
+def _respond(event, start, hedges, status, field, encoded, etag):
+    """ `304 Not Modified`, without a body, when the client already has this ETag """
+    # Only proxy requests carry Accept & Accept-Encoding, the others get JSON
+    rep = _negotiator.choose(_header(event, "Accept"), _header(event, "Accept-Encoding"))
+    rep_etag = rep.etag(etag)
+    headers = {"Cache-Control": GlobalArgs.CACHE_CONTROL}
+    if _negotiator.enabled:
+        headers["Vary"] = "Accept, Accept-Encoding"
+    if rep_etag:
+        headers["ETag"] = rep_etag
+    # The `ts` of the body, as seconds since the epoch
+    now = time.time()
+    if GlobalArgs.SERVED_BY_HEADERS:
+        headers["X-Served-By"] = _served_by
+        headers["X-Generated-At"] = f"{now:.6f}"
+    is_base64 = False
+    if status == 200 and _not_modified(_if_none_match(event), rep_etag):
+        status = 304
+        body = ""
+        _metrics.put("NotModified", 1, "Count")
+    else:
+        with _metrics.timer("SerializationTime"):
+            body, rep_headers, is_base64 = _negotiator.render(
+                rep, field, encoded, etag, _body_encoder.timestamp(now))
+        headers.update(rep_headers)
+        if rep.binary:
+            _metrics.set_property("representation", f"{rep.media_type};{rep_headers.get('Content-Encoding', 'identity')}")
+    _emit_metrics(start, *hedges)
+    return {
+        "statusCode": status,
+        "headers": headers,
+        "body": body,
+        "isBase64Encoded": is_base64
+    }
 
 
 def lambda_handler(event, context):
+    start = time.perf_counter()
     items = ""
+    # Kept out of the logs
+    refresh_token = event.pop("cache_refresh_token", "")
     logger.info(f"rcvd_event:{event}")
+    _l1_cache.stats.reset_current()
+    _shared_cache.stats.reset_current()
+    _metrics.reset()
+    hedges = (_hedger.hedges_fired, _hedger.hedges_won)
 
     table_name = os.environ.get("DDB_TABLE_NAME")
+    _refresh_invalidations()
+    _refresh_key_index()
+    _refresh_snapshot()
+
+    if event.get("httpMethod") == "PUT":
+        _metrics.set_dimension("Route", "PUT /movie/{id}")
+        status, item = _handle_put(event, table_name)
+        with _metrics.timer("SerializationTime"):
+            encoded, etag = _body_encoder.encode(
+                (table_name, str((event.get("pathParameters") or {}).get("id"))), item)
+        return _respond({}, start, hedges, status, "movie", encoded, etag)
+
+    # Batch requests arrive through the proxy integration: GET /movie?ids=1,4,7
+    ids_param = (event.get("queryStringParameters") or {}).get("ids")
+    # ?fields=title,rating, mapped by the request template, or in the query string of proxy requests
+    try:
+        fields = _parse_fields(event.get("fields") or (event.get("queryStringParameters") or {}).get("fields"))
+    except ValueError as e:
+        _metrics.set_dimension("Route", "/movie?ids" if ids_param else "/movie/{id}" if event.get("id") else "/movie")
+        with _metrics.timer("SerializationTime"):
+            encoded, etag = _body_encoder.encode(None, f"BackEnd-Lambda Response: {str(e)}")
+        return _respond(event, start, hedges, 400, "movies" if ids_param else "movie", encoded, etag)
+
+    if ids_param:
+        _metrics.set_dimension("Route", "/movie?ids")
+        ids = _parse_ids(ids_param)
+        if len(ids) > GlobalArgs.BATCH_MAX_IDS:
+            items = f"BackEnd-Lambda Response: Choose at most {GlobalArgs.BATCH_MAX_IDS} movie ids"
+            with _metrics.timer("SerializationTime"):
+                encoded, etag = _body_encoder.encode_batch([], items)
+            return _respond(event, start, hedges, 400, "movies", encoded, etag)
+        # Pre-encoded in the catalogue, the rest are looked up
+        served = {}
+        if _catalogue.loaded:
+            for v in ids:
+                e = _catalogue_body(table_name, v, fields)
+                if e is not None:
+                    served[v] = e
+            _metrics.put("CatalogueHit", len(served), "Count")
+        rest = [v for v in ids if v not in served]
+        items = _get_items(table_name, "id", rest, fields) if rest else []
+        with _metrics.timer("SerializationTime"):
+            if isinstance(items, list):
+                found = dict(zip(rest, items))
+                encoded, etag = _body_encoder.join_batch(
+                    served[v] if v in served
+                    else None if found[v] is None
+                    else _body_encoder.encode(_body_key(table_name, v, fields), found[v])
+                    for v in ids
+                )
+            else:
+                encoded, etag = _body_encoder.encode_batch([], items)
+        return _respond(event, start, hedges, 200, "movies", encoded, etag)
 
     if event.get("id"):
+        _metrics.set_dimension("Route", "/movie/{id}")
         m_id = str(event.get("id"))
     else:
-        m_id = str(random.randint(0, 9))
+        _metrics.set_dimension("Route", "/movie")
+        # Any movie in the catalogue, or the table with a snapshot
+        m_id = _catalogue.random_key() or _snapshot.random_key() or str(random.randint(0, 9))
 
-    if int(m_id) < 10:
-        item = _get_item(table_name, "id", m_id)
-    else:
+    # The stage cache keeps what is read now for its whole TTL, an eventually consistent read
+    # right after the write could put the old movie back
+    cache_refresh = _is_cache_refresh(event.get("cache_control"), refresh_token)
+    if cache_refresh:
+        _invalidate(table_name, m_id)
+
+    # Pre-encoded at build time, neither DynamoDB nor the encoder are involved
+    found = _catalogue_body(table_name, m_id, fields)
+    if found is not None:
+        _metrics.put("CatalogueHit", 1, "Count")
+        return _respond(event, start, hedges, 200, "movie", *found)
+
+    status = 200
+    # With the bloom filter of the table keys, or the whole table, any id can be asked for
+    if not (_key_index.loaded or _snapshot.loaded) and not (m_id.isdigit() and int(m_id) < 10):
         item = "BackEnd-Lambda Response: Choose Movie id between 0 and 9"
+    elif not _key_index.might_contain(m_id):
+        # Definitely not in the table, DynamoDB is not asked
+        _metrics.put("BloomFilterNegative", 1, "Count")
+        item = None
+    else:
+        item = _get_item(table_name, "id", m_id, fields, consistent=cache_refresh)
+        if _key_index.loaded:
+            _metrics.put("BloomFilterFalsePositive", int(item is None), "Count")
+    if item is None:
+        status = 404
+        item = f"BackEnd-Lambda Response: Movie id {m_id} not found"
 
     # random_sleep(GlobalArgs.RANDOM_SLEEP_SECS)
-    return {
-        "statusCode": 200,
-        "body": (f'{{"message": "Hello Miztiikal World, How is it going?",'
-                 f'"movie": {json.dumps(item)},'
-                 f'"ts": "{str(datetime.datetime.now())}"'
-                 f'}}')
-    }
+    with _metrics.timer("SerializationTime"):
+        encoded, etag = _body_encoder.encode(_body_key(table_name, m_id, fields), item)
+    return _respond(event, start, hedges, status, "movie", encoded, etag)
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+import json
+import socket
+import ssl
+import threading
+import time
+
+from l1_cache import CacheStats
+
+
+class RespError(Exception):
+    """ An error reply from the server """
+
+
+class RespClient:
+    """
+    Helper to talk RESP, the Redis protocol, to ElastiCache or any Redis-compatible server,
+    with commands pipelined over a single kept-alive connection. Reconnects on the next call
+    after a failure.
+    """
+
+    def __init__(self, host, port=6379, timeout_secs=0.05, tls=False):
+        self.host = host
+        self.port = int(port)
+        self.timeout_secs = timeout_secs
+        self.tls = tls
+        self._sock = None
+        self._rfile = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_endpoint(cls, endpoint, **kwargs):
+        """ `host:port`, `None` for an empty endpoint """
+        if not endpoint:
+            return None
+        host, _, port = endpoint.rpartition(":") if ":" in endpoint else (endpoint, "", "6379")
+        return cls(host, int(port), **kwargs)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout_secs)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.tls:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+        self._sock = sock
+        self._rfile = sock.makefile("rb")
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._rfile.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._rfile = None
+
+    @staticmethod
+    def _encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def _read_reply(self):
+        line = self._rfile.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            return RespError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            return self._rfile.read(n + 2)[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read_reply() for _ in range(n)]
+        raise ConnectionError(f"Unexpected reply: {line[:32]!r}")
+
+    def pipeline(self, commands):
+        """ Sends all `commands` in one write and returns their replies, error replies as `RespError` """
+        if not commands:
+            return []
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._sock.sendall(b"".join(self._encode(c) for c in commands))
+                return [self._read_reply() for _ in commands]
+            except (OSError, ValueError):
+                # Timeouts included, a half read reply leaves the connection unusable
+                self.close()
+                raise
+
+    def execute(self, *args):
+        res = self.pipeline([args])[0]
+        if isinstance(res, RespError):
+            raise res
+        return res
+
+
+class CircuitBreaker:
+    """
+    Helper to stop calling a failing dependency: opens after `failure_threshold` consecutive
+    failures, then lets a single trial call through every `reset_secs` until one succeeds
+    """
+
+    def __init__(self, failure_threshold=3, reset_secs=30, clock=time.monotonic):
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.reset_secs = reset_secs
+        self.failures = 0
+        self.opened_count = 0
+        self._opened_at = None
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self._clock() >= self._opened_at + self.reset_secs else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._clock() >= self._opened_at + self.reset_secs:
+                # The trial call, everyone else keeps bypassing until it reports back
+                self._opened_at = self._clock()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    self.opened_count += 1
+                self._opened_at = self._clock()
+
+
+class SharedCacheStats(CacheStats):
+    """ `bypass` counts lookups sent straight to the loader, the breaker was open or the call failed """
+
+    FIELDS = ("hit", "negative_hit", "miss", "error", "bypass")
+
+
+class SharedCache:
+    """
+    Read-through cache shared by every container, in front of DynamoDB
+
+    Items are kept as DynamoDB JSON for `ttl_secs`, missing items for `negative_ttl_secs`.
+    Lookups are a single pipelined `MGET`, fills a pipeline of `SET .. EX`. Any error of the
+    cache server counts against the circuit breaker and falls back to the loader, so a slow or
+    down cache costs at most `timeout_secs` per call until the breaker opens.
+    """
+
+    def __init__(self, client=None, ttl_secs=60, negative_ttl_secs=0, key_prefix="greeter:", breaker=None):
+        self.client = client
+        self.ttl_secs = ttl_secs
+        self.negative_ttl_secs = negative_ttl_secs
+        self.key_prefix = key_prefix
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = SharedCacheStats()
+
+    @property
+    def enabled(self):
+        return self.client is not None and self.ttl_secs > 0
+
+    def _key(self, key):
+        return self.key_prefix + "#".join(str(k) for k in key)
+
+    def _call(self, commands):
+        """ `None` when the breaker is open or the call failed """
+        if not self.breaker.allow():
+            return None
+        try:
+            res = self.client.pipeline(commands)
+        except (OSError, ValueError):
+            self.stats.incr("error")
+            self.breaker.record_failure()
+            return None
+        self.breaker.record_success()
+        return res
+
+    def get(self, key, loader):
+        """ Return the value for `key`, calling `loader()` on a miss """
+        return self.get_many([key], lambda keys: {key: loader()})[key]
+
+    def get_many(self, keys, loader):
+        """ Return a dict of values for `keys`, calling `loader(missing_keys)` once for the misses """
+        keys = list(keys)
+        if not keys:
+            return {}
+        if not self.enabled:
+            loaded = loader(keys)
+            return {key: loaded.get(key) for key in keys}
+        res = {}
+        replies = self._call([["MGET"] + [self._key(k) for k in keys]])
+        if replies is None or not isinstance(replies[0], list):
+            self.stats.incr("bypass", len(keys))
+            missing = keys
+        else:
+            missing = []
+            for key, raw in zip(keys, replies[0]):
+                doc = self._decode(raw)
+                if doc is None:
+                    self.stats.incr("miss")
+                    missing.append(key)
+                    continue
+                res[key] = doc.get("item")
+                self.stats.incr("hit" if res[key] is not None else "negative_hit")
+        if missing:
+            loaded = loader(missing)
+            for key in missing:
+                res[key] = loaded.get(key)
+            self.put_many({key: res[key] for key in missing})
+        return res
+
+    @staticmethod
+    def _decode(raw):
+        if raw is None or isinstance(raw, RespError):
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def put_many(self, vals):
+        """ Fills, `None` values are cached as missing items for `negative_ttl_secs` """
+        if not self.enabled:
+            return
+        commands = []
+        for key, val in vals.items():
+            ttl = self.negative_ttl_secs if val is None else self.ttl_secs
+            if ttl > 0:
+                commands.append([
+                    "SET", self._key(key), json.dumps({"item": val}, separators=(",", ":")),
+                    "EX", max(int(ttl), 1)
+                ])
+        if commands:
+            self._call(commands)
+
+    def put(self, key, val):
+        self.put_many({key: val})
+
+    def invalidate(self, key):
+        if self.enabled:
+            self._call([["DEL", self._key(key)]])
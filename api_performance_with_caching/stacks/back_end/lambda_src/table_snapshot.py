@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Marks a key changed in the table, to be read from it until the next reload
+_STALE = object()
+
+
+class TableSnapshot:
+    """
+    Whole table kept in the container, for small, hot catalogues
+
+    Loaded with a parallel Scan of `segments` segments, and reloaded every `refresh_secs`. Keys
+    changed while a reload runs (`invalidate`, `put`) are applied again on top of it, so a reload
+    never brings back an older item. Invalidated keys are not served until they are `put` back.
+    Tables of more than `max_items` items are not kept, their lookups go to the table as before.
+    """
+
+    def __init__(self, table_name, hash_key="id", segments=4, refresh_secs=300, max_items=10000,
+                 clock=time.monotonic):
+        self.table_name = table_name
+        self.hash_key = hash_key
+        self.segments = max(int(segments), 1)
+        self.refresh_secs = refresh_secs
+        self.max_items = max_items
+        self.too_large = False
+        self.loads = 0
+        self.loaded_at = None
+        self._items = None
+        self._keys = ()
+        self._stale = set()
+        self._changes = {}
+        self._next_refresh = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.table_name) and not self.too_large
+
+    @property
+    def loaded(self):
+        return self._items is not None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def age_secs(self):
+        return None if self.loaded_at is None else self._clock() - self.loaded_at
+
+    def lookup(self, key):
+        """ `(found, item)`, keys not found, or changed since the load, must be read from the table """
+        items = self._items
+        if items is None or key in self._stale:
+            return False, None
+        item = items.get(key)
+        return item is not None, item
+
+    def random_key(self, rnd=random):
+        keys = self._keys
+        return rnd.choice(keys) if keys else None
+
+    def due(self):
+        """ `True` at most once every `refresh_secs`, for the one caller that is to load """
+        with self._lock:
+            now = self._clock()
+            if not self.enabled or now < self._next_refresh:
+                return False
+            self._next_refresh = now + self.refresh_secs
+            return True
+
+    def invalidate(self, key):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._stale.add(key)
+            self._changes[key] = (self._clock(), _STALE)
+
+    def put(self, key, item):
+        """ The item read or written, `None` when it is not in the table """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._changes[key] = (self._clock(), item)
+            if self._items is not None:
+                self._apply(self._items, key, item)
+
+    def _apply(self, items, key, item):
+        """ Callers must hold the lock """
+        if item is _STALE:
+            self._stale.add(key)
+            return
+        self._stale.discard(key)
+        if item is None:
+            if items.pop(key, None) is not None:
+                self._keys = tuple(items)
+        else:
+            if key not in items:
+                self._keys += (key,)
+            items[key] = item
+
+    def _scan_segment(self, client, segment):
+        items = []
+        kwargs = dict(TableName=self.table_name, Segment=segment, TotalSegments=self.segments)
+        while True:
+            res = client.scan(**kwargs)
+            items.extend(res.get("Items", []))
+            if len(items) > self.max_items or not res.get("LastEvaluatedKey"):
+                return items
+            kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+    def load(self, client):
+        """ Returns `False` when the table is too large to keep, errors are left to the caller """
+        started = self._clock()
+        with ThreadPoolExecutor(max_workers=self.segments) as pool:
+            segments = list(pool.map(
+                lambda s: self._scan_segment(client, s), range(self.segments)))
+        if sum(len(s) for s in segments) > self.max_items:
+            with self._lock:
+                self.too_large = True
+                self._items = None
+                self._keys = ()
+                self._changes.clear()
+            return False
+        items = {item[self.hash_key]["S"]: item for s in segments for item in s}
+        with self._lock:
+            self._stale = set()
+            self._keys = tuple(items)
+            for key, (when, item) in list(self._changes.items()):
+                if when < started:
+                    # Already in what the scan read
+                    del self._changes[key]
+                else:
+                    self._apply(items, key, item)
+            self._items = items
+            self.loaded_at = self._clock()
+            self.loads += 1
+        return True
@@ -0,0 +1,55 @@
+import json
+
+from aws_cdk import aws_lambda as _lambda
+
+
+class GlobalArgs:
+    """
+    Helper to define global statics
+    """
+
+    OWNER = "MystiqueAutomation"
+    CONTEXT_KEY = "greeter_provisioned_concurrency"
+    DEFAULT_TARGET_UTILIZATION = 0.7
+
+
+def get_provisioned_concurrency(scope, stack_id):
+    """
+    Provisioned concurrency of the greeter alias for `stack_id`, `None` when it is off, e.g.
+    `-c greeter_provisioned_concurrency='{"cached-api": {"min": 5, "max": 40, "target_utilization": 0.7}}'`
+    """
+    val = scope.node.try_get_context(GlobalArgs.CONTEXT_KEY)
+    conf = (json.loads(val) if isinstance(val, str) else val or {}).get(stack_id)
+    if not conf or not int(conf.get("min", 0)):
+        return None
+    conf = {
+        "min": int(conf["min"]),
+        "max": int(conf.get("max", conf["min"])),
+        "target_utilization": float(conf.get("target_utilization", GlobalArgs.DEFAULT_TARGET_UTILIZATION))
+    }
+    if conf["max"] < conf["min"]:
+        raise ValueError(
+            f"Provisioned concurrency of {stack_id}: max {conf['max']} is below min {conf['min']}")
+    return conf
+
+
+def add_provisioned_concurrency(alias: _lambda.Alias, conf: dict, reserved_concurrency: int, reserved_by: str = ""):
+    """
+    Scales provisioned concurrency between `min` and `max`, tracking the utilization target,
+    so scale-outs land on initialized containers instead of cold starts. `reserved_concurrency`
+    is the least the function is ever given, `reserved_by` where it comes from.
+    """
+    if conf["max"] > reserved_concurrency:
+        raise ValueError(
+            f"Provisioned concurrency max {conf['max']} exceeds the reserved concurrency {reserved_concurrency}"
+            + (f" of {reserved_by}" if reserved_by else ""))
+    if conf["max"] == conf["min"]:
+        return None
+    scaling = alias.add_auto_scaling(
+        min_capacity=conf["min"],
+        max_capacity=conf["max"]
+    )
+    scaling.scale_on_utilization(
+        utilization_target=conf["target_utilization"]
+    )
+    return scaling
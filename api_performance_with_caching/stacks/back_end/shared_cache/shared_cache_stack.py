@@ -0,0 +1,145 @@
+import json
+
+from aws_cdk import aws_ec2 as _ec2
+from aws_cdk import aws_elasticache as _elasticache
+from aws_cdk import aws_lambda as _lambda
+
+from aws_cdk import core
+
+
+class GlobalArgs:
+    """
+    Helper to define global statics
+    """
+
+    OWNER = "MystiqueAutomation"
+    ENVIRONMENT = "production"
+    REPO_NAME = "api-performance-with-caching"
+    SOURCE_INFO = f"https://github.com/miztiik/{REPO_NAME}"
+    VERSION = "2020_08_20"
+    MIZTIIK_SUPPORT_EMAIL = ["mystique@example.com", ]
+    CONTEXT_KEY = "shared_cache"
+    DEFAULTS = {
+        "node_type": "cache.t3.small",
+        "replicas": 0,
+        "ttl_secs": 60,
+        "negative_ttl_secs": 10,
+        "timeout_ms": 50
+    }
+
+
+def get_shared_cache_conf(scope):
+    """
+    Settings of the shared cache, `None` when it is off, e.g.
+    `-c shared_cache='{"node_type": "cache.r6g.large", "replicas": 1, "ttl_secs": 300}'`
+    """
+    val = scope.node.try_get_context(GlobalArgs.CONTEXT_KEY)
+    if isinstance(val, str):
+        val = json.loads(val) if val.strip().startswith("{") else val.lower() == "true"
+    if not val:
+        return None
+    return dict(GlobalArgs.DEFAULTS, **(val if isinstance(val, dict) else {}))
+
+
+class SharedCacheStack(core.Construct):
+    """
+    Redis-compatible ElastiCache replication group shared by every greeter container. The greeter
+    has to run in the VPC of the cache, which reaches DynamoDB and S3 through gateway endpoints.
+    """
+
+    def __init__(
+        self,
+        scope: core.Construct,
+        id: str,
+        conf: dict,
+        **kwargs
+    ) -> None:
+        super().__init__(scope, id)
+        self.conf = conf
+
+        # No NAT, the greeter only talks to the cache, DynamoDB and S3
+        self.vpc = _ec2.Vpc(
+            self,
+            "sharedCacheVpc",
+            max_azs=2,
+            nat_gateways=0,
+            subnet_configuration=[
+                _ec2.SubnetConfiguration(
+                    name="isolated",
+                    subnet_type=_ec2.SubnetType.PRIVATE_ISOLATED,
+                    cidr_mask=24
+                )
+            ],
+            gateway_endpoints={
+                "DynamoDB": _ec2.GatewayVpcEndpointOptions(
+                    service=_ec2.GatewayVpcEndpointAwsService.DYNAMODB
+                ),
+                # The bloom filter of the table keys
+                "S3": _ec2.GatewayVpcEndpointOptions(
+                    service=_ec2.GatewayVpcEndpointAwsService.S3
+                )
+            }
+        )
+
+        self.client_sg = _ec2.SecurityGroup(
+            self,
+            "sharedCacheClientSg",
+            vpc=self.vpc,
+            description="Greeter containers, allowed to reach the shared cache"
+        )
+        cache_sg = _ec2.SecurityGroup(
+            self,
+            "sharedCacheSg",
+            vpc=self.vpc,
+            description="Shared cache, reachable from the greeter containers only"
+        )
+        cache_sg.add_ingress_rule(
+            peer=self.client_sg,
+            connection=_ec2.Port.tcp(6379),
+            description="Redis from the greeter"
+        )
+
+        cache_subnet_group = _elasticache.CfnSubnetGroup(
+            self,
+            "sharedCacheSubnetGroup",
+            description="Subnets of the shared cache",
+            subnet_ids=[s.subnet_id for s in self.vpc.isolated_subnets]
+        )
+
+        # A replica per AZ fails over automatically, lookups only ever go to the primary
+        replicas = int(conf["replicas"])
+        self.replication_group = _elasticache.CfnReplicationGroup(
+            self,
+            "sharedCacheReplicationGroup",
+            replication_group_description="Movies shared by every greeter container",
+            engine="redis",
+            cache_node_type=conf["node_type"],
+            num_cache_clusters=1 + replicas,
+            automatic_failover_enabled=replicas > 0,
+            multi_az_enabled=replicas > 0,
+            cache_subnet_group_name=cache_subnet_group.ref,
+            security_group_ids=[cache_sg.security_group_id],
+            transit_encryption_enabled=True,
+            at_rest_encryption_enabled=True
+        )
+        self.replication_group.add_depends_on(cache_subnet_group)
+
+        self.endpoint = f"{self.replication_group.attr_primary_end_point_address}:{self.replication_group.attr_primary_end_point_port}"
+
+    def function_options(self):
+        """ VPC options for the greeter function, to be set when it is created """
+        return {
+            "vpc": self.vpc,
+            "vpc_subnets": _ec2.SubnetSelection(subnet_type=_ec2.SubnetType.PRIVATE_ISOLATED),
+            "security_groups": [self.client_sg]
+        }
+
+    def add_client(self, fn: _lambda.Function):
+        """ Points `fn` at the shared cache """
+        fn.add_environment("SHARED_CACHE_ENDPOINT", self.endpoint)
+        fn.add_environment("SHARED_CACHE_TLS", "True")
+        fn.add_environment("SHARED_CACHE_TTL_SECS", str(self.conf["ttl_secs"]))
+        fn.add_environment("SHARED_CACHE_NEGATIVE_TTL_SECS", str(self.conf["negative_ttl_secs"]))
+        fn.add_environment("SHARED_CACHE_TIMEOUT_MS", str(self.conf["timeout_ms"]))
+        fn.add_environment("SHARED_CACHE_BREAKER_FAILURES", "3")
+        fn.add_environment("SHARED_CACHE_BREAKER_RESET_SECS", "30")
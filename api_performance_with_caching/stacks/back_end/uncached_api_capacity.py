@@ -0,0 +1,37 @@
+import json
+
+
+class GlobalArgs:
+    """
+    Helper to define global statics
+    """
+
+    OWNER = "MystiqueAutomation"
+    CONTEXT_KEY = "uncached_api_capacity"
+
+
+# What the uncached api has always deployed with, the cached api sizes itself by its caching profile
+DEFAULT_UNCACHED_API_CAPACITY = {
+    "reserved_concurrency": 50,
+    "ddb_read_capacity": 20,
+    "ddb_write_capacity": 20
+}
+
+
+def get_uncached_api_capacity(scope):
+    """
+    Table capacity & greeter concurrency of the uncached api, any of them overridden from the
+    context, e.g. the output of `capacity_planner.py --emit-context`,
+    `-c uncached_api_capacity='{"ddb_read_capacity": 120, "reserved_concurrency": 80}'`
+    """
+    val = scope.node.try_get_context(GlobalArgs.CONTEXT_KEY)
+    overrides = json.loads(val) if isinstance(val, str) else val or {}
+    unknown = sorted(set(overrides) - set(DEFAULT_UNCACHED_API_CAPACITY))
+    if unknown:
+        raise ValueError(
+            f"Unknown {GlobalArgs.CONTEXT_KEY} keys: {unknown}, expected {sorted(DEFAULT_UNCACHED_API_CAPACITY)}")
+    capacity = dict(DEFAULT_UNCACHED_API_CAPACITY, **{k: int(v) for k, v in overrides.items()})
+    for k, v in capacity.items():
+        if v < 1:
+            raise ValueError(f"{GlobalArgs.CONTEXT_KEY} {k} must be at least 1, got {v}")
+    return capacity
@@ -5,8 +5,16 @@ from aws_cdk import aws_apigateway as _apigw
 from aws_cdk import aws_dynamodb as _dynamodb
 from aws_cdk import aws_lambda as _lambda
 from aws_cdk import aws_logs as _logs
+from aws_cdk import aws_s3 as _s3
 from aws_cdk import core
 
+from api_performance_with_caching.stacks.back_end.direct_ddb_integration import direct_ddb_integration
+from api_performance_with_caching.stacks.back_end.direct_ddb_integration import get_movie_by_id_integration
+from api_performance_with_caching.stacks.back_end.greeter_env import COMPRESSION_MIN_BYTES
+from api_performance_with_caching.stacks.back_end.greeter_env import get_greeter_env
+from api_performance_with_caching.stacks.back_end.provisioned_concurrency import add_provisioned_concurrency
+from api_performance_with_caching.stacks.back_end.provisioned_concurrency import get_provisioned_concurrency
+from api_performance_with_caching.stacks.back_end.uncached_api_capacity import get_uncached_api_capacity
 from data_loader_stacks.custom_resources.ddb_data_loader.ddb_data_loader_stack import DdbDataLoaderStack
 
 
@@ -40,6 +48,9 @@ class UncachedApiStack(core.Stack):
         if not back_end_api_datastore_name:
             back_end_api_datastore_name = f"{GlobalArgs.REPO_NAME}-api-datastore"
 
+        # 20/20 and 50 unless sized from a load test, `-c uncached_api_capacity=...`
+        capacity = get_uncached_api_capacity(self)
+
         self.ddb_table_01 = _dynamodb.Table(
             self,
             "apiPerformanceWithCaching",
@@ -47,52 +58,74 @@ class UncachedApiStack(core.Stack):
                 name="id",
                 type=_dynamodb.AttributeType.STRING
             ),
-            read_capacity=20,
-            write_capacity=20,
+            read_capacity=capacity["ddb_read_capacity"],
+            write_capacity=capacity["ddb_write_capacity"],
             table_name=f"{back_end_api_datastore_name}-{id}",
             removal_policy=core.RemovalPolicy.DESTROY
         )
 
+        # The keys loaded, as a bloom filter, let the greeter answer ids that do not exist without a lookup
+        bloom_filter_bucket = _s3.Bucket(
+            self,
+            "bloomFilterBucket",
+            block_public_access=_s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=_s3.BucketEncryption.S3_MANAGED,
+            removal_policy=core.RemovalPolicy.DESTROY,
+            auto_delete_objects=True
+        )
+        bloom_filter_key = f"bloom_filters/{id}.bloom"
+
         # Let us use our Cfn Custom Resource to load data into our dynamodb table.
         data_loader_status = DdbDataLoaderStack(
             self,
             "unCachedApiDdbLoader",
-            Ddb_table_name=self.ddb_table_01.table_name
+            Ddb_table_name=self.ddb_table_01.table_name,
+            # Optional, s3://bucket/key JSONL or CSV file to load instead of the sample movies
+            Data_source=self.node.try_get_context("ddb_data_source"),
+            Bloom_filter_bucket=bloom_filter_bucket.bucket_name,
+            Bloom_filter_key=bloom_filter_key,
+            # Optional, size the filter for a larger catalogue, `-c bloom_filter_capacity=5000000`
+            Bloom_filter_capacity=self.node.try_get_context("bloom_filter_capacity"),
+            Bloom_filter_fp_rate="0.01"
         )
 
-        # Read Lambda Code):
-        try:
-            with open("api_performance_with_caching/stacks/back_end/lambda_src/serverless_greeter.py", mode="r") as f:
-                greeter_fn_code = f.read()
-        except OSError as e:
-            print("Unable to read Lambda Function Code")
-            raise e
-
+        reserved_concurrency = capacity["reserved_concurrency"]
         greeter_fn = _lambda.Function(
             self,
             "greeterFn",
             function_name=f"greeter_fn_{id}",
             runtime=_lambda.Runtime.PYTHON_3_7,
-            handler="index.lambda_handler",
-            code=_lambda.InlineCode(greeter_fn_code),
+            handler="serverless_greeter.lambda_handler",
+            # Packaged as an asset, the greeter ships with helper modules from lambda_src
+            code=_lambda.Code.from_asset(
+                "api_performance_with_caching/stacks/back_end/lambda_src"),
             timeout=core.Duration.seconds(10),
-            reserved_concurrent_executions=50,
-            environment={
+            reserved_concurrent_executions=reserved_concurrency,
+            # The settings that do not depend on the resources are shared with the local api emulator
+            environment=dict(get_greeter_env("uncached"), **{
                 "LOG_LEVEL": f"{stack_log_level}",
-                "Environment": "Production",
                 "DDB_TABLE_NAME": self.ddb_table_01.table_name,
-                "RANDOM_SLEEP_SECS": "2",
-                "ANDON_CORD_PULLED": "False"
-            },
+                "STACK_NAME": f"{id}",
+                # Ids that are definitely not in the table are answered with a 404, without a lookup
+                "BLOOM_FILTER_BUCKET": bloom_filter_bucket.bucket_name,
+                "BLOOM_FILTER_KEY": bloom_filter_key,
+            }),
             description="Creates a simple greeter function"
         )
-        greeter_fn_version = greeter_fn.latest_version
+        # A published version, provisioned concurrency can not be set on $LATEST
+        greeter_fn_version = greeter_fn.current_version
+        # Optional, `-c greeter_provisioned_concurrency='{"uncached-api": {"min": 5, "max": 40}}'`
+        provisioned_concurrency = get_provisioned_concurrency(self, id)
         greeter_fn_version_alias = _lambda.Alias(
             self,
             "greeterFnAlias",
             alias_name="MystiqueAutomation",
-            version=greeter_fn_version
+            version=greeter_fn_version,
+            provisioned_concurrent_executions=provisioned_concurrency["min"] if provisioned_concurrency else None
         )
+        if provisioned_concurrency:
+            add_provisioned_concurrency(
+                greeter_fn_version_alias, provisioned_concurrency, reserved_concurrency)
 
         # Create Custom Loggroup
         greeter_fn_lg = _logs.LogGroup(
@@ -105,6 +138,8 @@ class UncachedApiStack(core.Stack):
 
         # Add DDB Read Write Permission to the Lambda
         self.ddb_table_01.grant_read_write_data(greeter_fn)
+        # Writes of new movies add their id, as `<filter key>.added/<id>`
+        bloom_filter_bucket.grant_read_write(greeter_fn, f"{bloom_filter_key}*")
 
         # Add API GW front end for the Lambda
         back_end_api_stage_01_options = _apigw.StageOptions(
@@ -118,7 +153,7 @@ class UncachedApiStack(core.Stack):
             "backEnd01Api",
             rest_api_name=f"{back_end_api_name}",
             deploy_options=back_end_api_stage_01_options,
-            minimum_compression_size=0,
+            minimum_compression_size=COMPRESSION_MIN_BYTES,
             endpoint_types=[
                 _apigw.EndpointType.EDGE
             ],
@@ -133,10 +168,13 @@ class UncachedApiStack(core.Stack):
             http_method="GET",
             request_parameters={
                 "method.request.header.InvocationType": True,
-                "method.request.path.number": True
+                "method.request.path.number": True,
+                # Batch lookups, GET /movie?ids=1,4,7
+                "method.request.querystring.ids": False,
+                "method.request.querystring.fields": False
             },
             integration=_apigw.LambdaIntegration(
-                handler=greeter_fn,
+                handler=greeter_fn_version_alias,
                 proxy=True
             )
         )
@@ -166,29 +204,63 @@ class UncachedApiStack(core.Stack):
         )
 
         req_template = {
-            "id": "$input.params('id')"
+            "id": "$input.params('id')",
+            "fields": "$util.escapeJavaScript($input.params('fields'))",
+            "if_none_match": "$input.params('If-None-Match')"
         }
         request_template_string = json.dumps(
             req_template, separators=(',', ':'))
 
         # resp_template = """$input.path('$.body.message')"""
-        resp_template = """$input.path('$.body')"""
+        # 304 without a body when the client already has the movie, matching If-None-Match weakly,
+        # 404 for movies that do not exist, 400 for `?fields=` it can not project
+        resp_template = (
+            "#set($etag = \"$!input.path('$.headers.ETag')\")"
+            "#set($inm = \"$!input.params('If-None-Match')\")"
+            "#if($input.path('$.statusCode') == 304 || ($etag != \"\" && $inm != \"\" && ($inm.trim() == \"*\" || $inm.contains($etag))))"
+            "#set($context.responseOverride.status = 304)"
+            "#{else}"
+            "#if($input.path('$.statusCode') == 404)#set($context.responseOverride.status = 404)"
+            "#elseif($input.path('$.statusCode') == 400)#set($context.responseOverride.status = 400)#end"
+            "$input.path('$.body')"
+            "#end"
+        )
 
-        res_movie_by_id_method_get = res_movie_by_id.add_method(
-            http_method="GET",
-            request_parameters={
-                "method.request.header.InvocationType": False,
-                "method.request.path.id": True
-            },
-            request_validator=res_movie_by_id_validator_request,
+        # Write path, PUT /movie/{id} with the movie as JSON, SigV4 signed by callers allowed `execute-api:Invoke`
+        res_movie_by_id_method_put = res_movie_by_id.add_method(
+            http_method="PUT",
+            authorization_type=_apigw.AuthorizationType.IAM,
             integration=_apigw.LambdaIntegration(
-                handler=greeter_fn,
+                handler=greeter_fn_version_alias,
+                proxy=True
+            )
+        )
+
+        res_movie_by_id_response_parameters = {
+            "method.response.header.Access-Control-Allow-Headers": "'cache-control,Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match'",
+            "method.response.header.Content-Type": "'application/json'",
+            "method.response.header.Cache-Control": "'no-cache'",
+        }
+        # Optional, GetItem straight from API Gateway, no lambda, `-c movie_by_id_integration=dynamodb`
+        movie_by_id_integration = get_movie_by_id_integration(self)
+        if movie_by_id_integration == "dynamodb":
+            res_movie_by_id_integration = direct_ddb_integration(
+                self,
+                ddb_table=self.ddb_table_01,
+                response_parameters=res_movie_by_id_response_parameters
+            )
+        else:
+            res_movie_by_id_integration = _apigw.LambdaIntegration(
+                handler=greeter_fn_version_alias,
                 proxy=False,
                 request_parameters={
-                    "integration.request.path.id": "method.request.path.id"
+                    "integration.request.path.id": "method.request.path.id",
+                    "integration.request.querystring.fields": "method.request.querystring.fields"
                 },
+                # Every projection is a response of its own
                 cache_key_parameters=[
-                    "method.request.path.id"
+                    "method.request.path.id",
+                    "method.request.querystring.fields"
                 ],
                 request_templates={
                     "application/json": request_template_string
@@ -199,25 +271,65 @@ class UncachedApiStack(core.Stack):
                         status_code="200",
                         # selection_pattern="2\d{2}",  # Use for mapping Lambda Errors
                         response_parameters={
-                            "method.response.header.Access-Control-Allow-Headers": "'cache-control,Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'",
-                            "method.response.header.Content-Type": "'application/json'",
+                            **res_movie_by_id_response_parameters,
+                            "method.response.header.ETag": "integration.response.body.headers.ETag",
+                            # Replayed with the rest of the integration response on stage cache hits
+                            "method.response.header.X-Served-By": "integration.response.body.headers.X-Served-By",
+                            "method.response.header.X-Generated-At": "integration.response.body.headers.X-Generated-At",
                         },
                         response_templates={
                             "application/json": f"{resp_template}"
                         }
                     )
                 ]
-            ),
+            )
+
+        res_movie_by_id_method_get = res_movie_by_id.add_method(
+            http_method="GET",
+            request_parameters={
+                "method.request.header.InvocationType": False,
+                "method.request.path.id": True,
+                # Attributes to return, GET /movie/1?fields=title,rating
+                "method.request.querystring.fields": False
+            },
+            request_validator=res_movie_by_id_validator_request,
+            integration=res_movie_by_id_integration,
             method_responses=[
                 _apigw.MethodResponse(
                     status_code="200",
                     response_parameters={
                         "method.response.header.Content-Type": True,
                         "method.response.header.Access-Control-Allow-Headers": True,
+                        "method.response.header.ETag": True,
+                        "method.response.header.Cache-Control": True,
+                        "method.response.header.X-Served-By": True,
+                        "method.response.header.X-Generated-At": True,
                     },
                     response_models={
                         "application/json": response_model
                     }
+                ),
+                _apigw.MethodResponse(
+                    status_code="304",
+                    response_parameters={
+                        "method.response.header.ETag": True,
+                        "method.response.header.Cache-Control": True,
+                    }
+                ),
+                _apigw.MethodResponse(
+                    status_code="400",
+                    response_models={
+                        "application/json": response_model
+                    }
+                ),
+                _apigw.MethodResponse(
+                    status_code="404",
+                    response_models={
+                        "application/json": response_model
+                    }
+                ),
+                _apigw.MethodResponse(
+                    status_code="502"
                 )
             ]
         )
@@ -236,3 +348,9 @@ class UncachedApiStack(core.Stack):
             value=f"{data_loader_status.response}",
             description="Waf Rate Rule Creator Status"
         )
+        output_3 = core.CfnOutput(
+            self,
+            "ddbDataLoaderStats",
+            value=f"rows_loaded:{data_loader_status.rows_loaded}, rows_per_sec:{data_loader_status.rows_per_sec}, retried_items:{data_loader_status.retried_items}",
+            description="Rows loaded by the data loader, load rate and throttled items retried"
+        )
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Size and CPU cost of the representations the greeter negotiates
+
+Renders the body of one movie and of a batch of movies as JSON and MessagePack,
+without compression, with the greeter's spliced gzip (a deflated head kept per
+ETag, only the `ts` appended per response), with gzip of the whole body and with
+brotli when it is installed. Reports the bytes on the wire and the median time
+to render one body.
+
+Usage:
+    python3 benchmark_scripts/encoding_benchmark.py --batch 10 --iterations 2000
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+GREETER_SRC = os.path.join(
+    _HERE, "..", "api_performance_with_caching", "stacks", "back_end", "lambda_src")
+sys.path.insert(0, _HERE)
+sys.path.insert(0, GREETER_SRC)
+
+from content_negotiation import JSON, MSGPACK, ContentNegotiator, Representation, brotli  # noqa: E402
+from fake_dynamodb import MOVIES  # noqa: E402
+from response_body import BodyEncoder, encode_item  # noqa: E402
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    TABLE_NAME = "benchmark-movies"
+
+
+def bodies(encoder, batch):
+    """ `(name, field, encoded, etag)` of a single movie and of a batch """
+    items = []
+    for idx, movie in enumerate(MOVIES[:max(batch, 1)]):
+        item = dict(movie, id=str(idx), version=1)
+        items.append(encoder.encode((GlobalArgs.TABLE_NAME, item["id"]), encode_item(item)))
+    yield "single", "movie", items[0][0], items[0][1]
+    yield f"batch_{len(items)}", "movies", *encoder.join_batch(items)
+
+
+def representations():
+    """ `(name, representation, splice)`, without `splice` the whole body is compressed """
+    for media_type, label in ((JSON, "json"), (MSGPACK, "msgpack")):
+        yield label, Representation(media_type, "identity"), True
+        yield f"{label}+gzip", Representation(media_type, "gzip"), True
+        yield f"{label}+gzip_whole", Representation(media_type, "identity"), False
+        if brotli is not None:
+            yield f"{label}+br", Representation(media_type, "br"), True
+
+
+def wire_bytes(body, is_base64):
+    """ The bytes on the wire, API Gateway decodes base64 bodies of binary media types """
+    return base64.b64decode(body) if is_base64 else body.encode("utf-8")
+
+
+def measure(negotiator, rep, splice, field, encoded, etag, iterations):
+    def render():
+        body, _, is_base64 = negotiator.render(rep, field, encoded, etag)
+        data = wire_bytes(body, is_base64)
+        return data if splice else gzip.compress(data, negotiator.level)
+
+    size = len(render())
+    timings = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - t0)
+    return size, statistics.median(timings) * 1e6
+
+
+def main(args):
+    encoder = BodyEncoder(plain_items=True)
+    negotiator = ContentNegotiator(encoder, enabled=True, min_bytes=0, level=args.level)
+    results = {}
+    for body_name, field, encoded, etag in bodies(encoder, args.batch):
+        for rep_name, rep, splice in representations():
+            size, us = measure(negotiator, rep, splice, field, encoded, etag, args.iterations)
+            results[f"{body_name}:{rep_name}"] = {"bytes": size, "median_us": round(us, 1)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'body:representation':<32}{'bytes':>8}{'median_us':>12}")
+    for name, r in results.items():
+        print(f"{name:<32}{r['bytes']:>8}{r['median_us']:>12}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Size and CPU cost of the representations the greeter negotiates")
+    parser.add_argument("--batch", type=int, default=10, help="Movies in the batch body")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--level", type=int, default=6, help="Compression level, as COMPRESSION_LEVEL")
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-memory stand-in for the low-level DynamoDB client used by the greeter lambda
+
+Only the calls the lambdas make are implemented, with the same request and
+response shapes as `boto3.client("dynamodb")`. Every call sleeps for a
+latency drawn from an injectable distribution, so benchmarks can model a
+slow or jittery table.
+"""
+
+import copy
+import math
+import random
+import threading
+import time
+import zlib
+
+
+MOVIES = [
+    {"year": "2013", "title": "Rush", "rating": "8.3"},
+    {"year": "2013", "title": "Prisoners", "rating": "8.2"},
+    {"year": "2013", "title": "The Hunger Games: Catching Fire"},
+    {"year": "2013", "title": "Thor: The Dark World"},
+    {"year": "2013", "title": "This Is the End", "rating": "7.2"},
+    {"year": "2013", "title": "Insidious: Chapter 2", "rating": "7.1"},
+    {"year": "2013", "title": "World War Z", "rating": "7.1"},
+    {"year": "2014", "title": "X-Men: Days of Future Past"},
+    {"year": "2014", "title": "Transformers: Age of Extinction"},
+    {"year": "2013", "title": "Now You See Me", "rating": "7.3"},
+]
+
+
+def no_latency():
+    return lambda: 0.0
+
+
+def constant_latency(ms):
+    return lambda: ms / 1000.0
+
+
+def lognormal_latency(median_ms, sigma=0.5, rnd=None):
+    """ Long tailed latency, like a real network call. `median_ms` is the p50 """
+    rnd = rnd or random.Random()
+    mu = math.log(median_ms / 1000.0)
+    return lambda: rnd.lognormvariate(mu, sigma)
+
+
+def parse_latency(spec):
+    """ `none`, `constant:MS` or `lognormal:MEDIAN_MS[:SIGMA]` """
+    kind, _, rest = spec.partition(":")
+    if kind == "none":
+        return no_latency()
+    if kind == "constant":
+        return constant_latency(float(rest))
+    if kind == "lognormal":
+        parts = rest.split(":")
+        return lognormal_latency(float(parts[0]), float(parts[1]) if len(parts) > 1 else 0.5)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def item_size(item):
+    """ Bytes DynamoDB bills an item by, names & values, numbers about a byte per two digits """
+    size = 0
+    for name, attr in item.items():
+        size += len(name.encode("utf-8"))
+        for kind, val in attr.items():
+            if kind == "S":
+                size += len(val.encode("utf-8"))
+            elif kind == "N":
+                size += (len(val.strip("-").replace(".", "")) + 1) // 2 + 1
+            else:
+                size += 1
+    return size
+
+
+def read_units(item, consistent=False):
+    """ A read is billed by 4KB of the whole item, projected or not, half for eventually consistent reads """
+    units = max(math.ceil(item_size(item or {}) / 4096.0), 1)
+    return float(units) if consistent else units / 2.0
+
+
+def write_units(item):
+    return float(max(math.ceil(item_size(item) / 1024.0), 1))
+
+
+def _to_attr(val):
+    return {"N": str(val)} if isinstance(val, (int, float)) else {"S": str(val)}
+
+
+class FakeDynamoDB:
+    """ Helper to serve `get_item`, `batch_get_item`, `put_item` & `scan` from a dict of tables """
+
+    def __init__(self, latency=None, unprocessed_ratio=0.0, seed=None, scan_page_size=100):
+        self.latency = latency or no_latency()
+        self.unprocessed_ratio = unprocessed_ratio
+        # Items per scan page, DynamoDB stops a page at 1MB
+        self.scan_page_size = scan_page_size
+        self.tables = {}
+        self.calls = {}
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def seed_movies(self, table_name, movies=MOVIES, skip_ids=()):
+        """ Load the same movies as the data loader custom resource, ids `0..n` """
+        for idx, movie in enumerate(movies):
+            if str(idx) in skip_ids:
+                continue
+            item = {k: _to_attr(v) for k, v in movie.items()}
+            item["id"] = {"S": str(idx)}
+            item["version"] = {"N": "1"}
+            self.put_item(TableName=table_name, Item=item)
+        return self
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        delay = self.latency()
+        if delay > 0:
+            time.sleep(delay)
+
+    @staticmethod
+    def _key_of(key):
+        return tuple(sorted((k, tuple(v.items())) for k, v in key.items()))
+
+    def _table(self, table_name):
+        return self.tables.setdefault(table_name, {})
+
+    @staticmethod
+    def _consumed(table_name, units, kwargs):
+        """ `ConsumedCapacity` as a `ReturnConsumedCapacity=TOTAL` request gets it """
+        if kwargs.get("ReturnConsumedCapacity", "NONE") == "NONE":
+            return {}
+        return {"ConsumedCapacity": {"TableName": table_name, "CapacityUnits": units}}
+
+    def put_item(self, TableName, Item, **kwargs):
+        self._call("put_item")
+        key = {"id": Item["id"]}
+        self._table(TableName)[self._key_of(key)] = copy.deepcopy(Item)
+        return self._consumed(TableName, write_units(Item), kwargs)
+
+    @staticmethod
+    def _project(item, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        """ Top level attributes only, `#name` placeholders or plain names """
+        if not ProjectionExpression:
+            return copy.deepcopy(item)
+        names = ExpressionAttributeNames or {}
+        wanted = {names.get(n.strip(), n.strip()) for n in ProjectionExpression.split(",")}
+        return {k: copy.deepcopy(v) for k, v in item.items() if k in wanted}
+
+    def get_item(self, TableName, Key, **kwargs):
+        self._call("get_item")
+        item = self._table(TableName).get(self._key_of(Key))
+        res = self._consumed(TableName, read_units(item, kwargs.get("ConsistentRead", False)), kwargs)
+        if item is not None:
+            res["Item"] = self._project(item, **kwargs)
+        return res
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        self._call("batch_get_item")
+        responses = {}
+        unprocessed = {}
+        consumed = []
+        for table_name, req in RequestItems.items():
+            table = self._table(table_name)
+            units = 0.0
+            for key in req["Keys"]:
+                if self._rnd.random() < self.unprocessed_ratio:
+                    unprocessed.setdefault(table_name, {"Keys": []})["Keys"].append(key)
+                    continue
+                item = table.get(self._key_of(key))
+                units += read_units(item, req.get("ConsistentRead", False))
+                if item is not None:
+                    responses.setdefault(table_name, []).append(self._project(item, **req))
+            consumed.append({"TableName": table_name, "CapacityUnits": units})
+        res = {"Responses": responses, "UnprocessedKeys": unprocessed}
+        if kwargs.get("ReturnConsumedCapacity", "NONE") != "NONE":
+            res["ConsumedCapacity"] = consumed
+        return res
+
+    def scan(self, TableName, Segment=0, TotalSegments=1, ExclusiveStartKey=None, Limit=None, **kwargs):
+        """ Items are spread over the segments by a hash of their key, pages are in key order """
+        self._call("scan")
+        keys = sorted(
+            k for k in self._table(TableName)
+            if zlib.crc32(repr(k).encode("utf-8")) % TotalSegments == Segment
+        )
+        if ExclusiveStartKey is not None:
+            start = self._key_of(ExclusiveStartKey)
+            keys = [k for k in keys if k > start]
+        page = keys[:min(Limit or self.scan_page_size, self.scan_page_size)]
+        res = {"Items": [copy.deepcopy(self._table(TableName)[k]) for k in page]}
+        if len(page) < len(keys):
+            res["LastEvaluatedKey"] = {"id": copy.deepcopy(self._table(TableName)[page[-1]]["id"])}
+        return res
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Local, in-memory stand-in for the Redis-compatible shared cache
+
+Speaks enough RESP for the greeter's shared cache tier: PING, GET, MGET, SET
+(with EX/PX), DEL, DBSIZE & FLUSHALL. Each call can be delayed to model a
+remote cache, and the server can be paused to exercise the circuit breaker.
+
+Usage:
+    python3 benchmark_scripts/fake_redis.py --port 6379
+    SHARED_CACHE_ENDPOINT=127.0.0.1:6379 python3 benchmark_scripts/greeter_benchmark.py
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    HOST = "127.0.0.1"
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline commands, as typed into telnet
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            n = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(n + 2)[:-2])
+        return args
+
+    @staticmethod
+    def _encode(val):
+        if val is None:
+            return b"$-1\r\n"
+        if isinstance(val, Exception):
+            return b"-ERR %s\r\n" % str(val).encode("utf-8")
+        if isinstance(val, bool):
+            return b"+OK\r\n" if val else b"$-1\r\n"
+        if isinstance(val, int):
+            return b":%d\r\n" % val
+        if isinstance(val, str):
+            return b"+%s\r\n" % val.encode("utf-8")
+        if isinstance(val, list):
+            return b"*%d\r\n" % len(val) + b"".join(_Handler._encode(v) for v in val)
+        return b"$%d\r\n%s\r\n" % (len(val), val)
+
+    def handle(self):
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if not args:
+                return
+            self.server.store.wait()
+            try:
+                res = self.server.store.execute(args[0].decode("utf-8").upper(), args[1:])
+            except Exception as e:
+                res = e
+            self.wfile.write(self._encode(res))
+
+
+class FakeRedisStore:
+    """ Helper to keep the keys, with expiry, and count the commands served """
+
+    def __init__(self, latency_secs=0.0, clock=time.monotonic):
+        self.latency_secs = latency_secs
+        self.paused = False
+        self.commands = {}
+        self._data = {}
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def wait(self):
+        while self.paused:
+            time.sleep(0.01)
+        if self.latency_secs > 0:
+            time.sleep(self.latency_secs)
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        val, expires_at = entry
+        if expires_at is not None and self._clock() >= expires_at:
+            del self._data[key]
+            return None
+        return val
+
+    def execute(self, cmd, args):
+        with self._lock:
+            self.commands[cmd] = self.commands.get(cmd, 0) + 1
+            if cmd == "PING":
+                return "PONG"
+            if cmd == "GET":
+                return self._get(args[0])
+            if cmd == "MGET":
+                return [self._get(k) for k in args]
+            if cmd == "SET":
+                expires_at = None
+                opts = [a.decode("utf-8").upper() for a in args[2:]]
+                if "EX" in opts:
+                    expires_at = self._clock() + int(opts[opts.index("EX") + 1])
+                if "PX" in opts:
+                    expires_at = self._clock() + int(opts[opts.index("PX") + 1]) / 1000.0
+                self._data[args[0]] = (args[1], expires_at)
+                return True
+            if cmd == "DEL":
+                return sum(self._data.pop(k, None) is not None for k in args)
+            if cmd == "DBSIZE":
+                return len(self._data)
+            if cmd == "FLUSHALL":
+                self._data.clear()
+                return True
+            raise ValueError(f"unknown command '{cmd}'")
+
+
+class FakeRedisServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """ `FakeRedisServer(port=0).start()` listens on a free port, see `endpoint` """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host=GlobalArgs.HOST, port=0, latency_secs=0.0):
+        super().__init__((host, port), _Handler)
+        self.store = FakeRedisStore(latency_secs=latency_secs)
+
+    @property
+    def endpoint(self):
+        return f"{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Local Redis-compatible stand-in for the shared cache")
+    parser.add_argument("--host", default=GlobalArgs.HOST)
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="Delay every command, to model a remote cache")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = FakeRedisServer(args.host, args.port, args.latency_ms / 1000.0)
+    print(f"fake redis listening on {server.endpoint}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
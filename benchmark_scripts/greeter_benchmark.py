@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Offline benchmark of the greeter lambda handler
+
+Invokes `serverless_greeter.lambda_handler` in-process against an in-memory
+DynamoDB stand-in, so the cost of the handler itself (parsing, caching,
+serialization, logging) can be measured on a laptop without deploying.
+
+For every scenario it reports throughput, p50/p99 latency, the peak memory
+traced while handling a request and the number of memory blocks still
+allocated after the run (a steadily growing number points at a leak).
+
+Usage:
+    python3 benchmark_scripts/greeter_benchmark.py
+    python3 benchmark_scripts/greeter_benchmark.py --latency lognormal:4 --iterations 500
+"""
+
+import argparse
+import array
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+GREETER_SRC = os.path.join(
+    _HERE, "..", "api_performance_with_caching", "stacks", "back_end", "lambda_src")
+sys.path.insert(0, _HERE)
+sys.path.insert(0, GREETER_SRC)
+
+from bloom_filter import BloomFilter  # noqa: E402
+from fake_dynamodb import FakeDynamoDB, parse_latency  # noqa: E402
+from mmap_catalogue import Catalogue, write_catalogue  # noqa: E402
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    TABLE_NAME = "benchmark-movies"
+    MISSING_ID = "5"
+
+
+def load_greeter(log_level):
+    """ Import the greeter as the lambda runtime would, without AWS credentials """
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ["DDB_TABLE_NAME"] = GlobalArgs.TABLE_NAME
+    os.environ["LOG_LEVEL"] = log_level
+    import serverless_greeter
+    # Keep the cost of formatting log records, but not the noise on the terminal
+    for h in logging.getLogger().handlers:
+        if isinstance(h, logging.StreamHandler):
+            h.setStream(open(os.devnull, mode="w") if log_level != "WARNING" else sys.stderr)
+    return serverless_greeter
+
+
+def scenarios():
+    """ `(name, event, features)` for every hot path of the handler """
+    batch = ",".join(str(i) for i in range(10))
+    for cache_on in (False, True):
+        suffix = "_l1_cache" if cache_on else ""
+        features = {"l1_cache"} if cache_on else set()
+        yield f"single_get{suffix}", {"id": "1"}, features
+        yield f"missing_id{suffix}", {"id": GlobalArgs.MISSING_ID}, features
+        yield f"random_id{suffix}", {}, features
+        yield f"batch_10{suffix}", {"queryStringParameters": {"ids": batch}}, features
+    yield "out_of_range_id", {"id": "42"}, set()
+    # Projections, straight from DynamoDB, or trimmed from the cached and pre-encoded movies
+    for name, features in (("", set()), ("_l1_cache", {"l1_cache"}), ("_catalogue", {"bloom_filter", "catalogue"})):
+        yield f"single_get_fields{name}", {"id": "1", "fields": "title,year"}, features
+        yield f"batch_10_fields{name}", {"queryStringParameters": {"ids": batch, "fields": "title"}}, features
+    # Answered from the bloom filter of the table keys, without a DynamoDB call
+    yield "missing_id_bloom_filter", {"id": GlobalArgs.MISSING_ID}, {"bloom_filter"}
+    yield "unknown_id_bloom_filter", {"id": "9f3c2a"}, {"bloom_filter"}
+    # Answered from the whole table, loaded with a parallel scan before the run
+    yield "single_get_snapshot", {"id": "1"}, {"snapshot"}
+    yield "random_id_snapshot", {}, {"snapshot"}
+    yield "batch_10_snapshot", {"queryStringParameters": {"ids": batch}}, {"bloom_filter", "snapshot"}
+    # Pre-encoded bodies, memory-mapped from a catalogue file built before the run
+    yield "single_get_catalogue", {"id": "1"}, {"catalogue"}
+    yield "random_id_catalogue", {}, {"catalogue"}
+    yield "batch_10_catalogue", {"queryStringParameters": {"ids": batch}}, {"bloom_filter", "catalogue"}
+    # Negotiated representations of the proxy integration
+    for name, accept, accept_encoding in (
+            ("gzip", "application/json", "gzip"),
+            ("msgpack", "application/msgpack", ""),
+            ("msgpack_gzip", "application/msgpack", "gzip")):
+        headers = {"Accept": accept, "Accept-Encoding": accept_encoding}
+        yield f"batch_10_{name}", {"queryStringParameters": {"ids": batch}, "headers": headers}, {"negotiation"}
+
+
+def _percentile(sorted_vals, pct):
+    return sorted_vals[min(int(len(sorted_vals) * pct / 100.0), len(sorted_vals) - 1)]
+
+
+def run_scenario(greeter, event, features, args):
+    ddb = FakeDynamoDB(
+        latency=parse_latency(args.latency),
+        unprocessed_ratio=args.unprocessed_ratio,
+        seed=args.seed
+    ).seed_movies(GlobalArgs.TABLE_NAME, skip_ids=(GlobalArgs.MISSING_ID,))
+    greeter._ddb_client = ddb
+    cache_on = "l1_cache" in features
+    greeter._l1_cache.ttl_secs = args.l1_cache_ttl_secs if cache_on else 0
+    greeter._l1_cache.negative_ttl_secs = args.l1_cache_ttl_secs if cache_on else 0
+    greeter._l1_cache.clear()
+    greeter._hedger = greeter.HedgedCaller(
+        enabled=args.hedged_reads, percentile=args.hedge_percentile)
+    greeter._body_encoder = greeter.BodyEncoder(
+        plain_items=args.plain_json_items,
+        compact=args.compact_json
+    )
+    greeter._negotiator = greeter.ContentNegotiator(
+        greeter._body_encoder,
+        enabled="negotiation" in features,
+        min_bytes=args.compression_min_bytes,
+        binary_types=["*/*"]
+    )
+    greeter._key_index.filter = None
+    if "bloom_filter" in features:
+        # What the data loader builds, as if loaded from s3
+        greeter._key_index.filter = BloomFilter.for_capacity(100000)
+        for key in ddb.tables[GlobalArgs.TABLE_NAME].values():
+            greeter._key_index.filter.add(key["id"]["S"])
+    greeter._snapshot = greeter.TableSnapshot(
+        table_name=GlobalArgs.TABLE_NAME if "snapshot" in features else "",
+        segments=args.scan_segments
+    )
+    if "snapshot" in features:
+        greeter._snapshot.due()
+        greeter._snapshot.load(ddb)
+    greeter._catalogue.close()
+    greeter._catalogue = Catalogue()
+    if "catalogue" in features:
+        # What the catalogue layer ships, encoded as the greeter would
+        path = os.path.join(tempfile.gettempdir(), "greeter_benchmark_movies.cat")
+        write_catalogue(path, (
+            (item["id"]["S"], *greeter._body_encoder.encode((GlobalArgs.TABLE_NAME, item["id"]["S"]), item))
+            for item in ddb.tables[GlobalArgs.TABLE_NAME].values()
+        ), plain_items=args.plain_json_items, compact=args.compact_json)
+        greeter._catalogue = Catalogue(path).open()
+
+    for _ in range(args.warmup):
+        greeter.lambda_handler(dict(event), None)
+
+    # Preallocated, so the timings themselves do not show up as retained blocks
+    timings = array.array("d", bytes(8 * args.iterations))
+    blocks_before = sys.getallocatedblocks()
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        t0 = time.perf_counter()
+        greeter.lambda_handler(dict(event), None)
+        timings[i] = time.perf_counter() - t0
+    elapsed = time.perf_counter() - start
+    blocks_after = sys.getallocatedblocks()
+
+    # A separate, shorter pass, tracemalloc slows everything down
+    tracemalloc.start()
+    peak = 0
+    for _ in range(min(args.iterations, 100)):
+        tracemalloc.reset_peak()
+        greeter.lambda_handler(dict(event), None)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    timings = sorted(timings)
+    return {
+        "ops_per_sec": round(args.iterations / elapsed, 1),
+        "p50_us": round(_percentile(timings, 50) * 1e6, 1),
+        "p99_us": round(_percentile(timings, 99) * 1e6, 1),
+        "peak_alloc_kb": round(peak / 1024.0, 1),
+        "retained_blocks": blocks_after - blocks_before,
+        "ddb_calls": ddb.calls,
+    }
+
+
+def main(args):
+    greeter = load_greeter(args.log_level)
+    results = {}
+    for name, event, features in scenarios():
+        if args.scenario and name not in args.scenario:
+            continue
+        results[name] = run_scenario(greeter, event, features, args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'scenario':<24}{'ops/sec':>12}{'p50_us':>10}{'p99_us':>10}{'peak_kb':>10}{'blocks':>8}  ddb_calls")
+    for name, r in results.items():
+        print(f"{name:<24}{r['ops_per_sec']:>12}{r['p50_us']:>10}{r['p99_us']:>10}"
+              f"{r['peak_alloc_kb']:>10}{r['retained_blocks']:>8}  {r['ddb_calls']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline benchmark of the greeter lambda handler")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--latency", default="none",
+                        help="DynamoDB latency: none, constant:MS or lognormal:MEDIAN_MS[:SIGMA]")
+    parser.add_argument("--unprocessed-ratio", type=float, default=0.0,
+                        help="Fraction of batch keys returned as UnprocessedKeys")
+    parser.add_argument("--l1-cache-ttl-secs", type=float, default=60)
+    parser.add_argument("--scan-segments", type=int, default=4,
+                        help="Parallel scan segments of the snapshot scenarios")
+    parser.add_argument("--hedged-reads", action="store_true",
+                        help="Hedge GetItem calls slower than --hedge-percentile")
+    parser.add_argument("--hedge-percentile", type=float, default=95)
+    parser.add_argument("--plain-json-items", action="store_true",
+                        help="Decode DynamoDB typed attributes to plain JSON")
+    parser.add_argument("--compact-json", action="store_true")
+    parser.add_argument("--compression-min-bytes", type=int, default=0,
+                        help="Smallest body compressed, 0 so the sample movies are compressed too")
+    parser.add_argument("--log-level", default="INFO",
+                        help="Greeter log level, WARNING shows the greeter logs and skips INFO formatting")
+    parser.add_argument("--scenario", action="append",
+                        help="Run only these scenarios, repeat for more")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
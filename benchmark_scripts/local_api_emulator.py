@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Local emulator of the cached & uncached APIs, stage cache included
+
+Serves the routes defined in `CachedApiStack` & `UncachedApiStack` and hands
+each request to the greeter `lambda_handler` in-process, through the same
+request/response templates as the stacks. For the cached API, the stage cache
+is emulated: a TTL, cache keys built from the method's cache key parameters,
+per method overrides, a size bounded LRU store and `Cache-Control: max-age=0`
+invalidation. A `PUT` of a movie invalidates its stage cache entry, like the
+DynamoDB Streams consumer of the cached stack. `If-None-Match` is answered after
+the stage cache, like the response template, with a `304` and no body. DynamoDB is the in-memory stand-in, unless `--ddb-table` is given.
+
+Every response carries an `X-Emulator-Cache: Hit|Miss|Bypass` header and the
+hit ratio and latency per route are served at `/__emulator/stats`, so cache
+configuration changes can be measured before deploying them.
+
+Usage:
+    python3 benchmark_scripts/local_api_emulator.py --port 8080 --cache-ttl-secs 30
+    curl localhost:8080/miztiik/cached/movie/9
+"""
+
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+GREETER_SRC = os.path.join(
+    _HERE, "..", "api_performance_with_caching", "stacks", "back_end", "lambda_src")
+sys.path.insert(0, _HERE)
+sys.path.insert(0, GREETER_SRC)
+sys.path.insert(0, os.path.join(_HERE, "..", "load_generator_scripts"))
+sys.path.insert(0, os.path.join(_HERE, ".."))
+
+from api_performance_with_caching.stacks.back_end.greeter_env import GREETER_ENV  # noqa: E402
+from fake_dynamodb import FakeDynamoDB, parse_latency  # noqa: E402
+from latency_histogram import LatencyHistogram  # noqa: E402
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    STAGE_NAME = "miztiik"
+    TABLE_NAME = "emulator-movies"
+    # Local only, on top of the greeter environment of the stacks
+    GREETER_ENV_OVERRIDES = {
+        # Metrics go to CloudWatch from the logs, locally they only flood stdout
+        "EMF_METRICS_ENABLED": "False",
+    }
+    LAMBDA_RESERVED_CONCURRENCY = 50
+
+
+class Route:
+    """ Helper to describe an API resource method, as set up in the stacks """
+
+    def __init__(self, api, resource, proxy, cache_key_parameters=(), http_method="GET"):
+        self.api = api
+        self.resource = resource
+        self.http_method = http_method
+        self.proxy = proxy
+        self.cache_key_parameters = cache_key_parameters
+        # /cached/movie/{id} -> ^/cached/movie/(?P<id>[^/]+)$
+        self.pattern = re.compile(
+            "^" + re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", resource) + "$")
+
+    @property
+    def method_path(self):
+        """ Key used by the stage `method_options`, e.g. `/cached/movie/GET` """
+        return f"{self.resource}/{self.http_method}"
+
+
+ROUTES = [
+    Route("uncached", "/uncached/movie", proxy=True),
+    Route("uncached", "/uncached/movie/{id}", proxy=False,
+          cache_key_parameters=("method.request.path.id", "method.request.querystring.fields")),
+    Route("uncached", "/uncached/movie/{id}", proxy=True, http_method="PUT"),
+    Route("cached", "/cached/movie", proxy=True),
+    Route("cached", "/cached/movie/{id}", proxy=False,
+          cache_key_parameters=("method.request.path.id", "method.request.querystring.fields")),
+    Route("cached", "/cached/movie/{id}", proxy=True, http_method="PUT"),
+]
+
+
+class StageCache:
+    """
+    Emulates the API Gateway stage cache: entries expire after the TTL and the least
+    recently used are evicted once the cache cluster size is used up
+    """
+
+    def __init__(self, ttl_secs, size_bytes):
+        self.ttl_secs = ttl_secs
+        self.size_bytes = size_bytes
+        self.used_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[0]:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, response):
+        size = len(response[2])
+        if self.ttl_secs <= 0 or size > self.size_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_secs, response)
+            self.used_bytes += size
+            while self.used_bytes > self.size_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.used_bytes -= len(entry[1][2])
+
+
+class Emulator:
+    """ Helper to dispatch requests to the greeter, through the stage cache """
+
+    def __init__(self, args):
+        self.args = args
+        if args.ddb_table:
+            import boto3
+            ddb = boto3.client("dynamodb")
+            table_name = args.ddb_table
+        else:
+            ddb = FakeDynamoDB(latency=parse_latency(args.ddb_latency)).seed_movies(
+                GlobalArgs.TABLE_NAME)
+            table_name = GlobalArgs.TABLE_NAME
+        self.greeters = {
+            api: self._load_greeter(
+                api, dict(env, LOG_LEVEL=args.log_level, **GlobalArgs.GREETER_ENV_OVERRIDES), ddb, table_name)
+            for api, env in GREETER_ENV.items()
+        }
+        self.stage_cache = StageCache(
+            args.cache_ttl_secs, int(float(args.cache_cluster_size) * 1024 ** 3))
+        self.uncached_methods = set(args.disable_cache_for)
+        self.lambda_slots = threading.BoundedSemaphore(args.reserved_concurrency)
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _load_greeter(api, env, ddb, table_name):
+        """ A separate module instance per API, as each stack sets its own environment """
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        os.environ.update(env)
+        os.environ["DDB_TABLE_NAME"] = table_name
+        spec = importlib.util.spec_from_file_location(
+            f"serverless_greeter_{api}", os.path.join(GREETER_SRC, "serverless_greeter.py"))
+        greeter = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(greeter)
+        greeter._ddb_client = ddb
+        for k in env:
+            del os.environ[k]
+        return greeter
+
+    def match(self, path, http_method="GET"):
+        for route in ROUTES:
+            m = route.pattern.match(path)
+            if m and route.http_method == http_method:
+                return route, m.groupdict()
+        return None, None
+
+    def caching_enabled(self, route):
+        return (
+            route.api == "cached"
+            and route.http_method == "GET"
+            and self.args.cache_ttl_secs > 0
+            and route.method_path not in self.uncached_methods
+        )
+
+    def cache_key(self, route, path_params, query):
+        parts = [route.method_path]
+        for p in route.cache_key_parameters:
+            _, _, source, name = p.split(".")
+            val = path_params.get(name) if source == "path" else query.get(name, [""])[0]
+            parts.append(f"{p}={val}")
+        return "|".join(parts)
+
+    def invoke(self, route, path, path_params, query, headers, body=None):
+        """ Returns `(status, headers, body_bytes)` the way API Gateway would """
+        if not self.lambda_slots.acquire(blocking=False):
+            return 429, {"Content-Type": "application/json"}, b'{"message": "Too Many Requests"}'
+        try:
+            greeter = self.greeters[route.api]
+            if route.proxy:
+                event = {
+                    "resource": route.resource,
+                    "path": path,
+                    "httpMethod": route.http_method,
+                    "headers": dict(headers.items()),
+                    "queryStringParameters": {k: v[-1] for k, v in query.items()} or None,
+                    "pathParameters": path_params or None,
+                    "requestContext": {"stage": GlobalArgs.STAGE_NAME},
+                    "body": body,
+                    "isBase64Encoded": False,
+                }
+                res = greeter.lambda_handler(event, None)
+                res_headers = {"Content-Type": "application/json"}
+                res_headers.update(res.get("headers") or {})
+                # Binary media types come back base64 encoded
+                body = res.get("body", "")
+                body = base64.b64decode(body) if res.get("isBase64Encoded") else body.encode()
+                return res.get("statusCode", 200), res_headers, body
+            # Request templates: the cached api passes Cache-Control, the uncached If-None-Match
+            event = {"id": path_params.get("id", ""), "fields": query.get("fields", [""])[0]}
+            if route.api == "cached":
+                event["cache_control"] = headers.get("Cache-Control", "")
+                event["cache_refresh_token"] = headers.get("X-Cache-Refresh-Token", "")
+            else:
+                event["if_none_match"] = headers.get("If-None-Match", "")
+            res = greeter.lambda_handler(event, None)
+            # Integration response: ETag & co from $.headers, the body from $.body
+            res_headers = {"Content-Type": "application/json", "Cache-Control": "no-cache"}
+            for name in ("ETag", "X-Served-By", "X-Generated-At"):
+                val = (res.get("headers") or {}).get(name)
+                if val:
+                    res_headers[name] = val
+            return res.get("statusCode", 200), res_headers, str(res.get("body", "")).encode()
+        finally:
+            self.lambda_slots.release()
+
+    def handle(self, raw_path, headers, http_method="GET", body=None):
+        """ `headers` are looked up case insensitively, the `HTTPMessage` of the request """
+        start = time.perf_counter()
+        url = urlsplit(raw_path)
+        path = url.path
+        if path.startswith(f"/{GlobalArgs.STAGE_NAME}/"):
+            path = path[len(GlobalArgs.STAGE_NAME) + 1:]
+        route, path_params = self.match(path, http_method)
+        if route is None:
+            return 403, {"Content-Type": "application/json"}, b'{"message":"Missing Authentication Token"}'
+        query = parse_qs(url.query)
+
+        cache_state = "Bypass"
+        response = None
+        if self.caching_enabled(route):
+            key = self.cache_key(route, path_params, query)
+            if "max-age=0" in headers.get("Cache-Control", "").replace(" ", ""):
+                self.stage_cache.invalidate(key)
+            else:
+                response = self.stage_cache.get(key)
+            cache_state = "Hit" if response is not None else "Miss"
+            if response is None:
+                response = self.invoke(route, path, path_params, query, headers)
+                if 200 <= response[0] < 300:
+                    self.stage_cache.put(key, response)
+        else:
+            response = self.invoke(route, path, path_params, query, headers, body)
+            if http_method == "PUT" and 200 <= response[0] < 300:
+                self._invalidate_movie(route, path_params)
+
+        if not route.proxy:
+            response = self.not_modified(response, headers.get("If-None-Match", ""))
+        status, res_headers, body = response
+        res_headers = dict(res_headers, **{"X-Emulator-Cache": cache_state})
+        self._record(route, cache_state, time.perf_counter() - start)
+        return status, res_headers, body
+
+    @staticmethod
+    def not_modified(response, if_none_match):
+        """ The response template: `304` without a body when If-None-Match contains the ETag """
+        status, res_headers, body = response
+        etag = res_headers.get("ETag", "")
+        if status == 304 or (etag and if_none_match and (
+                if_none_match.strip() == "*" or etag in if_none_match)):
+            return 304, res_headers, b""
+        return response
+
+    def _invalidate_movie(self, route, path_params):
+        """ What the DynamoDB Streams consumer does for the cached stack, without the stream lag """
+        for r in ROUTES:
+            if r.api == route.api and r.resource == route.resource and self.caching_enabled(r):
+                self.stage_cache.invalidate(self.cache_key(r, path_params, {}))
+
+    def _record(self, route, cache_state, elapsed_secs):
+        with self._stats_lock:
+            s = self.stats.setdefault(route.method_path, {
+                "Hit": 0, "Miss": 0, "Bypass": 0, "latency": LatencyHistogram()
+            })
+            s[cache_state] += 1
+            s["latency"].record(elapsed_secs * 1e6)
+
+    def report(self):
+        with self._stats_lock:
+            res = {}
+            for method_path, s in self.stats.items():
+                lookups = s["Hit"] + s["Miss"]
+                res[method_path] = {
+                    "cache_hit": s["Hit"],
+                    "cache_miss": s["Miss"],
+                    "cache_bypass": s["Bypass"],
+                    "hit_ratio": round(s["Hit"] / lookups, 4) if lookups else None,
+                    "latency": s["latency"].summary(),
+                }
+        res["stage_cache"] = {
+            "ttl_secs": self.stage_cache.ttl_secs,
+            "used_bytes": self.stage_cache.used_bytes,
+            "size_bytes": self.stage_cache.size_bytes,
+        }
+        return res
+
+
+def make_handler(emulator):
+
+    class ApiHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path.startswith("/__emulator/stats"):
+                status, headers, body = 200, {"Content-Type": "application/json"}, json.dumps(
+                    emulator.report(), indent=2).encode()
+            else:
+                status, headers, body = emulator.handle(self.path, self.headers)
+            self._respond(status, headers, body)
+
+        def do_PUT(self):
+            req_body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+            self._respond(*emulator.handle(self.path, self.headers, "PUT", req_body))
+
+        def _respond(self, status, headers, body):
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if emulator.args.access_log:
+                super().log_message(format, *args)
+
+    return ApiHandler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Local emulator of the cached & uncached APIs, stage cache included")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cache-ttl-secs", type=float, default=30)
+    parser.add_argument("--cache-cluster-size", default="0.5",
+                        help="Stage cache size in GB")
+    parser.add_argument("--disable-cache-for", action="append", default=None,
+                        help="Method paths with caching turned off, like the stage method_options")
+    parser.add_argument("--reserved-concurrency", type=int,
+                        default=GlobalArgs.LAMBDA_RESERVED_CONCURRENCY)
+    parser.add_argument("--ddb-table",
+                        help="Use this DynamoDB table instead of the in-memory stand-in")
+    parser.add_argument("--ddb-latency", default="lognormal:4",
+                        help="In-memory DynamoDB latency: none, constant:MS or lognormal:MEDIAN_MS[:SIGMA]")
+    parser.add_argument("--log-level", default="WARNING", help="Greeter log level")
+    parser.add_argument("--access-log", action="store_true")
+    args = parser.parse_args(argv)
+    if args.disable_cache_for is None:
+        args.disable_cache_for = ["/cached/movie/GET"]
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    emulator = Emulator(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(emulator))
+    print(f"Serving http://{args.host}:{args.port}/{GlobalArgs.STAGE_NAME}/{{cached,uncached}}/movie")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
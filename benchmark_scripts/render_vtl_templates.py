@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Renders the VTL templates of the direct DynamoDB integration locally
+
+The GetItem request & response templates used by `GET /movie/{id}`, when the
+stacks are deployed with `-c movie_by_id_integration=dynamodb`, are rendered
+with the `airspeed` Velocity engine, against the same in-memory movies as the
+benchmarks. Every response body is checked against the body the greeter
+lambda returns for the same movie, `ts` aside, so the two integration modes
+stay interchangeable. `ts` is checked to be the request time, in the format
+of the greeter. Exits non-zero on the first mismatch with `--strict`.
+
+`$input`, `$util` & `$context` are stand-ins for the API Gateway variables,
+with just enough of their Java string & map methods for the templates.
+
+Usage:
+    pip3 install airspeed
+    python3 benchmark_scripts/render_vtl_templates.py --verbose
+"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+
+try:
+    import airspeed
+except ImportError:
+    sys.exit("airspeed is needed to render the templates: pip3 install airspeed")
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+GREETER_SRC = os.path.join(
+    _HERE, "..", "api_performance_with_caching", "stacks", "back_end", "lambda_src")
+TEMPLATES_DIR = os.path.join(
+    _HERE, "..", "api_performance_with_caching", "stacks", "back_end", "vtl_templates")
+sys.path.insert(0, _HERE)
+sys.path.insert(0, GREETER_SRC)
+
+from bloom_filter import BloomFilter  # noqa: E402
+from fake_dynamodb import FakeDynamoDB  # noqa: E402
+
+# As `direct_ddb_integration.py` joins them
+RESPONSE_TEMPLATES = ("ts.vtl", "get_item_response.vtl")
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    TABLE_NAME = "vtl-movies"
+    REQUEST_TIME = "18/Oct/2020:10:00:00 +0000"
+    REQUEST_TIME_EPOCH = 1603015200042
+
+
+class JavaString(str):
+    """ The `java.lang.String` methods the templates call """
+
+    def matches(self, regex):
+        return re.fullmatch(regex, self) is not None
+
+    def contains(self, s):
+        return s in self
+
+    def trim(self):
+        return JavaString(self.strip())
+
+    def substring(self, begin, end):
+        return JavaString(self[begin:end])
+
+    def length(self):
+        return len(self)
+
+    def replaceAll(self, regex, replacement):
+        return JavaString(re.sub(regex, replacement.replace("\\", "\\\\"), self))
+
+    def split(self, regex):
+        """ Trailing empty strings are dropped, as Java does """
+        parts = [JavaString(p) for p in re.split(regex, self)]
+        while len(parts) > 1 and not parts[-1]:
+            parts.pop()
+        return parts
+
+
+class JavaMap(dict):
+    """ The `java.util.Map` methods the templates call, keys keep their JSON order """
+
+    def keySet(self):
+        return list(self.keys())
+
+    def containsKey(self, k):
+        return k in self
+
+    def __getattr__(self, k):
+        try:
+            return self[k]
+        except KeyError:
+            raise AttributeError(k)
+
+
+def _java(val):
+    if isinstance(val, dict):
+        return JavaMap((k, _java(v)) for k, v in val.items())
+    if isinstance(val, list):
+        return [_java(v) for v in val]
+    if isinstance(val, bool):
+        return JavaString(str(val).lower())
+    if isinstance(val, str):
+        return JavaString(val)
+    return val
+
+
+def _json_path(doc, expr):
+    """ `$`, `$.Item`, `$.Item.id` & `$.Item['id']` """
+    for dotted, quoted in re.findall(r"\.(\w+)|\['([^']*)'\]", expr[1:]):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(dotted or quoted)
+    return doc
+
+
+class Input:
+    """ `$input` of the integration response """
+
+    def __init__(self, body, params):
+        self._body = body
+        self._params = params
+
+    def path(self, expr):
+        val = _json_path(self._body, expr)
+        return JavaString("") if val is None else _java(val)
+
+    def json(self, expr):
+        return JavaString(json.dumps(_json_path(self._body, expr)))
+
+    def params(self, name=None):
+        return JavaString(self._params.get(name, ""))
+
+
+class Util:
+    """ `$util` """
+
+    @staticmethod
+    def escapeJavaScript(s):
+        """ Like commons-lang `StringEscapeUtils.escapeJavaScript`, single quotes included """
+        out = []
+        for ch in str(s):
+            if ch in "'\"\\/":
+                out.append("\\" + ch)
+            elif ch in "\b\f\n\r\t":
+                out.append({"\b": "\\b", "\f": "\\f", "\n": "\\n", "\r": "\\r", "\t": "\\t"}[ch])
+            elif ord(ch) < 32 or ord(ch) > 127:
+                out.append(f"\\u{ord(ch):04X}")
+            else:
+                out.append(ch)
+        return JavaString("".join(out))
+
+
+def render(template_names, body=None, params=None, replacements=None, tail="", request_time_epoch=None):
+    """ Returns `(rendered, context)`, `context["responseOverride"]` has any status & headers set
+
+    The templates are joined, as the stacks join `ts.vtl` & a response template, then `tail`
+    """
+    src = ""
+    for name in template_names:
+        with open(os.path.join(TEMPLATES_DIR, name)) as f:
+            src += f.read()
+    src += tail
+    for k, v in (replacements or {}).items():
+        src = src.replace(k, v)
+    # API Gateway's Velocity keeps the backslashes of string literals, airspeed unescapes them
+    src = src.replace("\\\\", "\\\\\\\\")
+    epoch = GlobalArgs.REQUEST_TIME_EPOCH if request_time_epoch is None else request_time_epoch
+    context = {
+        "requestTime": JavaString(
+            datetime.datetime.fromtimestamp(epoch // 1000, datetime.timezone.utc).strftime("%d/%b/%Y:%H:%M:%S +0000")),
+        "requestTimeEpoch": epoch,
+        "responseOverride": {"header": {}}
+    }
+    rendered = airspeed.Template(src).merge({
+        "input": Input(body or {}, params or {}),
+        "util": Util(),
+        "context": context,
+    })
+    return rendered, context
+
+
+def _load_greeter(ddb, ids):
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.update({
+        "DDB_TABLE_NAME": GlobalArgs.TABLE_NAME,
+        "PLAIN_JSON_ITEMS": "True",
+        "L1_CACHE_TTL_SECS": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    import serverless_greeter
+    serverless_greeter._ddb_client = ddb
+    # Once its bloom filter is loaded, the greeter answers any id that is not in the table with a 404
+    bloom_filter = BloomFilter.for_capacity(100)
+    for m_id in ids:
+        bloom_filter.add(m_id)
+    serverless_greeter._key_index.filter = bloom_filter
+    return serverless_greeter
+
+
+def _greeter_ts(epoch):
+    """ `ts` as the greeter, running in UTC, writes it """
+    return str(datetime.datetime.fromtimestamp(epoch / 1000, datetime.timezone.utc).replace(tzinfo=None))
+
+
+def check_ts(epoch):
+    """ Renders `$ts` at `epoch`, returns a list of problems """
+    res, _ = render(("ts.vtl",), tail="$ts", request_time_epoch=epoch)
+    if res.strip() != _greeter_ts(epoch):
+        return [f"ts is {res.strip()!r}, the greeter writes {_greeter_ts(epoch)!r}"]
+    return []
+
+
+def _without_ts(body):
+    doc = json.loads(body)
+    doc.pop("ts", None)
+    return doc
+
+
+def check(ddb, greeter, m_id, if_none_match="", fields="", verbose=False):
+    """ Renders both templates for `GET /movie/{m_id}?fields=`, returns a list of problems """
+    problems = []
+    params = {"id": m_id, "If-None-Match": if_none_match, "fields": fields}
+    req, _ = render(("get_item_request.vtl",), params=params,
+                    replacements={"__TABLE_NAME__": GlobalArgs.TABLE_NAME})
+    try:
+        req = json.loads(req)
+        if req["Key"] != {"id": {"S": m_id}}:
+            problems.append(f"request Key is {req['Key']}")
+        names = list(req.get("ExpressionAttributeNames", {}).values())
+        if len(names) != len(set(names)):
+            problems.append(f"request projects {names}, DynamoDB rejects overlapping paths")
+    except ValueError as e:
+        return [f"request is not JSON: {str(e)}: {req!r}"]
+
+    ddb_res = ddb.get_item(**req)
+    res, context = render(RESPONSE_TEMPLATES, body=ddb_res, params=params)
+    status = context["responseOverride"].get("status", 200)
+    etag = context["responseOverride"]["header"].get("ETag")
+    if verbose:
+        print(f"-- id={m_id!r} If-None-Match={if_none_match!r} fields={fields!r} status={status} ETag={etag}")
+        print(req.get("ProjectionExpression", ""), req.get("ExpressionAttributeNames", ""))
+        print(res.strip())
+
+    if status == 304:
+        if res.strip():
+            problems.append(f"304 with a body: {res!r}")
+        if not if_none_match:
+            problems.append("304 without If-None-Match")
+        return problems
+    if if_none_match and etag and if_none_match == etag:
+        problems.append("If-None-Match matches the ETag, but no 304")
+
+    try:
+        rendered = _without_ts(res)
+    except ValueError as e:
+        return problems + [f"response is not JSON: {str(e)}: {res!r}"]
+    ts = json.loads(res).get("ts")
+    if ts != _greeter_ts(GlobalArgs.REQUEST_TIME_EPOCH):
+        problems.append(f"ts is {ts!r}, not the request time as the greeter writes it")
+    if not m_id.isdigit() and status != 400:
+        return problems
+    greeter_res = greeter.lambda_handler({"id": m_id, "fields": fields}, None)
+    expected = _without_ts(greeter_res["body"])
+    if rendered != expected:
+        problems.append(f"body differs from the greeter:\n  vtl:    {rendered}\n  lambda: {expected}")
+    if status != greeter_res["statusCode"]:
+        problems.append(f"status {status}, the greeter answers {greeter_res['statusCode']}")
+    return problems
+
+
+def main(args):
+    ddb = FakeDynamoDB().seed_movies(GlobalArgs.TABLE_NAME, skip_ids=("5",))
+    # Quotes, escapes, unicode & every plain attribute type
+    ddb.put_item(TableName=GlobalArgs.TABLE_NAME, Item={
+        "id": {"S": "7"},
+        "title": {"S": "Rush's \"Final\" Cut \\ 1/2 – Été\n"},
+        "rating": {"N": "8.3"},
+        "votes": {"N": "1200"},
+        "released": {"BOOL": True},
+        "sequel": {"NULL": True},
+        "version": {"N": "4"},
+    })
+    greeter = _load_greeter(ddb, [str(i) for i in range(10) if i != 5])
+
+    cases = [(str(i), "", "") for i in range(10)]
+    cases += [("12", "", ""), ("123456", "", ""), ("05", "", "")]
+    etag = render(RESPONSE_TEMPLATES, body=ddb.get_item(
+        TableName=GlobalArgs.TABLE_NAME, Key={"id": {"S": "3"}}), params={"id": "3"})[1]["responseOverride"]["header"]["ETag"]
+    cases += [("3", etag, ""), ("3", f"W/{etag}", ""), ("3", "*", ""), ("3", '"3-0"', ""), ("5", "*", "")]
+    # Projections, duplicates, `id` & `version` asked for, names that are not valid
+    cases += [("7", "", "title,rating"), ("7", "", " rating , title,rating,"), ("7", "", "id"),
+              ("7", "", "sequel,version"), ("5", "", "title"), ("12", "", "title"),
+              ("3", "", "title,ra ting"), ("3", "", ",".join(f"f{i}" for i in range(21)))]
+
+    failed = 0
+    for m_id, inm, fields in cases:
+        problems = check(ddb, greeter, m_id, inm, fields, args.verbose)
+        label = f"id={m_id!r}" + (f" If-None-Match={inm}" if inm else "") + (f" fields={fields}" if fields else "")
+        if problems:
+            failed += 1
+            print(f"FAIL {label}")
+            for p in problems:
+                print(f"  {p}")
+            if args.strict:
+                break
+        else:
+            print(f"ok   {label}")
+    # `str(datetime)` drops the fraction of a whole second
+    epochs = [GlobalArgs.REQUEST_TIME_EPOCH // 1000 * 1000 + ms for ms in (0, 7, 42, 999)]
+    for epoch in epochs:
+        problems = check_ts(epoch)
+        if problems:
+            failed += 1
+            print(f"FAIL ts at {epoch}")
+            for p in problems:
+                print(f"  {p}")
+        else:
+            print(f"ok   ts at {epoch}")
+    total = len(cases) + len(epochs)
+    print(f"\n{total - failed}/{total} passed")
+    return 1 if failed else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render the direct DynamoDB integration VTL templates locally")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print every rendered response")
+    parser.add_argument("--strict", action="store_true",
+                        help="Stop at the first failure")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
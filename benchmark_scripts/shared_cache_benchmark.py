@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Scale-out benchmark of the greeter cache tiers
+
+Simulates a fleet of greeter containers, each with its own in-container cache,
+reading a key space from one in-memory DynamoDB stand-in, first on their own
+and then with the shared cache tier in front of DynamoDB, served by the local
+Redis-compatible stand-in. Reports the DynamoDB reads and the hit ratio of the
+containers for both. The last phase pauses the cache server to show the
+circuit breaker falling back to DynamoDB.
+
+Usage:
+    python3 benchmark_scripts/shared_cache_benchmark.py --containers 50 --requests 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+GREETER_SRC = os.path.join(
+    _HERE, "..", "api_performance_with_caching", "stacks", "back_end", "lambda_src")
+sys.path.insert(0, _HERE)
+sys.path.insert(0, GREETER_SRC)
+
+from fake_dynamodb import FakeDynamoDB, parse_latency  # noqa: E402
+from fake_redis import FakeRedisServer  # noqa: E402
+from l1_cache import ReadThroughCache  # noqa: E402
+from shared_cache import CircuitBreaker, RespClient, SharedCache  # noqa: E402
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    TABLE_NAME = "benchmark-movies"
+
+
+class Container:
+    """ Helper to hold the caches of one greeter container """
+
+    def __init__(self, ddb, args, endpoint=None):
+        self.ddb = ddb
+        self.l1 = ReadThroughCache(ttl_secs=args.l1_cache_ttl_secs, max_items=args.l1_cache_max_items)
+        self.shared = SharedCache(
+            client=RespClient.from_endpoint(endpoint, timeout_secs=args.timeout_ms / 1000.0),
+            ttl_secs=args.shared_cache_ttl_secs,
+            breaker=CircuitBreaker(failure_threshold=3, reset_secs=args.breaker_reset_secs)
+        )
+
+    def _fetch(self, m_id):
+        return self.ddb.get_item(
+            TableName=GlobalArgs.TABLE_NAME, Key={"id": {"S": m_id}}).get("Item")
+
+    def get(self, m_id):
+        key = (GlobalArgs.TABLE_NAME, m_id)
+        return self.l1.get(key, lambda: self.shared.get(key, lambda: self._fetch(m_id)))
+
+
+def _percentile(sorted_vals, pct):
+    return sorted_vals[min(int(len(sorted_vals) * pct / 100.0), len(sorted_vals) - 1)]
+
+
+def run_phase(name, ddb, containers, args, rnd):
+    ddb.calls.clear()
+    latencies = []
+    for _ in range(args.requests):
+        container = rnd.choice(containers)
+        m_id = str(rnd.randrange(args.keys))
+        start = time.perf_counter()
+        container.get(m_id)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    l1_hits = sum(c.l1.stats.total["hit"] + c.l1.stats.total["negative_hit"] for c in containers)
+    shared = {f: sum(c.shared.stats.total[f] for c in containers) for f in ("hit", "miss", "error", "bypass")}
+    for c in containers:
+        c.l1.stats.reset_current()
+        c.l1.stats.total = dict.fromkeys(c.l1.stats.FIELDS, 0)
+        c.shared.stats.total = dict.fromkeys(c.shared.stats.FIELDS, 0)
+    ddb_reads = ddb.calls.get("get_item", 0)
+    return {
+        "phase": name,
+        "requests": args.requests,
+        "ddb_reads": ddb_reads,
+        "hit_ratio": round(1 - ddb_reads / float(args.requests), 3),
+        "l1_hits": l1_hits,
+        "shared_cache": shared,
+        "p50_ms": round(_percentile(latencies, 50) * 1000.0, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000.0, 3),
+    }
+
+
+def main(args):
+    rnd = random.Random(args.seed)
+    ddb = FakeDynamoDB(latency=parse_latency(args.latency), seed=args.seed)
+    for i in range(args.keys):
+        ddb.put_item(TableName=GlobalArgs.TABLE_NAME, Item={
+            "id": {"S": str(i)}, "title": {"S": f"Movie {i}"}, "version": {"N": "1"}})
+    server = FakeRedisServer(latency_secs=args.cache_latency_ms / 1000.0).start()
+
+    results = [run_phase(
+        "l1_only", ddb, [Container(ddb, args) for _ in range(args.containers)], args, rnd)]
+    containers = [Container(ddb, args, server.endpoint) for _ in range(args.containers)]
+    results.append(run_phase("l1_and_shared", ddb, containers, args, rnd))
+    # Same fleet, cold in-container caches, the cache server stops answering
+    for c in containers:
+        c.l1.clear()
+    server.store.paused = True
+    results.append(run_phase("shared_cache_down", ddb, containers, args, rnd))
+    server.store.paused = False
+    server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'phase':<20}{'ddb_reads':>10}{'hit_ratio':>10}{'l1_hits':>9}"
+          f"{'shared_hit':>11}{'error':>7}{'bypass':>8}{'p50_ms':>9}{'p99_ms':>9}")
+    for r in results:
+        s = r["shared_cache"]
+        print(f"{r['phase']:<20}{r['ddb_reads']:>10}{r['hit_ratio']:>10}{r['l1_hits']:>9}"
+              f"{s['hit']:>11}{s['error']:>7}{s['bypass']:>8}{r['p50_ms']:>9}{r['p99_ms']:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare DynamoDB reads of a scaled-out fleet with and without the shared cache")
+    parser.add_argument("--containers", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--latency", default="none",
+                        help="DynamoDB latency: none, constant:MS or lognormal:MEDIAN_MS[:SIGMA]")
+    parser.add_argument("--cache-latency-ms", type=float, default=0.0)
+    parser.add_argument("--timeout-ms", type=float, default=50)
+    parser.add_argument("--breaker-reset-secs", type=float, default=30)
+    parser.add_argument("--l1-cache-ttl-secs", type=float, default=60)
+    parser.add_argument("--l1-cache-max-items", type=int, default=1024)
+    parser.add_argument("--shared-cache-ttl-secs", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cold start benchmark of the greeter lambda
+
+Every run imports the greeter in a fresh interpreter, like a new lambda
+container, with `python -X importtime`. It reports the time to import the
+greeter module (the lambda init phase), the time of the first invocation,
+which pays for any lazily built client, and the slowest modules to import,
+for each `DDB_CLIENT_INIT` mode. Times are the median over `--runs`.
+
+Usage:
+    python3 benchmark_scripts/startup_benchmark.py --runs 10 --top 15
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+GREETER_SRC = os.path.join(
+    _HERE, "..", "api_performance_with_caching", "stacks", "back_end", "lambda_src")
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    MODES = ["lazy", "preload"]
+
+
+# Runs in the fresh interpreter. The first invocation builds the real client, but
+# its response is stubbed so no AWS credentials or network are needed.
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import serverless_greeter as g
+t1 = time.perf_counter()
+from botocore.stub import Stubber
+client = g._get_ddb_client()
+t2 = time.perf_counter()
+stub = Stubber(client)
+stub.add_response("get_item", {"Item": {"id": {"S": "1"}}})
+stub.activate()
+g.lambda_handler({"id": "1"}, None)
+t3 = time.perf_counter()
+print(json.dumps({
+    "init_ms": (t1 - t0) * 1000,
+    "client_build_ms": (t2 - t1) * 1000,
+    "first_invoke_ms": (t3 - t1) * 1000,
+}), file=sys.stdout)
+"""
+
+
+def _parse_importtime(stderr):
+    """ `import time: self [us] | cumulative | imported package` lines into `{module: cumulative_us}` """
+    res = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative_us, module = line[len("import time:"):].split("|")
+        res[module.strip()] = int(cumulative_us)
+    return res
+
+
+def run_once(mode):
+    env = dict(
+        os.environ,
+        AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+        AWS_ACCESS_KEY_ID="benchmark",
+        AWS_SECRET_ACCESS_KEY="benchmark",
+        DDB_TABLE_NAME="benchmark-movies",
+        DDB_CLIENT_INIT=mode,
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=GREETER_SRC,
+    )
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(p.stdout.strip().splitlines()[-1]), _parse_importtime(p.stderr)
+
+
+def main(args):
+    report = {}
+    for mode in args.mode or GlobalArgs.MODES:
+        timings = []
+        imports = {}
+        for _ in range(args.runs):
+            t, imp = run_once(mode)
+            timings.append(t)
+            for module, us in imp.items():
+                imports.setdefault(module, []).append(us)
+        top = sorted(
+            ((m, statistics.median(v) / 1000.0) for m, v in imports.items()),
+            key=lambda x: -x[1]
+        )[:args.top]
+        report[mode] = {
+            k: round(statistics.median(t[k] for t in timings), 2) for k in timings[0]
+        }
+        report[mode]["slowest_imports_ms"] = {m: round(ms, 2) for m, ms in top}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for mode, r in report.items():
+        print(f"\n== DDB_CLIENT_INIT={mode}")
+        print(f"{'init (module import)':<40}{r['init_ms']:>10.2f} ms")
+        print(f"{'ddb client build':<40}{r['client_build_ms']:>10.2f} ms")
+        print(f"{'first invocation, after init':<40}{r['first_invoke_ms']:>10.2f} ms")
+        print("slowest imports, cumulative:")
+        for m, ms in r["slowest_imports_ms"].items():
+            print(f"  {m:<38}{ms:>10.2f} ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Cold start benchmark of the greeter lambda")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10,
+                        help="Number of slowest imports to report")
+    parser.add_argument("--mode", action="append", choices=GlobalArgs.MODES,
+                        help="DDB_CLIENT_INIT modes to compare, repeat for more")
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -24,17 +24,6 @@ class DdbDataLoaderStack(core.Construct):
     def __init__(self, scope: core.Construct, id: str, ** kwargs) -> None:
         super().__init__(scope, id)
 
-        # Read Lambda Code:)
-        try:
-            with open("data_loader_stacks/custom_resources/ddb_data_loader/lambda_src/index.py",
-                      encoding="utf-8",
-                      mode="r"
-                      ) as f:
-                ddb_data_loader_fn_code = f.read()
-        except OSError:
-            print("Unable to read Lambda Function Code")
-            raise
-
         # Create IAM Permission Statements that are required by the Lambda
 
         role_stmt1 = _iam.PolicyStatement(
@@ -42,31 +31,91 @@ class DdbDataLoaderStack(core.Construct):
             resources=["*"],
             actions=[
                 "dynamodb:PutItem",
+                "dynamodb:BatchWriteItem",
                 "dynamodb:DeleteItem",
                 "dynamodb:UpdateItem",
+                # The keys of a bloom filter added after the load
+                "dynamodb:Scan",
             ]
         )
         role_stmt1.sid = "AllowLambdaToLoadItems"
 
+        # Optional JSONL/CSV object in S3 to stream the items from, as s3://bucket/key
+        kwargs = {k: v for k, v in kwargs.items() if v is not None}
+        data_source = kwargs.get("Data_source")
+        role_stmt2 = None
+        if data_source:
+            role_stmt2 = _iam.PolicyStatement(
+                effect=_iam.Effect.ALLOW,
+                resources=[
+                    f"arn:{core.Aws.PARTITION}:s3:::{data_source.replace('s3://', '', 1)}"
+                ],
+                actions=[
+                    "s3:GetObject"
+                ]
+            )
+            role_stmt2.sid = "AllowLambdaToReadDataSource"
+
+        # Optional, the keys loaded as a bloom filter, written to Bloom_filter_bucket/Bloom_filter_key
+        role_stmt3 = None
+        role_stmt4 = None
+        if kwargs.get("Bloom_filter_bucket"):
+            role_stmt3 = _iam.PolicyStatement(
+                effect=_iam.Effect.ALLOW,
+                resources=[
+                    f"arn:{core.Aws.PARTITION}:s3:::{kwargs['Bloom_filter_bucket']}/{kwargs['Bloom_filter_key']}",
+                    # Keys added by the greeter since, merged into the filter and deleted
+                    f"arn:{core.Aws.PARTITION}:s3:::{kwargs['Bloom_filter_bucket']}/{kwargs['Bloom_filter_key']}.added/*"
+                ],
+                actions=[
+                    "s3:PutObject",
+                    "s3:DeleteObject"
+                ]
+            )
+            role_stmt3.sid = "AllowLambdaToWriteBloomFilter"
+            role_stmt4 = _iam.PolicyStatement(
+                effect=_iam.Effect.ALLOW,
+                resources=[
+                    f"arn:{core.Aws.PARTITION}:s3:::{kwargs['Bloom_filter_bucket']}"
+                ],
+                actions=[
+                    "s3:ListBucket"
+                ],
+                conditions={
+                    "StringLike": {"s3:prefix": f"{kwargs['Bloom_filter_key']}.added/*"}
+                }
+            )
+            role_stmt4.sid = "AllowLambdaToListAddedKeys"
+
         ddb_data_loader_fn = _lambda.SingletonFunction(
             self,
             "ddbDataLoaderSingleton",
             uuid=f"mystique133-0e2efcd4-3a29-e896f670",
-            code=_lambda.InlineCode(
-                ddb_data_loader_fn_code),
+            # Packaged as an asset, inline code is limited to 4KB
+            code=_lambda.Code.from_asset(
+                "data_loader_stacks/custom_resources/ddb_data_loader/lambda_src"),
             handler="index.lambda_handler",
-            timeout=core.Duration.seconds(12),
+            # Large sources are throttled by the table's write capacity, allow the max lambda runtime
+            timeout=core.Duration.minutes(15),
+            memory_size=256,
             runtime=_lambda.Runtime.PYTHON_3_7,
             reserved_concurrent_executions=1,
             environment={
                 "LOG_LEVEL": "INFO",
-                "APP_ENV": "Production"
+                "APP_ENV": "Production",
+                "LOADER_THREADS": "8",
+                "LOADER_MAX_ATTEMPTS": "10"
             },
             description="Load Data into DyanamoDB",
             function_name=f"ddbDataLoader-{id}"
         )
 
         ddb_data_loader_fn.add_to_role_policy(role_stmt1)
+        if role_stmt2:
+            ddb_data_loader_fn.add_to_role_policy(role_stmt2)
+        if role_stmt3:
+            ddb_data_loader_fn.add_to_role_policy(role_stmt3)
+            ddb_data_loader_fn.add_to_role_policy(role_stmt4)
 
         # Cfn does NOT do a good job in cleaning it up when deleting the stack. Hence commenting this section
         """
@@ -91,3 +140,9 @@ class DdbDataLoaderStack(core.Construct):
 
         self.response = ddb_data_loader.get_att(
             "data_load_status").to_string()
+        self.rows_loaded = ddb_data_loader.get_att(
+            "rows_loaded").to_string()
+        self.rows_per_sec = ddb_data_loader.get_att(
+            "rows_per_sec").to_string()
+        self.retried_items = ddb_data_loader.get_att(
+            "retried_items").to_string()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import math
+import struct
+
+
+class BloomFilter:
+    """
+    Compact set of keys, answering "definitely absent" or "maybe present"
+
+    `k` bit positions per key come from two 64-bit halves of a blake2b digest
+    (Kirsch-Mitzenmacher), so the filter is the same in every process and python version.
+    Serialized as a small header and the bit array. The `BloomFilter` of the greeter lambda module,
+    the loader needs nothing else from it. Keep the two in sync, they share the format.
+    """
+
+    MAGIC = b"BLM1"
+    HEADER = struct.Struct(">4sQIQ")
+
+    def __init__(self, num_bits, num_hashes, bits=None, count=0):
+        self.num_bits = max(int(num_bits), 8)
+        self.num_hashes = max(int(num_hashes), 1)
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+        self.bits_set = bin(int.from_bytes(self.bits, "big")).count("1")
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate=0.01):
+        """ Sized for `capacity` keys at `fp_rate`, more keys raise the false positive rate """
+        capacity = max(int(capacity), 1)
+        num_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        return cls(num_bits, round(num_bits / capacity * math.log(2)))
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack(">QQ", digest)
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key):
+        """ A key whose bits are all set already is not counted again, it may be a false positive """
+        new = False
+        for pos in self._positions(key):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                self.bits_set += 1
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def estimated_fp_rate(self):
+        """ From the share of bits set, it stays right after keys are added to a loaded filter """
+        return (self.bits_set / float(self.num_bits)) ** self.num_hashes
+
+    def to_bytes(self):
+        return self.HEADER.pack(self.MAGIC, self.num_bits, self.num_hashes, self.count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, num_bits, num_hashes, count = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError("Not a bloom filter")
+        bits = bytearray(data[cls.HEADER.size:])
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError("Truncated bloom filter")
+        return cls(num_bits, num_hashes, bits, count)
+
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+# Lambda only injects `cfnresponse` for inline (ZipFile) code. This loader is packaged
+# as an asset, so it carries this equivalent of the AWS provided module.
+
+import json
+import logging as log
+import urllib.request
+
+SUCCESS = "SUCCESS"
+FAILED = "FAILED"
+
+
+def send(event, context, responseStatus, responseData, physicalResourceId=None, noEcho=False, reason=None):
+    response_body = json.dumps({
+        "Status": responseStatus,
+        "Reason": reason or f"See the details in CloudWatch Log Stream: {context.log_stream_name}",
+        "PhysicalResourceId": physicalResourceId or context.log_stream_name,
+        "StackId": event["StackId"],
+        "RequestId": event["RequestId"],
+        "LogicalResourceId": event["LogicalResourceId"],
+        "NoEcho": noEcho,
+        "Data": responseData,
+    }).encode("utf-8")
+
+    req = urllib.request.Request(
+        event["ResponseURL"],
+        data=response_body,
+        method="PUT",
+        headers={"content-type": "", "content-length": str(len(response_body))}
+    )
+    try:
+        with urllib.request.urlopen(req) as res:
+            log.info(f"cfn_response_status: {res.status}")
+    except Exception as e:
+        log.error(f"send(..) failed executing urlopen(..): {str(e)}")
@@ -1,97 +1,286 @@
 # -*- coding: utf-8 -*-
 
+import codecs
+import csv
 import json
 import logging as log
 import os
-
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
 import boto3
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
 
 import cfnresponse
+from bloom_filter import BloomFilter
+from sample_movies import MOVIE_LIST
 
 log.getLogger().setLevel(log.INFO)
 
-_ddb_res = boto3.resource("dynamodb")
+_ddb_client = boto3.client("dynamodb")
+_s3_client = boto3.client("s3")
+_serializer = TypeSerializer()
 
 
-def _ddb_load_data(table_name):
-    _res = 400
-    table = _ddb_res.Table(table_name)
-    movie_list = [
-        {
-            "year": "2013",
-            "title": "Rush",
-            "rating": "8.3",
-        },
-        {
-            "year": "2013",
-            "title": "Prisoners",
-            "rating": "8.2"
-        },
-        {
-            "year": "2013",
-            "title": "The Hunger Games: Catching Fire",
-        },
-        {
-            "year": "2013",
-            "title": "Thor: The Dark World",
-        },
-        {
-            "year": "2013",
-            "title": "This Is the End",
-            "rating": "7.2",
-        },
-        {
-            "year": "2013",
-            "title": "Insidious: Chapter 2",
-            "rating": "7.1",
-        },
-        {
-            "year": "2013",
-            "title": "World War Z",
-            "rating": "7.1"
-        },
-        {
-            "year": "2014",
-            "title": "X-Men: Days of Future Past",
-        },
-        {
-            "year": "2014",
-            "title": "Transformers: Age of Extinction",
-        },
-        {
-            "year": "2013",
-            "title": "Now You See Me",
-            "rating": "7.3",
-        }
+class GlobalArgs:
+    """ Global statics """
+    BATCH_SIZE = 25
+    LOADER_THREADS = int(os.getenv("LOADER_THREADS", 8))
+    MAX_ATTEMPTS = int(os.getenv("LOADER_MAX_ATTEMPTS", 10))
+    BASE_BACKOFF_SECS = 0.05
+    MAX_BACKOFF_SECS = 5
+    # Stop early rather than let the custom resource time out without responding
+    SAFETY_MARGIN_MILLIS = 15000
+    BLOOM_FILTER_CAPACITY = 100000
+    BLOOM_FILTER_FP_RATE = 0.01
+    # A change to any of these on Update rebuilds the bloom filter
+    BLOOM_FILTER_PROPERTIES = ("Bloom_filter_bucket", "Bloom_filter_key", "Bloom_filter_capacity", "Bloom_filter_fp_rate")
+
+
+class LoadStats:
+    """ Helper to count rows across the writer threads """
+
+    def __init__(self):
+        self.rows_loaded = 0
+        self.retried_items = 0
+        self.throttled_requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, **kwargs):
+        with self._lock:
+            for k, v in kwargs.items():
+                setattr(self, k, getattr(self, k) + v)
+
+
+def _read_items(data_source):
+    """
+    Yields items one at a time, never holding the full dataset in memory.
+    `data_source` is an `s3://bucket/key` JSONL or CSV object, without it the sample movies are loaded.
+    """
+    if not data_source:
+        yield from MOVIE_LIST
+        return
+    bucket, _, key = data_source.replace("s3://", "", 1).partition("/")
+    body = _s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+    lines = codecs.iterdecode(body.iter_lines(), "utf-8")
+    if key.lower().endswith(".csv"):
+        yield from csv.DictReader(lines)
+    else:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line, parse_float=Decimal)
+
+
+def _batches(items, batch_size):
+    """ Groups items into batches, de-duplicating ids within a batch as BatchWriteItem rejects them """
+    batch = {}
+    for idx, item in enumerate(items):
+        item["id"] = str(item.get("id", idx))
+        # Bumped by every write to the movie, it changes the ETag served by the greeter
+        item.setdefault("version", 1)
+        batch[item["id"]] = item
+        if len(batch) == batch_size:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+
+def _backoff(attempt):
+    """ Full jitter exponential backoff """
+    time.sleep(random.uniform(
+        0, min(GlobalArgs.MAX_BACKOFF_SECS, GlobalArgs.BASE_BACKOFF_SECS * (2 ** attempt))))
+
+
+def _write_batch(table_name, batch, stats):
+    requests = [
+        {"PutRequest": {"Item": {k: _serializer.serialize(v) for k, v in item.items()}}}
+        for item in batch
     ]
+    for attempt in range(GlobalArgs.MAX_ATTEMPTS):
+        try:
+            res = _ddb_client.batch_write_item(
+                RequestItems={table_name: requests})
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("ProvisionedThroughputExceededException", "ThrottlingException"):
+                raise
+            stats.add(throttled_requests=1)
+            _backoff(attempt)
+            continue
+        unprocessed = res.get("UnprocessedItems", {}).get(table_name, [])
+        stats.add(rows_loaded=len(requests) - len(unprocessed))
+        if not unprocessed:
+            return
+        stats.add(retried_items=len(unprocessed))
+        requests = unprocessed
+        _backoff(attempt)
+    raise RuntimeError(
+        f"{len(requests)} items still unprocessed after {GlobalArgs.MAX_ATTEMPTS} attempts")
+
+
+def _put_bloom_filter(bloom_filter, bucket, key):
+    """ The greeter loads it at init and refreshes it, to answer ids that do not exist without a lookup """
+    data = bloom_filter.to_bytes()
+    _s3_client.put_object(Bucket=bucket, Key=key, Body=data, ContentType="application/octet-stream")
+    log.info(
+        f"BloomFilter: {bloom_filter.count} keys, {len(data)} bytes, est_fp_rate:{bloom_filter.estimated_fp_rate:.5f}")
+    return {
+        "bloom_filter_keys": str(bloom_filter.count),
+        "bloom_filter_bytes": str(len(data)),
+    }
+
+
+def _ddb_load_data(table_name, data_source=None, context=None, bloom_filter=None):
+    _res = 400
+    stats = LoadStats()
+    start = time.time()
+    # Bounds the batches waiting on the writer threads, so memory stays flat for any source size
+    in_flight = threading.BoundedSemaphore(GlobalArgs.LOADER_THREADS * 2)
+    futures = set()
+    stopped_early = False
     try:
-        for idx, val in enumerate(movie_list):
-            val["id"] = str(idx)
-            r = table.put_item(Item=val)
-            log.debug(json.dumps(r, indent=2))
-        _res = 200
+        with ThreadPoolExecutor(max_workers=GlobalArgs.LOADER_THREADS) as executor:
+            for batch in _batches(_read_items(data_source), GlobalArgs.BATCH_SIZE):
+                if context and context.get_remaining_time_in_millis() < GlobalArgs.SAFETY_MARGIN_MILLIS:
+                    log.error("DataLoadStatus: Stopping early, running out of time")
+                    stopped_early = True
+                    break
+                if bloom_filter is not None:
+                    for item in batch:
+                        bloom_filter.add(item["id"])
+                in_flight.acquire()
+                f = executor.submit(_write_batch, table_name, batch, stats)
+                f.add_done_callback(lambda _: in_flight.release())
+                futures.add(f)
+                # Surface write errors early and drop finished futures
+                for done in [f for f in futures if f.done()]:
+                    futures.discard(done)
+                    done.result()
+            for f in futures:
+                f.result()
+        _res = 206 if stopped_early else 200
     except Exception as e:
         log.error(f"DataLoadStatus: {str(e)}")
-    return _res
+    elapsed = max(time.time() - start, 1e-6)
+    load_stats = {
+        "rows_loaded": str(stats.rows_loaded),
+        "rows_per_sec": f"{stats.rows_loaded / elapsed:.1f}",
+        "retried_items": str(stats.retried_items),
+        "throttled_requests": str(stats.throttled_requests),
+    }
+    log.info(f"DataLoadStats: {json.dumps(load_stats)}")
+    return _res, load_stats
+
+
+def _new_bloom_filter(props):
+    if not props.get("Bloom_filter_bucket"):
+        return None
+    return BloomFilter.for_capacity(
+        props.get("Bloom_filter_capacity", GlobalArgs.BLOOM_FILTER_CAPACITY),
+        float(props.get("Bloom_filter_fp_rate", GlobalArgs.BLOOM_FILTER_FP_RATE))
+    )
+
+
+def _scan_keys(table_name, bloom_filter):
+    """ The ids already in the table, for a filter added or resized after the load """
+    kwargs = {"TableName": table_name, "ProjectionExpression": "id"}
+    while True:
+        res = _ddb_client.scan(**kwargs)
+        for item in res.get("Items", []):
+            bloom_filter.add(item["id"]["S"])
+        if not res.get("LastEvaluatedKey"):
+            return
+        kwargs["ExclusiveStartKey"] = res["LastEvaluatedKey"]
+
+
+def _added_keys_prefix(props):
+    """ The greeter records every key it adds as an empty object, `<filter key>.added/<id>` """
+    return f"{props['Bloom_filter_key']}.added/"
+
+
+def _list_added_keys(props):
+    """ Listed ahead of the build, keys added while it runs are left for the greeter to list """
+    kwargs = {"Bucket": props["Bloom_filter_bucket"], "Prefix": _added_keys_prefix(props)}
+    keys = []
+    try:
+        while True:
+            res = _s3_client.list_objects_v2(**kwargs)
+            keys.extend(obj["Key"] for obj in res.get("Contents", []))
+            if not res.get("IsTruncated"):
+                return keys
+            kwargs["ContinuationToken"] = res["NextContinuationToken"]
+    except ClientError as e:
+        log.error(f"BloomFilter: {str(e)}")
+        return keys
+
+
+def _delete_added_keys(props, keys):
+    """ Merged into the filter published, the greeter no longer lists them on every refresh """
+    for i in range(0, len(keys), 1000):
+        _s3_client.delete_objects(
+            Bucket=props["Bloom_filter_bucket"],
+            Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True}
+        )
+
+
+def _publish_bloom_filter(bloom_filter, props, added_keys=()):
+    """ A missing filter just turns it off, the load does not fail for it """
+    prefix = _added_keys_prefix(props)
+    for k in added_keys:
+        bloom_filter.add(k[len(prefix):])
+    try:
+        stats = _put_bloom_filter(bloom_filter, props["Bloom_filter_bucket"], props["Bloom_filter_key"])
+        _delete_added_keys(props, list(added_keys))
+    except ClientError as e:
+        log.error(f"BloomFilter: {str(e)}")
+        return {}
+    return stats
 
 
 def lambda_handler(event, context):
     log.info(f"event: {event}")
     physical_id = 'MystiqueAutomationCustomRes'
+    attributes = {}
 
     try:
         # MINE
         cfn_stack_name = event.get("StackId").split("/")[-2]
         resource_id = event.get("LogicalResourceId")
         res = ""
-        table_name = event.get("ResourceProperties").get("Ddb_table_name")
+        # Every attribute is returned on every request, GetAtt fails for a missing one
+        load_stats = {"rows_loaded": "0", "rows_per_sec": "0.0", "retried_items": "0", "throttled_requests": "0"}
+        props = event.get("ResourceProperties")
+        old_props = event.get("OldResourceProperties") or {}
+        table_name = props.get("Ddb_table_name")
+        data_source = props.get("Data_source")
 
-        if event["RequestType"] == "Create" and event["ResourceProperties"].get("FailCreate", False):
+        if event["RequestType"] == "Create" and props.get("FailCreate", False):
             log.info(f"FailCreate")
             raise RuntimeError("Create failure requested")
-        if event["RequestType"] == "Create":
-            res = _ddb_load_data(table_name)
+        if event["RequestType"] == "Create" or (
+                event["RequestType"] == "Update" and data_source != old_props.get("Data_source")):
+            bloom_filter = _new_bloom_filter(props)
+            # The movies created through the api since the last build are still in the table
+            added_keys = _list_added_keys(props) if bloom_filter is not None else []
+            res, load_stats = _ddb_load_data(table_name, data_source, context, bloom_filter)
+            # Only the keys of a (partly) successful load
+            if bloom_filter is not None and res in (200, 206):
+                load_stats.update(_publish_bloom_filter(bloom_filter, props, added_keys))
+        elif event["RequestType"] == "Update" and any(
+                props.get(k) != old_props.get(k) for k in GlobalArgs.BLOOM_FILTER_PROPERTIES):
+            # Reloading would overwrite the movies changed since, the filter is built from the table
+            bloom_filter = _new_bloom_filter(props)
+            res = "no_updates_made"
+            if bloom_filter is not None:
+                # Listed first, the scan reads every movie they were recorded for
+                added_keys = _list_added_keys(props)
+                _scan_keys(table_name, bloom_filter)
+                load_stats.update(_publish_bloom_filter(bloom_filter, props, added_keys))
+                res = "bloom_filter_rebuilt"
         elif event["RequestType"] == "Update":
             res = "no_updates_made"
             pass
@@ -104,7 +293,8 @@ def lambda_handler(event, context):
 
         # MINE
         attributes = {
-            "data_load_status": f"HTTPStatusCode-{res}"
+            "data_load_status": f"HTTPStatusCode-{res}",
+            **load_stats
         }
         cfnresponse.send(event, context, cfnresponse.SUCCESS,
                          attributes, physical_id)
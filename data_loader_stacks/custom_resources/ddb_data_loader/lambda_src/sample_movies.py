@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""
+The movies loaded when no data source is given, also packaged into the greeter catalogue at synth
+"""
+
+MOVIE_LIST = [
+    {
+        "year": "2013",
+        "title": "Rush",
+        "rating": "8.3",
+    },
+    {
+        "year": "2013",
+        "title": "Prisoners",
+        "rating": "8.2"
+    },
+    {
+        "year": "2013",
+        "title": "The Hunger Games: Catching Fire",
+    },
+    {
+        "year": "2013",
+        "title": "Thor: The Dark World",
+    },
+    {
+        "year": "2013",
+        "title": "This Is the End",
+        "rating": "7.2",
+    },
+    {
+        "year": "2013",
+        "title": "Insidious: Chapter 2",
+        "rating": "7.1",
+    },
+    {
+        "year": "2013",
+        "title": "World War Z",
+        "rating": "7.1"
+    },
+    {
+        "year": "2014",
+        "title": "X-Men: Days of Future Past",
+    },
+    {
+        "year": "2014",
+        "title": "Transformers: Age of Extinction",
+    },
+    {
+        "year": "2013",
+        "title": "Now You See Me",
+        "rating": "7.3",
+    }
+]
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Capacity plan for the movies table, the stage cache and the greeter, from load test results
+
+Sizes, for each api, from what was measured rather than guessed:
+  - the read capacity of the table, with and without the stage cache in front of it,
+    `invocations per second at the peak x item reads per invocation x RCU per read`
+  - its write capacity, `writes per second x WCU per write`, at least `--min-write-capacity`
+  - the reserved concurrency of the greeter, by Little's law,
+    `invocations per second at the peak x p99 duration`
+  - the stage cache cluster, the smallest that holds every response cached within a TTL
+each at `--target-utilization` of what is provisioned, to leave headroom.
+
+Misses cluster, at the onset of a burst, when entries expire together and after the
+stage cache is flushed, as a resize by the profile switcher does. The invocations at
+the peak are the most in any second behind an ideal cache of `--cache-ttl-secs`, never
+fewer than `peak rps x (1 - hit ratio)`. The stage cache does not coalesce misses
+either: cold, every request misses until the first response of its key is cached, a
+greeter duration later. The read capacity is never planned below the reads of that
+window at the peak, nor the reserved concurrency below the peak for that long, which
+is the concurrency without the cache.
+
+The traffic comes from the logs of `load_generator.py`, the peak request rate, the
+ids per request, the hit ratio seen by the client and the response sizes, or from a
+`--scenario` of `workload_model.py`, with the hit ratio of an ideal cache of
+`--cache-ttl-secs`. The cost of an invocation comes from the EMF records of the
+greeter, deployed with `RETURN_CONSUMED_CAPACITY`: the capacity units DynamoDB
+billed, by the size of the whole items, and the items read, after the in-container
+caches & the bloom filter. Without them, every id is read from DynamoDB at
+`--rcu-per-read`.
+
+`--emit-context` writes the plan as CDK context, `caching_profiles` for the
+cached api and `uncached_api_capacity` for the uncached one.
+
+Usage:
+    aws logs filter-log-events --log-group-name /aws/lambda/greeter_fn_cached-api \\
+        --filter-pattern '{ $.HandlerDuration = * }' --query 'events[].message' \\
+        --output text > greeter_emf.log
+    python3 capacity_planner.py --load-log cached.log --load-log uncached.log \\
+        --greeter-log greeter_emf.log --cache-ttl-secs 300 --emit-context plan.json
+    python3 capacity_planner.py --scenario scenarios/match_day.json --seed 7 --cache-ttl-secs 300
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from latency_histogram import LatencyHistogram  # noqa: E402
+from staleness_analyzer import FreshnessTracker  # noqa: E402
+from workload_model import GlobalArgs as WorkloadArgs  # noqa: E402
+from workload_model import Workload, ttl_hit_ratio  # noqa: E402
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    APIS = ("uncached", "cached")
+    # DynamoDB auto scaling tracks 70% by default, the same headroom for everything planned
+    TARGET_UTILIZATION = 0.7
+    # Of the requests per second, the max is one noisy second
+    PEAK_PERCENTILE = 99
+    # An eventually consistent read of an item up to 4KB, a write up to 1KB, and the
+    # strongly consistent read of the version before it
+    RCU_PER_READ = 0.5
+    WCU_PER_WRITE = 1.0
+    RCU_PER_WRITE = 1.0
+    # The data loader writes the whole source at deploy, and later loads, in batches of 25
+    # from 8 threads. Fewer writes in the load test do not make that need go away.
+    MIN_WRITE_CAPACITY = 20
+    RESPONSE_BYTES = 1024
+    # Sizes, in GB, API Gateway offers for the stage cache
+    CACHE_CLUSTER_SIZES = ("0.5", "1.6", "6.1", "13.5", "28.4", "58.2", "118", "237")
+    # Cache keys, headers & the cache engine's own bookkeeping, per byte of body
+    CACHE_OVERHEAD = 2.0
+
+
+class TrafficProfile:
+    """ Requests of one api, as sent by the load generator or scheduled by a scenario """
+
+    def __init__(self, api):
+        self.api = api
+        self.sent_at = []
+        self.ids_per_request = []
+        self.cache_keys = []
+        self.uncacheable_at = []
+        self.response_bytes = []
+        self.freshness = FreshnessTracker()
+        self.latency = LatencyHistogram()
+        self.hit_ratio = None
+
+    def add(self, sent_at, ids, cache_key, response_bytes=None):
+        """ `cache_key` is `None` for routes the stage cache does not serve """
+        self.sent_at.append(sent_at)
+        # A random movie is one read, a batch one per id
+        self.ids_per_request.append(max(len(ids), 1))
+        if cache_key is not None:
+            self.cache_keys.append((sent_at, cache_key))
+        else:
+            self.uncacheable_at.append(sent_at)
+        if response_bytes:
+            self.response_bytes.append(response_bytes)
+
+    @property
+    def requests(self):
+        return len(self.sent_at)
+
+    def duration_secs(self):
+        return max(self.sent_at) - min(self.sent_at) if self.sent_at else 0.0
+
+    def rates(self, times=None):
+        """ Requests, or those sent at `times`, in every second of the test, seconds without any included """
+        if not self.sent_at:
+            return [0]
+        start = min(self.sent_at)
+        counts = [0] * (int(self.duration_secs()) + 1)
+        for t in self.sent_at if times is None else times:
+            counts[int(t - start)] += 1
+        return counts
+
+    def miss_rates(self, ttl_secs):
+        """
+        Requests reaching the greeter in every second, behind an ideal stage cache of `ttl_secs`:
+        those of uncached routes, and the first of a key and the first after its entry expired
+        """
+        filled = {}
+        missed = list(self.uncacheable_at)
+        for t, key in sorted(self.cache_keys):
+            at = filled.get(key)
+            if at is None or t - at >= ttl_secs:
+                filled[key] = t
+                missed.append(t)
+        return self.rates(missed)
+
+    def peak_rps(self, percentile=GlobalArgs.PEAK_PERCENTILE, rates=None):
+        rates = sorted(self.rates() if rates is None else rates)
+        return float(rates[min(int(math.ceil(len(rates) * percentile / 100.0)) - 1, len(rates) - 1)])
+
+    def mean_rps(self):
+        return self.requests / max(self.duration_secs(), 1.0)
+
+    def item_reads_per_request(self):
+        return sum(self.ids_per_request) / len(self.ids_per_request) if self.ids_per_request else 1.0
+
+    def working_set(self, ttl_secs):
+        """ Most distinct cache keys requested within any `ttl_secs`, each an entry of the stage cache """
+        keys = sorted(self.cache_keys)
+        live = {}
+        most = lo = 0
+        for t, key in keys:
+            live[key] = live.get(key, 0) + 1
+            while keys[lo][0] <= t - ttl_secs:
+                old = keys[lo][1]
+                live[old] -= 1
+                if not live[old]:
+                    del live[old]
+                lo += 1
+            most = max(most, len(live))
+        return most
+
+    def mean_response_bytes(self, default=GlobalArgs.RESPONSE_BYTES):
+        return sum(self.response_bytes) / len(self.response_bytes) if self.response_bytes else default
+
+
+class GreeterProfile:
+    """ Cost of the greeter invocations of one api, from its EMF records """
+
+    def __init__(self, api):
+        self.api = api
+        self.invocations = 0
+        self.get_invocations = 0
+        self.items_read = 0
+        self.read_units = 0.0
+        self.items_written = 0
+        self.write_units = 0.0
+        self.write_read_units = 0.0
+        self.hedges_fired = 0
+        self.duration = LatencyHistogram()
+        self.timestamps = []
+
+    def add(self, rec):
+        self.invocations += 1
+        if str(rec.get("Route", "")).startswith("PUT"):
+            # The version read of a write is billed with the write
+            self.write_read_units += _total(rec.get("ConsumedReadCapacity"))
+        else:
+            self.get_invocations += 1
+            self.items_read += _total(rec.get("DdbItemsRead"))
+            self.read_units += _total(rec.get("ConsumedReadCapacity"))
+        self.items_written += _total(rec.get("DdbItemsWritten"))
+        self.write_units += _total(rec.get("ConsumedWriteCapacity"))
+        self.hedges_fired += _total(rec.get("HedgesFired"))
+        if rec.get("HandlerDuration") is not None:
+            self.duration.record(_total(rec["HandlerDuration"]) * 1000.0)
+        ts = rec.get("_aws", {}).get("Timestamp")
+        if ts:
+            self.timestamps.append(ts / 1000.0)
+
+    def rcu_per_read(self):
+        """ Hedged reads are billed too, only the one that won is reported """
+        if not self.items_read:
+            return None
+        return self.read_units / self.items_read * (1 + self.hedges_fired / self.items_read)
+
+    def reads_per_invocation(self):
+        return self.items_read / self.get_invocations if self.get_invocations else None
+
+    def wcu_per_write(self):
+        return self.write_units / self.items_written if self.items_written else None
+
+    def rcu_per_write(self):
+        return self.write_read_units / self.items_written if self.items_written else None
+
+    def writes_per_sec(self):
+        if not self.items_written or len(self.timestamps) < 2:
+            return None
+        return self.items_written / max(max(self.timestamps) - min(self.timestamps), 1.0)
+
+    def duration_p99_secs(self):
+        return self.duration.percentile(99) / 1e6 if self.duration.count else None
+
+
+def _total(val):
+    """ EMF values are a number, or a list of them when a metric was put more than once """
+    if val is None:
+        return 0
+    return sum(val) if isinstance(val, list) else val
+
+
+def _float(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def _api_of(name):
+    """ `uncached`, `uncached-api` or `greeter_fn_uncached-api` to `uncached` """
+    name = str(name or "")
+    return "uncached" if "uncached" in name else "cached" if "cached" in name else None
+
+
+def read_load_log(path, profiles):
+    """ Lines of `load_generator.py`, or of the bash script, which only has the latency """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            api = next((k[:-len("_latency")] for k in rec if k.endswith("_latency") and k != "corrected_latency"), None)
+            sent_at = _float(rec.get("sent_at"))
+            if api not in GlobalArgs.APIS or sent_at is None:
+                continue
+            p = profiles.setdefault(api, TrafficProfile(api))
+            ids = [i for i in str(rec.get("id") or "").split(",") if i]
+            route = rec.get("route") or ("batch" if len(ids) > 1 else "by_id" if ids else "random")
+            # Only `/movie/{id}` responses take up the stage cache
+            cache_key = f"{route}:{','.join(ids)}" if route in WorkloadArgs.CACHEABLE_ROUTES else None
+            p.add(sent_at, ids, cache_key, rec.get("bytes"))
+            latency = _float(rec.get(f"{api}_latency")) or 0.0
+            p.latency.record(latency * 1e6)
+            generated_at = _float(rec.get("generated_at"))
+            p.freshness.record(sent_at, _float(rec.get("received_at")) or sent_at + latency,
+                               latency, generated_at, rec.get("served_by") or "")
+
+
+def read_greeter_log(path, profiles):
+    """ EMF records, one per line, alone or after the timestamp & request id of a log export """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            start = line.find("{")
+            if start < 0:
+                continue
+            try:
+                rec = json.loads(line[start:])
+            except ValueError:
+                continue
+            api = _api_of(rec.get("Stack"))
+            if "_aws" not in rec or api is None:
+                continue
+            profiles.setdefault(api, GreeterProfile(api)).add(rec)
+
+
+def profiles_from_scenario(workload, seed, cache_ttl_secs):
+    """ The same schedule for both apis, the cached one hits an ideal cache of `cache_ttl_secs` """
+    requests = list(workload.requests(seed))
+    profiles = {}
+    for api in GlobalArgs.APIS:
+        p = profiles[api] = TrafficProfile(api)
+        for r in requests:
+            p.add(r.offset, r.ids, r.path() if r.route in WorkloadArgs.CACHEABLE_ROUTES else None)
+    cacheable = sum(1 for r in requests if r.route in WorkloadArgs.CACHEABLE_ROUTES)
+    profiles["uncached"].hit_ratio = 0.0
+    profiles["cached"].hit_ratio = (
+        ttl_hit_ratio(requests, cache_ttl_secs) * cacheable / len(requests) if requests else 0.0)
+    return profiles
+
+
+def _units(val, utilization):
+    return max(int(math.ceil(val / utilization - 1e-9)), 1)
+
+
+def cache_cluster_size(needed_bytes):
+    """ The smallest stage cache that holds `needed_bytes`, the largest when none does """
+    for size in GlobalArgs.CACHE_CLUSTER_SIZES:
+        if float(size) * 1024 ** 3 >= needed_bytes:
+            return size
+    return GlobalArgs.CACHE_CLUSTER_SIZES[-1]
+
+
+def plan(traffic, greeter, args):
+    """ Capacity of one api, with the measurements it is based on """
+    util = args.target_utilization
+    hit_ratio = traffic.hit_ratio
+    if traffic.api != "cached":
+        hit_ratio = 0.0
+    elif args.hit_ratio is not None:
+        hit_ratio = args.hit_ratio
+    elif hit_ratio is None:
+        # As seen by the client, from the X-Served-By & X-Generated-At of the responses
+        hit_ratio = traffic.freshness.hit_ratio() or 0.0
+    peak_rps = traffic.peak_rps(args.peak_percentile)
+    item_reads = traffic.item_reads_per_request()
+
+    measured = greeter is not None and greeter.items_read > 0
+    rcu_per_read = args.rcu_per_read or (greeter.rcu_per_read() if measured else None) or GlobalArgs.RCU_PER_READ
+    # Reads an invocation makes after the in-container caches, the bloom filter & the catalogue
+    reads_per_invocation = (greeter.reads_per_invocation() if measured else None) or item_reads
+    wcu_per_write = args.wcu_per_write or (greeter and greeter.wcu_per_write()) or GlobalArgs.WCU_PER_WRITE
+    rcu_per_write = (greeter and greeter.rcu_per_write()) or GlobalArgs.RCU_PER_WRITE
+    writes_per_sec = args.writes_per_sec
+    if writes_per_sec is None:
+        writes_per_sec = (greeter and greeter.writes_per_sec()) or 0.0
+    duration_secs = args.duration_ms / 1000.0 if args.duration_ms else (
+        (greeter and greeter.duration_p99_secs()) or (traffic.latency.percentile(99) or 0) / 1e6 or 0.1)
+
+    # Misses cluster, the busiest second behind the cache, not the peak at the average hit ratio
+    peak_miss_rps = peak_rps
+    if traffic.api == "cached":
+        peak_miss_rps = traffic.peak_rps(100, traffic.miss_rates(args.cache_ttl_secs))
+    invocations = max(peak_rps * (1 - hit_ratio), peak_miss_rps)
+    # A cold cache, after a flush or at the onset of a burst, passes the peak on until the first
+    # responses are cached, one greeter duration later
+    cold_invocations = peak_rps * min(duration_secs, 1.0)
+    working_set = traffic.working_set(args.cache_ttl_secs)
+    response_bytes = traffic.mean_response_bytes()
+    res = {
+        "measured": {
+            "requests": traffic.requests,
+            "duration_secs": round(traffic.duration_secs(), 1),
+            "mean_rps": round(traffic.mean_rps(), 1),
+            "peak_rps": peak_rps,
+            "hit_ratio": round(hit_ratio, 4),
+            "peak_miss_rps": peak_miss_rps,
+            "item_reads_per_request": round(item_reads, 3),
+            "item_reads_per_invocation": round(reads_per_invocation, 3),
+            "rcu_per_read": round(rcu_per_read, 3),
+            "writes_per_sec": round(writes_per_sec, 3),
+            "wcu_per_write": round(wcu_per_write, 3),
+            "rcu_per_write": round(rcu_per_write, 3),
+            "duration_p99_ms": round(duration_secs * 1000.0, 1),
+            "cache_working_set": working_set,
+            "response_bytes": round(response_bytes),
+            "from_greeter_metrics": measured,
+        },
+        "plan": {
+            "ddb_read_capacity": _units(
+                max(invocations, cold_invocations) * reads_per_invocation * rcu_per_read
+                + writes_per_sec * rcu_per_write, util),
+            "ddb_read_capacity_without_cache": _units(
+                peak_rps * item_reads * rcu_per_read + writes_per_sec * rcu_per_write, util),
+            "ddb_write_capacity": max(_units(writes_per_sec * wcu_per_write, util), args.min_write_capacity),
+            # Cold, the whole peak reaches the greeter, as without the cache
+            "reserved_concurrency": _units(max(invocations, peak_rps) * duration_secs, util),
+            "reserved_concurrency_without_cache": _units(peak_rps * duration_secs, util),
+        },
+    }
+    if traffic.api == "cached":
+        res["plan"]["cache_cluster_size"] = cache_cluster_size(
+            working_set * response_bytes * GlobalArgs.CACHE_OVERHEAD / util)
+    return res
+
+
+def cdk_context(plans, profile):
+    """ `caching_profiles` overrides for the cached api, `uncached_api_capacity` for the uncached one """
+    keys = ("ddb_read_capacity", "ddb_write_capacity", "reserved_concurrency")
+    ctx = {}
+    if "cached" in plans:
+        p = plans["cached"]["plan"]
+        ctx["caching_profiles"] = {profile: dict({k: p[k] for k in keys}, cache_cluster_size=p["cache_cluster_size"])}
+    if "uncached" in plans:
+        ctx["uncached_api_capacity"] = {k: plans["uncached"]["plan"][k] for k in keys}
+    elif "cached" in plans:
+        # Without a run against the uncached api, the cached one with its cache taken away
+        p = plans["cached"]["plan"]
+        ctx["uncached_api_capacity"] = {
+            "ddb_read_capacity": p["ddb_read_capacity_without_cache"],
+            "ddb_write_capacity": p["ddb_write_capacity"],
+            "reserved_concurrency": p["reserved_concurrency_without_cache"],
+        }
+    return ctx
+
+
+def print_report(plans):
+    for api, p in plans.items():
+        m = p["measured"]
+        print(f"\n== {api}: peak {m['peak_rps']:g} rps, {m['peak_miss_rps']:g} past the cache, hit ratio {m['hit_ratio']}, "
+              f"{m['item_reads_per_invocation']:g} reads/invocation at {m['rcu_per_read']:g} RCU, "
+              f"p99 {m['duration_p99_ms']:g} ms"
+              f"{'' if m['from_greeter_metrics'] else ', without greeter metrics'}")
+        for k, v in p["plan"].items():
+            print(f"  {k:<36}{v:>10}")
+
+
+def main(args):
+    if args.scenario:
+        traffic = profiles_from_scenario(Workload.from_file(args.scenario), args.seed, args.cache_ttl_secs)
+    else:
+        traffic = {}
+        for path in args.load_log:
+            read_load_log(path, traffic)
+    greeters = {}
+    for path in args.greeter_log:
+        read_greeter_log(path, greeters)
+    if not traffic:
+        sys.exit("No requests found, give --load-log files of load_generator.py or a --scenario")
+
+    plans = {api: plan(traffic[api], greeters.get(api), args) for api in GlobalArgs.APIS if api in traffic}
+    ctx = cdk_context(plans, args.profile)
+    if args.emit_context:
+        with open(args.emit_context, mode="w", encoding="utf-8") as f:
+            json.dump(ctx, f, indent=2)
+    if args.json:
+        print(json.dumps({"plans": plans, "context": ctx}, indent=2))
+        return
+    print_report(plans)
+    print("\ncdk deploy " + " ".join(f"-c {k}='{json.dumps(v, separators=(',', ':'))}'" for k, v in ctx.items()))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Capacity plan for the movies table, the stage cache and the greeter, from load test results")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--load-log", action="append", default=[], help="Log of load_generator.py, repeatable")
+    src.add_argument("--scenario", help="Plan for a workload_model.py scenario instead")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the --scenario schedule")
+    parser.add_argument("--greeter-log", action="append", default=[],
+                        help="EMF records of the greeter, deployed with RETURN_CONSUMED_CAPACITY, repeatable")
+    parser.add_argument("--cache-ttl-secs", type=float, default=300,
+                        help="Stage cache TTL, for the working set and the hit ratio of a --scenario")
+    parser.add_argument("--hit-ratio", type=float, default=None, help="Stage cache hit ratio to plan for")
+    parser.add_argument("--rcu-per-read", type=float, default=None,
+                        help=f"Default {GlobalArgs.RCU_PER_READ}, or as measured by the greeter")
+    parser.add_argument("--wcu-per-write", type=float, default=None,
+                        help=f"Default {GlobalArgs.WCU_PER_WRITE}, or as measured by the greeter")
+    parser.add_argument("--writes-per-sec", type=float, default=None,
+                        help="Movie writes to plan for, default as measured by the greeter, else none")
+    parser.add_argument("--min-write-capacity", type=int, default=GlobalArgs.MIN_WRITE_CAPACITY,
+                        help="Floor of the planned WCU, for the data loader, default %(default)s")
+    parser.add_argument("--duration-ms", type=float, default=None,
+                        help="Greeter duration, default its p99, else the p99 latency of the load test")
+    parser.add_argument("--peak-percentile", type=float, default=GlobalArgs.PEAK_PERCENTILE,
+                        help="Percentile of the requests per second to plan for, 100 for the busiest second")
+    parser.add_argument("--target-utilization", type=float, default=GlobalArgs.TARGET_UTILIZATION)
+    parser.add_argument("--profile", default="default", help="Caching profile the cached api plan overrides")
+    parser.add_argument("--emit-context", help="Write the plan as CDK context to this file")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+    if not 0 < args.target_utilization <= 1:
+        parser.error("--target-utilization must be in (0, 1]")
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        main(parse_args())
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Capacity planner: {e}")
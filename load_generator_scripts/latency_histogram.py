@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+HDR-style log-linear latency histogram
+
+Values are recorded in microseconds. Every power of two range is split into
+`2 ** (SUB_BUCKET_BITS - 1)` linear buckets, so percentiles are accurate to
+within ~1.5% across the whole range, using a few KB of memory regardless of
+how many values are recorded.
+"""
+
+import math
+
+
+class LatencyHistogram:
+    """ Helper to record latencies and report percentiles in constant memory """
+
+    SUB_BUCKET_BITS = 7
+    _SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    _HALF = _SUB_BUCKETS >> 1
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = None
+
+    @classmethod
+    def bucket_index(cls, value_us):
+        v = max(int(value_us), 0)
+        if v < cls._SUB_BUCKETS:
+            return v
+        e = v.bit_length() - cls.SUB_BUCKET_BITS
+        return cls._SUB_BUCKETS + (e - 1) * cls._HALF + ((v >> e) - cls._HALF)
+
+    @classmethod
+    def bucket_bounds(cls, idx):
+        """ Returns the `(lowest, highest)` microsecond values that fall in bucket `idx` """
+        if idx < cls._SUB_BUCKETS:
+            return idx, idx
+        e, m = divmod(idx - cls._SUB_BUCKETS, cls._HALF)
+        e += 1
+        m += cls._HALF
+        return m << e, ((m + 1) << e) - 1
+
+    def record(self, value_us, n=1):
+        value_us = int(value_us)
+        idx = self.bucket_index(value_us)
+        self.counts[idx] = self.counts.get(idx, 0) + n
+        self.count += n
+        self.total_us += value_us * n
+        self.min_us = value_us if self.min_us is None else min(self.min_us, value_us)
+        self.max_us = value_us if self.max_us is None else max(self.max_us, value_us)
+
+    def record_many(self, values_us):
+        """ Vectorised record of a numpy array of microsecond values """
+        import numpy as np
+        v = np.maximum(np.asarray(values_us, dtype=np.int64), 0)
+        if not v.size:
+            return
+        # bit_length() for every value, via frexp on float64 which is exact below 2**53
+        _, exps = np.frexp(v.astype(np.float64))
+        e = np.maximum(exps - self.SUB_BUCKET_BITS, 0)
+        idx = np.where(
+            v < self._SUB_BUCKETS,
+            v,
+            self._SUB_BUCKETS + (e - 1) * self._HALF + ((v >> e) - self._HALF)
+        )
+        uniq, cnts = np.unique(idx, return_counts=True)
+        for i, c in zip(uniq.tolist(), cnts.tolist()):
+            self.counts[i] = self.counts.get(i, 0) + c
+        self.count += int(v.size)
+        self.total_us += int(v.sum())
+        vmin, vmax = int(v.min()), int(v.max())
+        self.min_us = vmin if self.min_us is None else min(self.min_us, vmin)
+        self.max_us = vmax if self.max_us is None else max(self.max_us, vmax)
+
+    def merge(self, other):
+        for idx, c in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + c
+        self.count += other.count
+        self.total_us += other.total_us
+        for v in (other.min_us, other.max_us):
+            if v is not None:
+                self.min_us = v if self.min_us is None else min(self.min_us, v)
+                self.max_us = v if self.max_us is None else max(self.max_us, v)
+        return self
+
+    def percentile(self, pct):
+        """ Latency in microseconds at or below which `pct` percent of the values fall """
+        if not self.count:
+            return None
+        rank = max(math.ceil(self.count * pct / 100.0), 1)
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                low, high = self.bucket_bounds(idx)
+                return min(max((low + high) // 2, self.min_us), self.max_us)
+        return self.max_us
+
+    def mean(self):
+        return self.total_us / self.count if self.count else None
+
+    def buckets(self):
+        """ Yields `(lowest_us, highest_us, count)` for every non empty bucket, in order """
+        for idx in sorted(self.counts):
+            low, high = self.bucket_bounds(idx)
+            yield low, high, self.counts[idx]
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)):
+        res = {
+            "count": self.count,
+            "min_ms": _to_ms(self.min_us),
+            "mean_ms": _to_ms(self.mean()),
+            "max_ms": _to_ms(self.max_us),
+        }
+        for p in percentiles:
+            res[f"p{p:g}_ms"] = _to_ms(self.percentile(p))
+        return res
+
+    def to_dict(self):
+        return {
+            "sub_bucket_bits": self.SUB_BUCKET_BITS,
+            "count": self.count,
+            "total_us": self.total_us,
+            "min_us": self.min_us,
+            "max_us": self.max_us,
+            "counts": {str(k): v for k, v in sorted(self.counts.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        h = cls()
+        h.counts = {int(k): v for k, v in d["counts"].items()}
+        h.count = d["count"]
+        h.total_us = d["total_us"]
+        h.min_us = d["min_us"]
+        h.max_us = d["max_us"]
+        return h
+
+
+def _to_ms(us):
+    return None if us is None else round(us / 1000.0, 3)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cached vs uncached latency report from the load generator logs
+
+Streams the `{"cached_latency": "0.123"}` / `{"uncached_latency": "0.456"}`
+lines written by the load generator (and the earlier bash script) in fixed
+size blocks, so multi GB logs are analysed in constant memory. Each block is
+parsed with a single regex pass and recorded into log-linear histograms with
+numpy, per API and per load phase.
+
+Logs without a `phase` field come from the bash script, which ran 2000
+requests per phase at 0.1s..0.5s apart, so their phase is taken from the line
+number, see `--phase-size`.
+
+Usage:
+    pip3 install numpy
+    python3 latency_log_analyzer.py \\
+        /var/log/miztiik-load-generator-uncached.log \\
+        /var/log/miztiik-load-generator-cached.log
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from latency_histogram import LatencyHistogram  # noqa: E402
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    LOG_FILES = [
+        "/var/log/miztiik-load-generator-uncached.log",
+        "/var/log/miztiik-load-generator-cached.log",
+    ]
+    BLOCK_SIZE = 64 * 1024 * 1024
+    PHASE_SIZE = 2000
+    PERCENTILES = (50, 90, 99, 99.9)
+
+
+_LINE_RE = re.compile(
+    rb'"(cached|uncached)_latency":\s*"?([0-9.eE+-]+)"?(?:[^\n]*?"phase":\s*(\d+))?[^\n]*\n')
+
+
+def _blocks(path, block_size):
+    """ Yields blocks of whole lines """
+    with open(path, mode="rb") as f:
+        tail = b""
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            data = tail + data
+            cut = data.rfind(b"\n") + 1
+            tail = data[cut:]
+            if cut:
+                yield data[:cut]
+        if tail:
+            yield tail + b"\n"
+
+
+class LatencyReport:
+    """ Helper to hold a histogram per `(api, phase)` """
+
+    def __init__(self, phase_size):
+        self.phase_size = phase_size
+        self.histograms = {}
+        self.lines_without_phase = {}
+
+    def _hist(self, api, phase):
+        return self.histograms.setdefault((api, phase), LatencyHistogram())
+
+    def add_block(self, block):
+        rows = _LINE_RE.findall(block)
+        if not rows:
+            return
+        apis, latencies, phases = (np.array(col) for col in zip(*rows))
+        latencies_us = np.rint(latencies.astype(np.float64) * 1e6).astype(np.int64)
+        for api in np.unique(apis):
+            mask = apis == api
+            api_name = api.decode()
+            api_phases = phases[mask]
+            has_phase = api_phases != b""
+            phase_ids = np.zeros(api_phases.size, dtype=np.int64)
+            if has_phase.any():
+                phase_ids[has_phase] = api_phases[has_phase].astype(np.int64)
+            missing = int((~has_phase).sum())
+            if missing:
+                # Bash script logs, the phase follows from the line number
+                seen = self.lines_without_phase.get(api_name, 0)
+                phase_ids[~has_phase] = (
+                    seen + np.arange(missing)) // self.phase_size
+                self.lines_without_phase[api_name] = seen + missing
+            api_latencies = latencies_us[mask]
+            for phase in np.unique(phase_ids):
+                self._hist(api_name, int(phase)).record_many(
+                    api_latencies[phase_ids == phase])
+
+    def apis(self):
+        return sorted({api for api, _ in self.histograms})
+
+    def phases(self):
+        return sorted({phase for _, phase in self.histograms})
+
+    def merged(self, api, phase=None):
+        h = LatencyHistogram()
+        for (a, p), hist in self.histograms.items():
+            if a == api and (phase is None or p == phase):
+                h.merge(hist)
+        return h
+
+
+def _fmt(v):
+    return "-" if v is None else f"{v:.2f}"
+
+
+def _speedup(uncached, cached):
+    if uncached is None or not cached:
+        return "-"
+    return f"{uncached / cached:.1f}x"
+
+
+def print_comparison(title, uncached, cached):
+    print(f"\n== {title}")
+    print(f"{'':<10}{'uncached_ms':>14}{'cached_ms':>14}{'speedup':>10}")
+    print(f"{'count':<10}{uncached.count:>14}{cached.count:>14}")
+    rows = [("mean", uncached.mean(), cached.mean())]
+    rows += [(f"p{p:g}", uncached.percentile(p), cached.percentile(p))
+             for p in GlobalArgs.PERCENTILES]
+    rows.append(("max", uncached.max_us, cached.max_us))
+    for name, u, c in rows:
+        u_ms = None if u is None else u / 1000.0
+        c_ms = None if c is None else c / 1000.0
+        print(f"{name:<10}{_fmt(u_ms):>14}{_fmt(c_ms):>14}{_speedup(u_ms, c_ms):>10}")
+
+
+def print_histogram(api, hist, width=50):
+    """ Power of two millisecond bins """
+    bins = {}
+    for low, _, count in hist.buckets():
+        ms = low / 1000.0
+        upper = 1
+        while upper <= ms:
+            upper *= 2
+        bins[upper] = bins.get(upper, 0) + count
+    if not bins:
+        return
+    top = max(bins.values())
+    print(f"\n== {api} latency histogram")
+    for upper in sorted(bins):
+        bar = "#" * max(int(width * bins[upper] / top), 1)
+        print(f"{'< ' + str(upper) + 'ms':>10} {bins[upper]:>10} {bar}")
+
+
+def main(args):
+    report = LatencyReport(args.phase_size)
+    for path in args.log_files:
+        if not os.path.exists(path):
+            print(f"Skipping missing log file: {path}", file=sys.stderr)
+            continue
+        for block in _blocks(path, args.block_size):
+            report.add_block(block)
+
+    if args.json:
+        res = {}
+        for api in report.apis():
+            res[api] = {"all": report.merged(api).summary(GlobalArgs.PERCENTILES)}
+            for phase in report.phases():
+                res[api][f"phase_{phase}"] = report.merged(
+                    api, phase).summary(GlobalArgs.PERCENTILES)
+        print(json.dumps(res, indent=2))
+        return
+
+    print_comparison("all phases", report.merged("uncached"), report.merged("cached"))
+    if len(report.phases()) > 1:
+        for phase in report.phases():
+            print_comparison(
+                f"phase {phase}",
+                report.merged("uncached", phase),
+                report.merged("cached", phase)
+            )
+    if args.histogram:
+        for api in report.apis():
+            print_histogram(api, report.merged(api))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Cached vs uncached latency report from the load generator logs")
+    parser.add_argument("log_files", nargs="*", default=GlobalArgs.LOG_FILES)
+    parser.add_argument("--phase-size", type=int, default=GlobalArgs.PHASE_SIZE,
+                        help="Requests per phase, for logs without a phase field")
+    parser.add_argument("--block-size", type=int, default=GlobalArgs.BLOCK_SIZE)
+    parser.add_argument("--histogram", action="store_true",
+                        help="Also print a latency histogram per API")
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Open-loop load generator for the cached & uncached movie APIs
+
+Requests are issued on a fixed schedule (constant or poisson arrivals) whether
+or not earlier requests have completed, so a slow API can not slow the test
+down and hide its own latency (coordinated omission). Both APIs are driven
+concurrently, each over its own pool of keep-alive connections.
+
+Ids are drawn uniformly, as the earlier bash script did, or from the key
+distributions, rate shapes and route mix of a `--scenario` file, see
+`workload_model.py`. Both APIs get the same seeded schedule of requests.
+
+Every request appends a JSON line to the log files used by the earlier bash
+script, `{"uncached_latency": "0.123456", ...}`, with the time to first byte
+in seconds. Latency measured from the _scheduled_ start of the request is
+recorded alongside as `corrected_latency`, and the `X-Served-By` and
+`X-Generated-At` of the response, for `staleness_analyzer.py`, and its size,
+for `capacity_planner.py`.
+
+Usage:
+    pip3 install aiohttp
+    python3 load_generator.py \\
+        --uncached-url "${UNCACHED_API_URL}" \\
+        --cached-url "${CACHED_API_URL}" \\
+        --phase 1000:60 --phase 2000:60
+    python3 load_generator.py --scenario scenarios/match_day.json --seed 7 ...
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    sys.exit("aiohttp is required, pip3 install aiohttp")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from latency_histogram import LatencyHistogram  # noqa: E402
+from staleness_analyzer import FreshnessTracker  # noqa: E402
+from workload_model import Workload  # noqa: E402
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    VERSION = "2020_08_17"
+    UNCACHED_API_LOG = "/var/log/miztiik-load-generator-uncached.log"
+    CACHED_API_LOG = "/var/log/miztiik-load-generator-cached.log"
+    UNCACHED_API_URL = os.getenv("UNCACHED_API_URL", "")
+    CACHED_API_URL = os.getenv("CACHED_API_URL", "")
+    # Same as the bash script: 2000 requests each at 0.1s..0.5s apart
+    DEFAULT_PHASES = ["10:200", "5:400", "3.33:600", "2.5:800", "2:1000"]
+    PHASE_GAP_SECS = 35
+    MAX_MOVIE_ID = 10
+    LOG_FLUSH_LINES = 1000
+
+
+class Target:
+    """ Helper to hold the per API state of a test run """
+
+    def __init__(self, name, url, log_file, run_label=None):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.log_file = log_file
+        self.run_label = run_label
+        self.latency = LatencyHistogram()
+        self.corrected_latency = LatencyHistogram()
+        self.freshness = FreshnessTracker()
+        self.status_counts = {}
+        self.errors = 0
+        self.dropped = 0
+        self.in_flight = 0
+        self._lines = []
+        self._fh = open(log_file, mode="a", encoding="utf-8") if log_file else None
+
+    def log(self, rec):
+        if self._fh is None:
+            return
+        self._lines.append(json.dumps(rec))
+        if len(self._lines) >= GlobalArgs.LOG_FLUSH_LINES:
+            self.flush()
+
+    def flush(self):
+        if self._fh is not None and self._lines:
+            self._fh.write("\n".join(self._lines) + "\n")
+            self._fh.flush()
+            self._lines = []
+
+    def close(self):
+        self.flush()
+        if self._fh is not None:
+            self._fh.close()
+
+    def report(self):
+        return {
+            "target": self.name,
+            "url": self.url,
+            "latency": self.latency.summary(),
+            "corrected_latency": self.corrected_latency.summary(),
+            "hit_ratio": self.freshness.hit_ratio(),
+            "staleness": self.freshness.staleness.summary(),
+            "status_counts": self.status_counts,
+            "errors": self.errors,
+            "dropped": self.dropped,
+        }
+
+
+def parse_phase(spec):
+    """ `RPS:SECONDS` into a tuple of floats """
+    try:
+        rps, secs = spec.split(":")
+        return float(rps), float(secs)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"phase must be RPS:SECONDS, got {spec}")
+
+
+async def _send(session, target, req, scheduled_at, timeout):
+    target.in_flight += 1
+    start = time.perf_counter()
+    sent_at = time.time()
+    status = None
+    served_by = generated_at = None
+    size = 0
+    try:
+        async with session.get(f"{target.url}{req.path()}", timeout=timeout) as resp:
+            # Time to first byte, like curl's time_starttransfer
+            ttfb = time.perf_counter() - start
+            status = resp.status
+            served_by = resp.headers.get("X-Served-By")
+            generated_at = resp.headers.get("X-Generated-At")
+            size = len(await resp.read())
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        ttfb = time.perf_counter() - start
+        target.errors += 1
+    finally:
+        target.in_flight -= 1
+    corrected = time.perf_counter() - scheduled_at
+    target.status_counts[str(status)] = target.status_counts.get(str(status), 0) + 1
+    target.latency.record(ttfb * 1e6)
+    target.corrected_latency.record(corrected * 1e6)
+    received_at = sent_at + ttfb
+    target.freshness.record(
+        sent_at, received_at, ttfb, float(generated_at) if generated_at else None, served_by or "")
+    target.log({
+        f"{target.name}_latency": f"{ttfb:.6f}",
+        "corrected_latency": f"{corrected:.6f}",
+        "status": status,
+        "id": ",".join(req.ids),
+        "route": req.route,
+        "phase": req.phase,
+        "sent_at": f"{sent_at:.6f}",
+        "received_at": f"{received_at:.6f}",
+        "generated_at": generated_at,
+        "served_by": served_by,
+        "bytes": size,
+        "run": target.run_label,
+    })
+
+
+async def drive(target, workload, seed, args):
+    connector = aiohttp.TCPConnector(
+        limit=args.connections,
+        keepalive_timeout=args.keepalive_secs,
+        ttl_dns_cache=300,
+    )
+    timeout = aiohttp.ClientTimeout(total=args.timeout_secs)
+    tasks = set()
+    async with aiohttp.ClientSession(connector=connector) as session:
+        test_start = time.perf_counter()
+        for req in workload.requests(seed):
+            scheduled_at = test_start + req.offset
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if target.in_flight >= args.max_in_flight:
+                # The API can not keep up, count it rather than queue unbounded work
+                target.dropped += 1
+                continue
+            t = asyncio.ensure_future(
+                _send(session, target, req, scheduled_at, timeout))
+            tasks.add(t)
+            t.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    target.close()
+
+
+async def main(args):
+    if args.scenario:
+        workload = Workload.from_file(args.scenario)
+    else:
+        workload = Workload.uniform(
+            args.phase or [parse_phase(p) for p in GlobalArgs.DEFAULT_PHASES],
+            GlobalArgs.MAX_MOVIE_ID,
+            poisson=args.poisson,
+            gap_secs=args.phase_gap_secs
+        )
+    # The same schedule for both APIs, logged so the run can be repeated
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    targets = []
+    if args.uncached_url:
+        targets.append(Target("uncached", args.uncached_url,
+                              None if args.no_log else args.uncached_log, args.run_label))
+    if args.cached_url:
+        targets.append(Target("cached", args.cached_url,
+                              None if args.no_log else args.cached_log, args.run_label))
+    if not targets:
+        sys.exit("Provide --uncached-url and/or --cached-url")
+    await asyncio.gather(*(drive(t, workload, seed, args) for t in targets))
+    report = [dict(t.report(), workload=workload.name, seed=seed) for t in targets]
+    print(json.dumps(report, indent=2))
+    if args.histogram_out:
+        with open(args.histogram_out, mode="w", encoding="utf-8") as f:
+            json.dump({
+                t.name: {
+                    "latency": t.latency.to_dict(),
+                    "corrected_latency": t.corrected_latency.to_dict(),
+                } for t in targets
+            }, f)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Open-loop load generator for the cached & uncached movie APIs")
+    parser.add_argument("--uncached-url", default=GlobalArgs.UNCACHED_API_URL)
+    parser.add_argument("--cached-url", default=GlobalArgs.CACHED_API_URL)
+    parser.add_argument("--uncached-log", default=GlobalArgs.UNCACHED_API_LOG)
+    parser.add_argument("--cached-log", default=GlobalArgs.CACHED_API_LOG)
+    parser.add_argument("--no-log", action="store_true",
+                        help="Do not write per request JSON lines")
+    parser.add_argument("--phase", action="append", type=parse_phase,
+                        help="RPS:SECONDS, repeat for more phases. Defaults to the bash script's phases")
+    parser.add_argument("--phase-gap-secs", type=float,
+                        default=GlobalArgs.PHASE_GAP_SECS)
+    parser.add_argument("--poisson", action="store_true",
+                        help="Poisson arrivals instead of evenly spaced requests")
+    parser.add_argument("--scenario",
+                        help="Workload scenario JSON file, replaces --phase, --phase-gap-secs & --poisson")
+    parser.add_argument("--connections", type=int, default=256,
+                        help="Keep-alive connection pool size, per API")
+    parser.add_argument("--keepalive-secs", type=float, default=60)
+    parser.add_argument("--max-in-flight", type=int, default=10000)
+    parser.add_argument("--timeout-secs", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--run-label",
+                        help="Logged with every request, e.g. ttl=300, staleness_analyzer.py reports each apart")
+    parser.add_argument("--histogram-out",
+                        help="Write the raw histograms as JSON to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    asyncio.run(main(parse_args()))
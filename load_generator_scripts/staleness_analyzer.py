@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Observed cache hit ratio and staleness from the load generator logs
+
+The greeter sends `X-Served-By`, its version & container, and `X-Generated-At`,
+the epoch of the `ts` in the body. A stage cache hit replays both from the
+cached response, so the client can tell, per request:
+  - whether it was a hit: the same `(X-Served-By, X-Generated-At)` was seen
+    before, or the body was generated before the request was sent
+  - how stale it was: the time between the body being generated and the
+    response being received
+
+Each log, or each `--run-label` in it, is one setting, e.g. one stage cache
+TTL. For each it prints the hit ratio, the staleness percentiles and the
+latency of hits and of misses, overall and by how stale the responses were,
+the latency vs freshness trade-off of that TTL.
+
+Usage:
+    python3 load_generator.py --scenario scenarios/match_day.json --seed 7 \\
+        --run-label ttl=60 --cached-log ttl_60.log ...
+    python3 staleness_analyzer.py ttl_60.log ttl_300.log
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from latency_histogram import LatencyHistogram  # noqa: E402
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    # Clocks of the client and the lambda disagree by a few ms, even with NTP
+    CLOCK_SKEW_SECS = 0.05
+    # Upper bounds, in seconds, of the staleness buckets
+    STALENESS_BUCKETS = (0.1, 1, 10, 60, 300, 3600, float("inf"))
+    PERCENTILES = (50, 90, 99)
+
+
+class FreshnessTracker:
+    """ Helper to classify responses as cache hits or misses, and keep their staleness """
+
+    def __init__(self, skew_secs=GlobalArgs.CLOCK_SKEW_SECS, buckets=GlobalArgs.STALENESS_BUCKETS):
+        self.skew_secs = skew_secs
+        self.buckets = buckets
+        self.hits = 0
+        self.misses = 0
+        self.unknown = 0
+        self.staleness = LatencyHistogram()
+        self.hit_latency = LatencyHistogram()
+        self.miss_latency = LatencyHistogram()
+        self.latency_by_staleness = [LatencyHistogram() for _ in buckets]
+        # Bodies already seen, a hit for sure when seen again
+        self._seen = set()
+
+    def record(self, sent_at, received_at, latency_secs, generated_at, served_by=""):
+        """ Returns `(hit, staleness_secs)`, `None` for responses without the headers """
+        if generated_at is None:
+            self.unknown += 1
+            return None
+        body = (served_by, generated_at)
+        hit = body in self._seen or generated_at < sent_at - self.skew_secs
+        self._seen.add(body)
+        staleness = max(received_at - generated_at, 0.0)
+        if hit:
+            self.hits += 1
+            self.hit_latency.record(latency_secs * 1e6)
+        else:
+            self.misses += 1
+            self.miss_latency.record(latency_secs * 1e6)
+        self.staleness.record(staleness * 1e6)
+        idx = next(i for i, upper in enumerate(self.buckets) if staleness < upper)
+        self.latency_by_staleness[idx].record(latency_secs * 1e6)
+        return hit, staleness
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return round(self.hits / total, 4) if total else None
+
+    def summary(self, percentiles=GlobalArgs.PERCENTILES):
+        return {
+            "hit_ratio": self.hit_ratio(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "without_headers": self.unknown,
+            "staleness": self.staleness.summary(percentiles),
+            "hit_latency": self.hit_latency.summary(percentiles),
+            "miss_latency": self.miss_latency.summary(percentiles),
+            "latency_by_staleness": {
+                f"<{upper:g}s": h.summary(percentiles)
+                for upper, h in zip(self.buckets, self.latency_by_staleness) if h.count
+            },
+        }
+
+
+def _float(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def read_log(path, trackers, skew_secs):
+    """ Feeds every line of a load generator log to the tracker of its `(run, api)` """
+    default_run = os.path.basename(path)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            api = next((k[:-len("_latency")] for k in rec if k.endswith("_latency") and k != "corrected_latency"), None)
+            sent_at = _float(rec.get("sent_at"))
+            if api is None or sent_at is None:
+                # Written by the bash script or an older load generator
+                continue
+            key = (rec.get("run") or default_run, api)
+            if key not in trackers:
+                trackers[key] = FreshnessTracker(skew_secs)
+            latency = _float(rec[f"{api}_latency"])
+            trackers[key].record(
+                sent_at,
+                _float(rec.get("received_at")) or sent_at + latency,
+                latency,
+                _float(rec.get("generated_at")),
+                rec.get("served_by") or ""
+            )
+
+
+def _ms(summary, key):
+    val = summary.get(key)
+    return "-" if val is None else f"{val:.1f}"
+
+
+def print_report(run, api, tracker):
+    s = tracker.summary()
+    print(f"\n== {run} / {api}: hit ratio {s['hit_ratio']}, "
+          f"{s['hits']} hits, {s['misses']} misses, {s['without_headers']} without headers")
+    print(f"{'':<14}{'count':>8}{'p50_ms':>12}{'p90_ms':>12}{'p99_ms':>12}{'max_ms':>12}")
+    rows = [("staleness", s["staleness"]), ("hit latency", s["hit_latency"]), ("miss latency", s["miss_latency"])]
+    rows += [(f"lat {k} old", v) for k, v in s["latency_by_staleness"].items()]
+    for name, r in rows:
+        print(f"{name:<14}{r['count']:>8}{_ms(r, 'p50_ms'):>12}{_ms(r, 'p90_ms'):>12}"
+              f"{_ms(r, 'p99_ms'):>12}{_ms(r, 'max_ms'):>12}")
+
+
+def main(args):
+    trackers = {}
+    for path in args.log_files:
+        if not os.path.exists(path):
+            print(f"Skipping missing log file: {path}", file=sys.stderr)
+            continue
+        read_log(path, trackers, args.clock_skew_secs)
+    if args.json:
+        print(json.dumps({f"{run}/{api}": t.summary() for (run, api), t in sorted(trackers.items())}, indent=2))
+        return
+    for (run, api), tracker in sorted(trackers.items()):
+        print_report(run, api, tracker)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Observed cache hit ratio and staleness from the load generator logs")
+    parser.add_argument("log_files", nargs="+")
+    parser.add_argument("--clock-skew-secs", type=float, default=GlobalArgs.CLOCK_SKEW_SECS,
+                        help="Bodies generated this long before the request was sent are still misses")
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
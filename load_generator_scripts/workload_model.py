@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Workload model of the load tests: which ids are asked for, over which route, and when
+
+A scenario is a JSON file of phases, each with a rate shape, a key distribution
+and a mix of routes. The same scenario and seed always give the same schedule
+of requests, so runs against the cached and uncached apis, or before and after
+a change, see the same traffic.
+
+    {
+      "name": "match_day",
+      "arrivals": "poisson",
+      "keys": {"distribution": "zipf", "count": 10, "s": 1.2},
+      "routes": {"by_id": 0.9, "random": 0.05, "batch": 0.05},
+      "batch_size": 5,
+      "phases": [
+        {"shape": "ramp", "rps": 10, "to_rps": 200, "secs": 120},
+        {"shape": "burst", "rps": 200, "secs": 120, "peak_rps": 2000,
+         "at_secs": 30, "burst_secs": 20,
+         "burst_keys": {"distribution": "hotspot", "count": 10, "hot_keys": 1, "hot_share": 0.9}},
+        {"shape": "diurnal", "rps": 20, "peak_rps": 200, "period_secs": 600, "secs": 1200,
+         "gap_secs": 30}
+      ]
+    }
+
+Key distributions, ids are `offset .. offset + count - 1`, the most popular first:
+  - `uniform`
+  - `zipf`, the id of rank `k` is asked for in proportion to `1 / k^s`
+  - `hotspot`, `hot_share` of the requests go to the first `hot_keys` ids
+
+Rate shapes: `constant`, `ramp` (`rps` to `to_rps`), `diurnal` (a sine between
+`rps` and `peak_rps` of `period_secs`) and `burst` (`rps`, with `peak_rps` for
+`burst_secs` from `at_secs`, when `burst_keys` replace the phase keys, the
+flash crowd all asking for the same match). A phase may override `keys`,
+`routes`, `batch_size` and `arrivals`, and waits `gap_secs` before it starts.
+
+Usage:
+    python3 workload_model.py scenarios/match_day.json --seed 7 --cache-ttl-secs 300
+    python3 workload_model.py scenarios/match_day.json --seed 7 --out schedule.jsonl
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import math
+import random
+import sys
+
+
+class GlobalArgs:
+    """ Global statics """
+    OWNER = "Mystique"
+    ROUTES = ["by_id", "random", "batch"]
+    # Only `/movie/{id}` is cached at the stage, `random` & `batch` share the uncached `/movie`
+    CACHEABLE_ROUTES = ["by_id"]
+    SHAPES = ["constant", "ramp", "diurnal", "burst"]
+    DISTRIBUTIONS = ["uniform", "zipf", "hotspot"]
+
+
+class KeyDistribution:
+    """ Draws ids, `rank(0)` is the most popular """
+
+    def __init__(self, distribution="uniform", count=11, offset=0, s=1.0, hot_keys=1, hot_share=0.9):
+        if distribution not in GlobalArgs.DISTRIBUTIONS:
+            raise ValueError(f"Unknown key distribution: {distribution}")
+        if count < 1:
+            raise ValueError("A key distribution needs at least one key")
+        self.distribution = distribution
+        self.count = int(count)
+        self.offset = int(offset)
+        self.hot_keys = min(max(int(hot_keys), 1), self.count)
+        self.hot_share = float(hot_share)
+        self._cum = None
+        if distribution == "zipf":
+            self._cum = list(itertools.accumulate(1.0 / (k + 1) ** s for k in range(self.count)))
+
+    @classmethod
+    def from_dict(cls, conf):
+        return cls(**conf)
+
+    def rank(self, rnd):
+        if self.distribution == "zipf":
+            return min(bisect.bisect_left(self._cum, rnd.random() * self._cum[-1]), self.count - 1)
+        if self.distribution == "hotspot" and (self.hot_keys == self.count or rnd.random() < self.hot_share):
+            return rnd.randrange(self.hot_keys)
+        if self.distribution == "hotspot":
+            return rnd.randrange(self.hot_keys, self.count)
+        return rnd.randrange(self.count)
+
+    def draw(self, rnd):
+        return str(self.offset + self.rank(rnd))
+
+
+class Phase:
+    """ Rate shape, keys and routes of one stretch of the test """
+
+    def __init__(self, conf, defaults):
+        conf = dict(defaults, **conf)
+        self.shape = conf.get("shape", "constant")
+        if self.shape not in GlobalArgs.SHAPES:
+            raise ValueError(f"Unknown rate shape: {self.shape}")
+        self.rps = float(conf["rps"])
+        self.secs = float(conf["secs"])
+        self.gap_secs = float(conf.get("gap_secs", 0))
+        self.to_rps = float(conf.get("to_rps", self.rps))
+        self.peak_rps = float(conf.get("peak_rps", self.rps))
+        self.period_secs = float(conf.get("period_secs", self.secs))
+        self.at_secs = float(conf.get("at_secs", 0))
+        self.burst_secs = float(conf.get("burst_secs", 0))
+        self.arrivals = conf.get("arrivals", "constant")
+        self.keys = KeyDistribution.from_dict(conf.get("keys", {}))
+        self.burst_keys = KeyDistribution.from_dict(conf["burst_keys"]) if "burst_keys" in conf else None
+        self.batch_size = int(conf.get("batch_size", 5))
+        routes = conf.get("routes", {"by_id": 1.0})
+        unknown = set(routes) - set(GlobalArgs.ROUTES)
+        if unknown:
+            raise ValueError(f"Unknown routes: {sorted(unknown)}")
+        self._routes = [r for r in GlobalArgs.ROUTES if routes.get(r, 0) > 0]
+        self._route_cum = list(itertools.accumulate(routes[r] for r in self._routes))
+        if self.max_rate() <= 0 or self.secs <= 0 or not self._routes:
+            raise ValueError("A phase needs a positive rate, `secs` and route weight")
+
+    def in_burst(self, t):
+        return self.shape == "burst" and self.at_secs <= t < self.at_secs + self.burst_secs
+
+    def rate(self, t):
+        """ Requests per second `t` seconds into the phase """
+        if self.shape == "ramp":
+            return self.rps + (self.to_rps - self.rps) * t / self.secs
+        if self.shape == "diurnal":
+            # Starts at the trough, peaks half a period in
+            return self.rps + (self.peak_rps - self.rps) * (1 - math.cos(2 * math.pi * t / self.period_secs)) / 2
+        if self.in_burst(t):
+            return self.peak_rps
+        return self.rps
+
+    def max_rate(self):
+        return max(self.rps, self.to_rps, self.peak_rps if self.shape in ("diurnal", "burst") else 0)
+
+    def offsets(self, rnd):
+        """
+        Scheduled start of every request, in seconds from the start of the phase. Poisson
+        arrivals of a varying rate are thinned from those of the peak rate.
+        """
+        t = 0.0
+        if self.arrivals == "poisson":
+            peak = self.max_rate()
+            while True:
+                t += rnd.expovariate(peak)
+                if t >= self.secs:
+                    return
+                if rnd.random() * peak < self.rate(t):
+                    yield t
+        else:
+            while True:
+                rate = self.rate(t)
+                # A ramp from 0 would never start
+                t += 1.0 / rate if rate > 0 else 1.0 / self.max_rate()
+                if t >= self.secs:
+                    return
+                if rate > 0:
+                    yield t
+
+    def route(self, rnd):
+        if len(self._routes) == 1:
+            return self._routes[0]
+        return self._routes[bisect.bisect_left(self._route_cum, rnd.random() * self._route_cum[-1])]
+
+
+class Request:
+    """ One scheduled request """
+
+    __slots__ = ("offset", "phase", "route", "ids")
+
+    def __init__(self, offset, phase, route, ids):
+        self.offset = offset
+        self.phase = phase
+        self.route = route
+        self.ids = ids
+
+    def path(self):
+        """ Relative to the `/movie` resource of the api """
+        if self.route == "by_id":
+            return f"/{self.ids[0]}"
+        if self.route == "batch":
+            return "?ids=" + ",".join(self.ids)
+        return ""
+
+    def to_dict(self):
+        return {"offset": round(self.offset, 6), "phase": self.phase, "route": self.route, "ids": self.ids}
+
+
+class Workload:
+    """ Phases of a scenario, and the seeded schedule of requests they make """
+
+    def __init__(self, phases, name="workload"):
+        if not phases:
+            raise ValueError("A workload needs at least one phase")
+        self.name = name
+        self.phases = phases
+
+    @classmethod
+    def from_dict(cls, conf):
+        defaults = {k: v for k, v in conf.items() if k not in ("name", "description", "phases")}
+        return cls([Phase(p, defaults) for p in conf["phases"]], name=conf.get("name", "workload"))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def uniform(cls, phases, max_id, poisson=False, gap_secs=0):
+        """ `(rps, secs)` phases, every id in `0..max_id` equally likely, as the bash script did """
+        return cls([
+            Phase({
+                "rps": rps,
+                "secs": secs,
+                "gap_secs": gap_secs if idx else 0,
+                "arrivals": "poisson" if poisson else "constant",
+                "keys": {"count": max_id + 1},
+            }, {}) for idx, (rps, secs) in enumerate(phases)
+        ], name="uniform")
+
+    def duration_secs(self):
+        return sum(p.gap_secs + p.secs for p in self.phases)
+
+    def requests(self, seed=None):
+        """
+        Yields every `Request`, by `offset` from the start of the test. Arrivals and keys are
+        drawn from separate streams, so changing the arrivals of a scenario keeps its keys.
+        """
+        arrivals_rnd = random.Random(None if seed is None else f"{seed}:arrivals")
+        keys_rnd = random.Random(None if seed is None else f"{seed}:keys")
+        start = 0.0
+        for idx, phase in enumerate(self.phases):
+            start += phase.gap_secs
+            for t in phase.offsets(arrivals_rnd):
+                keys = phase.burst_keys if phase.burst_keys is not None and phase.in_burst(t) else phase.keys
+                route = phase.route(keys_rnd)
+                if route == "by_id":
+                    ids = [keys.draw(keys_rnd)]
+                elif route == "batch":
+                    ids = [keys.draw(keys_rnd) for _ in range(phase.batch_size)]
+                else:
+                    ids = []
+                yield Request(start + t, idx, route, ids)
+            start += phase.secs
+
+
+def ttl_hit_ratio(requests, ttl_secs):
+    """
+    Hit ratio of an ideal stage cache of `ttl_secs`, keyed by path: the first request of a
+    path fills it, requests within the TTL of the fill are hits. Only `by_id` requests are
+    cached, the ratio is of those.
+    """
+    filled = {}
+    hits = cacheable = 0
+    for r in requests:
+        if r.route not in GlobalArgs.CACHEABLE_ROUTES:
+            continue
+        cacheable += 1
+        path = r.path()
+        at = filled.get(path)
+        if at is not None and r.offset - at < ttl_secs:
+            hits += 1
+        else:
+            filled[path] = r.offset
+    return hits / cacheable if cacheable else 0.0
+
+
+def summarize(requests, cache_ttl_secs=None, top=5):
+    requests = list(requests)
+    phases = {}
+    routes = {}
+    ids = {}
+    for r in requests:
+        phases[r.phase] = phases.get(r.phase, 0) + 1
+        routes[r.route] = routes.get(r.route, 0) + 1
+        for i in r.ids:
+            ids[i] = ids.get(i, 0) + 1
+    total_ids = sum(ids.values())
+    res = {
+        "requests": len(requests),
+        "duration_secs": round(requests[-1].offset, 3) if requests else 0,
+        "requests_per_phase": phases,
+        "routes": routes,
+        "distinct_ids": len(ids),
+        "top_ids": [
+            {"id": i, "share": round(n / total_ids, 4)}
+            for i, n in sorted(ids.items(), key=lambda kv: -kv[1])[:top]
+        ],
+    }
+    if cache_ttl_secs is not None:
+        res["ideal_cache_hit_ratio"] = round(ttl_hit_ratio(requests, cache_ttl_secs), 4)
+    return res
+
+
+def main(args):
+    workload = Workload.from_file(args.scenario)
+    if args.out:
+        with open(args.out, mode="w", encoding="utf-8") as f:
+            for r in workload.requests(args.seed):
+                f.write(json.dumps(r.to_dict()) + "\n")
+    print(json.dumps(dict(
+        {"scenario": workload.name, "seed": args.seed},
+        **summarize(workload.requests(args.seed), args.cache_ttl_secs, args.top)
+    ), indent=2))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Seeded request schedule of a load test scenario")
+    parser.add_argument("scenario", help="Scenario JSON file")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", help="Write the schedule as JSON lines to this file")
+    parser.add_argument("--cache-ttl-secs", type=float, default=None,
+                        help="Report the hit ratio of an ideal stage cache of this TTL")
+    parser.add_argument("--top", type=int, default=5, help="Most requested ids to report")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        main(parse_args())
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Bad scenario: {e}")
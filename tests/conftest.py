@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+# The lambda modules import each other by their module names, as the lambda runtime does
+GREETER_SRC = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "api_performance_with_caching", "stacks", "back_end", "lambda_src")
+sys.path.insert(0, GREETER_SRC)
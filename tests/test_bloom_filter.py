@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import importlib.util
+import os
+
+from bloom_filter import BloomFilter
+
+LOADER_BLOOM_FILTER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..",
+    "data_loader_stacks", "custom_resources", "ddb_data_loader", "lambda_src", "bloom_filter.py")
+
+
+def _loader_bloom_filter():
+    spec = importlib.util.spec_from_file_location("loader_bloom_filter", LOADER_BLOOM_FILTER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.BloomFilter
+
+
+def test_loader_writes_the_greeter_format():
+    loader_filter = _loader_bloom_filter().for_capacity(1000, 0.01)
+    greeter_filter = BloomFilter.for_capacity(1000, 0.01)
+    for key in map(str, range(500)):
+        loader_filter.add(key)
+        greeter_filter.add(key)
+    assert loader_filter.to_bytes() == greeter_filter.to_bytes()
+    loaded = BloomFilter.from_bytes(loader_filter.to_bytes())
+    assert all(str(k) in loaded for k in range(500))
+
+
+def test_duplicate_keys_are_not_counted():
+    f = BloomFilter.for_capacity(1000, 0.01)
+    assert f.add("1")
+    assert not f.add("1")
+    assert f.count == 1
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import gzip
+import json
+
+import pytest
+
+from content_negotiation import JSON
+from content_negotiation import MSGPACK
+from content_negotiation import ContentNegotiator
+from content_negotiation import Representation
+from content_negotiation import packb
+from response_body import BodyEncoder
+
+VALUES = [
+    None, True, False, 0, 1, 0x7f, 0x80, 0xff, 0x100, 2 ** 32, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1,
+    -1, -0x20, -0x21, -0x81, -2 ** 31, -2 ** 63, 0.5, -1e300,
+    "", "a", "x" * 0x1f, "x" * 0x20, "x" * 0xff, "x" * 0x100, "x" * 0x10000, "Été – 1/2 \"cut\"",
+    [], list(range(15)), list(range(16)), list(range(0x10000)),
+    {}, {str(i): i for i in range(15)}, {str(i): i for i in range(16)}, {str(i): None for i in range(0x10000)},
+    {"id": "7", "title": "Rush", "rating": 8.3, "votes": 2 ** 63, "tags": ["a", {"b": [None]}]},
+]
+
+
+@pytest.mark.parametrize("val", VALUES, ids=lambda v: repr(v)[:24])
+def test_packb_round_trips_through_msgpack(val):
+    msgpack = pytest.importorskip("msgpack")
+    assert msgpack.unpackb(packb(val), raw=False, strict_map_key=False) == val
+
+
+def test_packb_rejects_what_json_has_not():
+    with pytest.raises(TypeError):
+        packb(b"bytes")
+
+
+def _negotiator():
+    return ContentNegotiator(BodyEncoder(), enabled=True, min_bytes=0)
+
+
+@pytest.mark.parametrize("key", [None, ("etag", "movie")])
+def test_gzip_decompresses_to_head_and_tail(key):
+    negotiator = _negotiator()
+    head = json.dumps({"movie": {"title": "Rush " * 300}}).encode("utf-8")
+    for tail in (b"", b"2020-10-18 10:00:00.042000\"}", bytes(range(256))):
+        # The deflated head is kept for the key, the tail changes with every response
+        assert gzip.decompress(negotiator._gzip(key, head, tail)) == head + tail
+
+
+def test_render_gzip_json_body():
+    negotiator = _negotiator()
+    encoded, etag = negotiator.encoder.encode(("t", "1"), {"id": {"S": "1"}, "title": {"S": "Rush"}})
+    ts = "2020-10-18 10:00:00.042000"
+    body, headers, is_base64 = negotiator.render(Representation(JSON, "gzip"), "movie", encoded, etag, ts)
+    assert is_base64 and headers == {"Content-Type": JSON, "Content-Encoding": "gzip"}
+    assert gzip.decompress(base64.b64decode(body)).decode("utf-8") == negotiator.encoder.body("movie", encoded, ts)
+
+
+def test_render_gzip_msgpack_body():
+    msgpack = pytest.importorskip("msgpack")
+    negotiator = _negotiator()
+    movies = [{"id": "1", "votes": 2 ** 63}, None]
+    encoded, etag = json.dumps(movies), '"e"'
+    ts = "2020-10-18 10:00:00.042000"
+    for _ in range(2):
+        body, headers, _ = negotiator.render(Representation(MSGPACK, "gzip"), "movies", encoded, etag, ts)
+        assert msgpack.unpackb(gzip.decompress(base64.b64decode(body)), raw=False) == {
+            "message": BodyEncoder.MESSAGE, "movies": movies, "ts": ts}
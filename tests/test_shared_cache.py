@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import threading
+
+import pytest
+
+from shared_cache import CircuitBreaker
+from shared_cache import RespClient
+from shared_cache import RespError
+from shared_cache import SharedCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def redis_server():
+    """ `(host, port)` of an in-process fakeredis server """
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def test_resp_client_round_trips_with_redis(redis_server):
+    redis = pytest.importorskip("redis")
+    host, port = redis_server
+    client = RespClient(host, port, timeout_secs=2)
+    ref = redis.Redis(host=host, port=port)
+    value = "Été \r\n $3 *1".encode("utf-8") + bytes(range(256))
+
+    assert client.execute("SET", "a", value, "EX", 60) == "OK"
+    assert ref.get("a") == value
+    ref.set("b", 2 ** 63)
+    replies = client.pipeline([["MGET", "a", "b", "missing"], ["INCR", "n"], ["DEL", "a"], ["GET", "a"]])
+    assert replies == [[value, str(2 ** 63).encode(), None], 1, 1, None]
+    assert client.execute("LRANGE", "missing", 0, -1) == []
+
+    # An error reply is returned in place, fakeredis drops the connection after it
+    replies = client.pipeline([["EXISTS", "b"], ["INCR", "b"]])
+    assert replies[0] == 1 and isinstance(replies[1], RespError)
+    with pytest.raises(RespError):
+        RespClient(host, port, timeout_secs=2).execute("INCR", "b")
+
+
+def test_resp_client_reconnects_after_a_failure(redis_server):
+    host, port = redis_server
+    client = RespClient(host, port, timeout_secs=2)
+    assert client.execute("PING") == "PONG"
+    client._sock.shutdown(socket.SHUT_RDWR)
+    with pytest.raises(OSError):
+        client.execute("PING")
+    assert client.execute("PING") == "PONG"
+
+
+def test_shared_cache_against_redis(redis_server):
+    host, port = redis_server
+    cache = SharedCache(RespClient(host, port, timeout_secs=2), ttl_secs=60, negative_ttl_secs=60)
+    loads = []
+
+    def loader(keys):
+        loads.append(keys)
+        return {k: {"id": {"S": k[1]}} for k in keys if k[1] != "5"}
+
+    keys = [("t", "1"), ("t", "5")]
+    assert cache.get_many(keys, loader) == {("t", "1"): {"id": {"S": "1"}}, ("t", "5"): None}
+    assert cache.get_many(keys, loader) == {("t", "1"): {"id": {"S": "1"}}, ("t", "5"): None}
+    assert loads == [keys]
+    assert cache.stats.total["hit"] == 1 and cache.stats.total["negative_hit"] == 1
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_secs=30, clock=Clock())
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.opened_count == 1
+
+
+def test_breaker_half_open_lets_one_trial_through():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_secs=30, clock=clock)
+    breaker.record_failure()
+    clock.now = 29.9
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now = 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    # Until the trial reports back, everyone else bypasses
+    assert breaker.state == "open" and not breaker.allow()
+
+    # A failed trial opens it for another `reset_secs`
+    breaker.record_failure()
+    clock.now = 59.9
+    assert not breaker.allow()
+    clock.now = 60
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+    assert breaker.opened_count == 1
+
+
+def test_shared_cache_bypasses_while_the_breaker_is_open():
+    clock = Clock()
+    cache = SharedCache(RespClient("127.0.0.1", 1, timeout_secs=0.05), ttl_secs=60,
+                        breaker=CircuitBreaker(failure_threshold=1, reset_secs=30, clock=clock))
+    loader = lambda keys: {k: "loaded" for k in keys}  # noqa: E731
+    assert cache.get(("t", "1"), lambda: "loaded") == "loaded"
+    assert cache.stats.total["error"] >= 1 and cache.breaker.state == "open"
+    errors = cache.stats.total["error"]
+    assert cache.get_many([("t", "1")], loader) == {("t", "1"): "loaded"}
+    assert cache.stats.total["error"] == errors and cache.stats.total["bypass"] >= 2